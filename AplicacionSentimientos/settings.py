@@ -131,4 +131,66 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
-LOGIN_URL = '/'
\ No newline at end of file
+LOGIN_URL = '/'
+
+# Análisis de sentimientos
+# Cantidad de mensajes por cada pasada del modelo en la inferencia en bloque
+EMOTION_BATCH_SIZE = 256
+# Backend de inferencia: 'numpy' (sin TensorFlow, usa modelo_emociones.npz) o 'keras' (referencia)
+EMOTION_INFERENCE_BACKEND = 'numpy'
+# Registro de versiones del modelo (manifest.json + un directorio por versión). Si no
+# existe, se usan los artefactos de AppIA/. Ver 'python manage.py model_registry --help'
+EMOTION_MODEL_REGISTRY_DIR = BASE_DIR / 'AppIA' / 'model_registry'
+# Cada cuántos segundos se revisa si cambió la versión activa para recargarla en segundo plano (0 lo desactiva)
+EMOTION_MODEL_RELOAD_INTERVAL = 30
+# Cargar y precalentar el modelo al arrancar: True o False (también con la variable de entorno
+# EMOTION_PRELOAD_MODEL=1/0), o None para hacerlo solo en gunicorn, uwsgi, uvicorn, daphne, runserver y
+# run_analysis_jobs; cualquier otro programa (migrate, shell, test, scripts...) lo carga al usarlo.
+# Con gunicorn --preload se carga una vez en el proceso maestro y los workers lo comparten.
+EMOTION_PRELOAD_MODEL = None
+# Abrir con mmap los pesos y el vocabulario en formato .npy (compartidos entre procesos);
+# se generan con 'python manage.py export_mmap_artifacts'
+EMOTION_MMAP_ARTIFACTS = True
+# Agrupar los textos por longitud y rellenar cada lote solo hasta su texto más largo (backend numpy)
+EMOTION_LENGTH_BUCKETING = True
+# Ignorar tildes al buscar palabras clave ('aléjate' = 'alejate', 'íntimas' = 'intimas'). Opcional:
+# cambia el resultado de las reglas (y RULES_VERSION) en los mensajes que mezclan ambas formas
+EMOTION_KEYWORDS_NORMALIZE_ACCENTS = False
+# Ruta rápida: no llamar al modelo si una regla decide el resultado sin importar su salida
+EMOTION_FAST_PATH = True
+# Tamaño máximo de la caché LRU de predicciones por proceso (0 la desactiva)
+EMOTION_PREDICTION_CACHE_SIZE = 10000
+# Métricas por etapa de la inferencia (tokenizar, modelo, reglas); ver /management/metrics/inferencia/
+EMOTION_METRICS_ENABLED = False
+# Despachador de micro-lotes: junta en una sola pasada del modelo los textos de las clasificaciones
+# concurrentes del proceso (vistas, análisis al escribir, análisis general); máximo de textos por pasada
+# y espera máxima desde la primera petición
+EMOTION_USE_DISPATCHER = False
+EMOTION_DISPATCHER_MAX_BATCH = 64
+EMOTION_DISPATCHER_MAX_WAIT_MS = 5
+# Señalar al enviar (de forma síncrona, sin el modelo) los mensajes con amenazas críticas
+EMOTION_CRITICAL_LANE = True
+# Análisis al escribir: clasificar cada mensaje nuevo en segundo plano al confirmarse su envío,
+# en micro-lotes de hasta MAX_BATCH mensajes o MAX_WAIT_MS milisegundos
+EMOTION_ANALYZE_ON_WRITE = True
+EMOTION_LIVE_ANALYSIS_MAX_BATCH = 64
+EMOTION_LIVE_ANALYSIS_MAX_WAIT_MS = 50
+# Análisis general en paralelo: procesos de clasificación y mensajes por cada parte
+EMOTION_ANALYSIS_WORKERS = 1
+EMOTION_ANALYSIS_SHARD_SIZE = 5000
+# Mensajes que se leen de la base de datos, clasifican y guardan juntos (una transacción por parte)
+EMOTION_ANALYSIS_CHUNK_SIZE = 2000
+# Filas de MessageAnalysis por cada INSERT/UPDATE en bloque dentro de cada parte
+EMOTION_ANALYSIS_WRITE_BATCH_SIZE = 1000
+# Ejecutar el análisis general como trabajo en segundo plano (requiere tener en marcha
+# 'python manage.py run_analysis_jobs'); con False se ejecuta dentro de la petición
+EMOTION_ANALYSIS_BACKGROUND = False
+# Segundos que un trabajo puede seguir pendiente antes de avisar que ningún proceso de trabajos lo tomó
+EMOTION_ANALYSIS_UNCLAIMED_WARNING_SECONDS = 30
+# Segundos sin señales tras los que otro proceso retoma un trabajo en curso desde su última parte guardada
+EMOTION_ANALYSIS_JOB_STALE_SECONDS = 300
+# Repartir cada análisis general en rangos de EMOTION_ANALYSIS_SHARD_SIZE mensajes que toman todos los
+# procesos 'run_analysis_jobs' conectados a la misma base de datos (en una o varias máquinas)
+EMOTION_ANALYSIS_DISTRIBUTED = False
+# Segundos de arriendo de un rango; se renueva con cada parte guardada y, si vence, otro proceso lo retoma
+EMOTION_ANALYSIS_LEASE_SECONDS = 120
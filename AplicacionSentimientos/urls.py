@@ -34,6 +34,7 @@ urlpatterns = [
     path('management/analytics/', views.analytics, name='analytics'),
     path('management/analytics/export-pdf/', views.export_analytics_pdf, name='export_analytics_pdf'),
     path('management/conversation/<int:report_id>/export-pdf/', views.export_conversation_pdf, name='export_conversation_pdf'),
+    path('management/metrics/inferencia/', views.inference_metrics, name='inference_metrics'),
     
     # URLs compartidas para análisis (usadas tanto por admin como management)
     path('analysis/conversation/<int:conversation_id>/generate/', 
@@ -48,6 +49,9 @@ urlpatterns = [
          views.generate_general_analysis, 
          name='generate_general_analysis'),
 
+    path('analysis/jobs/<int:job_id>/', views.analysis_job_detail, name='analysis_job_detail'),
+    path('analysis/jobs/<int:job_id>/progress/', views.analysis_job_progress, name='analysis_job_progress'),
+
     # URLs de Usuario
     path('user_home/', views.user_home, name='user_home'),
     path('user_chat/', views.chat_list, name='chat'),
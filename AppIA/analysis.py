@@ -0,0 +1,522 @@
+# AppIA/analysis.py
+"""
+Pipeline de clasificación de mensajes usado por las vistas de análisis.
+
+Antes de pasar por el modelo, cada texto se busca en StoredPrediction por
+hash de (versión de modelo y reglas, texto normalizado), así que los textos
+repetidos entre conversaciones y entre ejecuciones se clasifican una sola vez.
+
+El análisis de todo el corpus recorre los mensajes en partes de tamaño fijo
+paginadas por ID (id > último id visto) y solo lee `id` y `content`, así que la
+memoria usada no crece con la cantidad de mensajes.
+
+En modo incremental solo se clasifican los mensajes sin MessageAnalysis o cuyo
+análisis es de otra versión de modelo y reglas; los demás se cuentan con su
+etiqueta guardada, en la ruta 'omitido'.
+"""
+import hashlib
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.db import DatabaseError, IntegrityError, connection, connections, reset_queries, transaction
+from django.db.models import Count, Max
+
+from . import ml
+from .models import ConversationAnalysisReport, Message, MessageAnalysis, StoredPrediction
+from .parallel_analysis import analyze_id_range, init_worker
+
+# SQL Server admite como máximo 2100 parámetros por consulta
+STORE_LOOKUP_CHUNK = 1000
+
+# Mensajes que se leen, clasifican y guardan juntos (una transacción) al recorrer el corpus
+DEFAULT_ANALYSIS_CHUNK_SIZE = 2000
+
+# Filas por cada INSERT/UPDATE en bloque de MessageAnalysis (Django lo reduce
+# si el motor no admite tantos parámetros por consulta)
+DEFAULT_ANALYSIS_WRITE_BATCH_SIZE = 1000
+
+# Campos que se reemplazan al volver a analizar un mensaje
+MESSAGE_ANALYSIS_UPDATE_FIELDS = ['emotion_label', 'confidence', 'model_version']
+
+# Campo de ConversationAnalysisReport donde se cuenta cada etiqueta
+LABEL_COUNT_FIELDS = {
+    'Neutral': 'neutral_count',
+    'Positivo': 'positive_count',
+    'Acoso/Violencia': 'harassment_count',
+    'Extorsión': 'extortion_count',
+}
+
+
+class AnalysisError(Exception):
+    """El modelo o el tokenizador no están disponibles para clasificar."""
+
+
+def current_prediction_version(bundle=None):
+    """
+    Versión combinada de modelo y reglas con la que se guardan las predicciones
+    (del bundle indicado o del activo).
+    """
+    model_version = bundle.version if bundle is not None else ml.MODEL_VERSION
+    return f"{model_version}:{ml.RULES_VERSION}"
+
+
+def prediction_hash(normalized_text, version):
+    """Hash de contenido que identifica una predicción en StoredPrediction."""
+    return hashlib.sha256(f"{version}\0{normalized_text}".encode('utf-8')).hexdigest()
+
+
+def lookup_stored_predictions(hashes):
+    """Devuelve {hash: (etiqueta, confianza)} para los hashes ya almacenados."""
+    hashes = list(hashes)
+    found = {}
+    for start in range(0, len(hashes), STORE_LOOKUP_CHUNK):
+        rows = StoredPrediction.objects.filter(
+            content_hash__in=hashes[start:start + STORE_LOOKUP_CHUNK]
+        ).values_list('content_hash', 'emotion_label', 'confidence')
+        for content_hash, label, confidence in rows:
+            found[content_hash] = (label, confidence)
+    return found
+
+
+def save_stored_predictions(predictions):
+    """
+    Inserta predicciones nuevas en bloque. Si otro proceso guardó el mismo
+    hash al mismo tiempo, el conflicto se ignora (el valor es el mismo).
+    """
+    if connection.features.supports_ignore_conflicts:
+        StoredPrediction.objects.bulk_create(predictions, batch_size=STORE_LOOKUP_CHUNK, ignore_conflicts=True)
+        return
+
+    try:
+        with transaction.atomic():
+            StoredPrediction.objects.bulk_create(predictions, batch_size=STORE_LOOKUP_CHUNK)
+    except IntegrityError:
+        # Sin soporte de ignore_conflicts (p. ej. SQL Server): insertar solo los que faltan
+        existing = lookup_stored_predictions(prediction.content_hash for prediction in predictions)
+        StoredPrediction.objects.bulk_create(
+            [prediction for prediction in predictions if prediction.content_hash not in existing],
+            batch_size=STORE_LOOKUP_CHUNK
+        )
+
+
+def classify_texts(texts, batch_size=None, bundle=None):
+    """
+    Clasifica textos consultando primero el almacén persistente y enviando al
+    modelo solo los que faltan, que luego se guardan para futuras ejecuciones.
+
+    Devuelve una lista de diccionarios {'etiqueta', 'confianza', 'regla', 'ruta'}
+    en el mismo orden (con 'ruta' = 'almacen' y 'regla' = None para los
+    resultados ya guardados, que no guardan la regla) o un mensaje de error,
+    igual que predict_emotion_batch. Todos los textos se clasifican con el
+    mismo bundle (por defecto, el activo al empezar).
+    """
+    texts = list(texts)
+    if bundle is None:
+        ml.check_model_version()
+        bundle = ml.get_model_bundle()
+    if bundle is None:
+        return "Error en la carga del modelo o tokenizador."
+    version = current_prediction_version(bundle)
+
+    # Un hash por texto distinto (tras normalizar)
+    positions = {}
+    for index, text in enumerate(texts):
+        content_hash = prediction_hash(ml.normalize_cache_text(text), version)
+        positions.setdefault(content_hash, []).append(index)
+
+    stored = lookup_stored_predictions(positions)
+
+    results = [None] * len(texts)
+    for content_hash, (label, confidence) in stored.items():
+        for index in positions[content_hash]:
+            results[index] = {'etiqueta': label, 'confianza': confidence, 'regla': None, 'ruta': 'almacen'}
+
+    missing = [content_hash for content_hash in positions if content_hash not in stored]
+    if not missing:
+        return results
+
+    predictions = ml.predict_emotion_batch(
+        [texts[positions[content_hash][0]] for content_hash in missing],
+        batch_size=batch_size,
+        bundle=bundle
+    )
+    if isinstance(predictions, str):
+        return predictions
+
+    save_stored_predictions([
+        StoredPrediction(
+            content_hash=content_hash,
+            model_version=version,
+            emotion_label=prediction['etiqueta'],
+            confidence=prediction['confianza'],
+        )
+        for content_hash, prediction in zip(missing, predictions)
+    ])
+
+    for content_hash, prediction in zip(missing, predictions):
+        for index in positions[content_hash]:
+            results[index] = dict(prediction)
+
+    return results
+
+
+def classify_messages(messages, batch_size=None, bundle=None):
+    """Clasifica una lista de Message por su contenido (ver classify_texts)."""
+    return classify_texts([message.content for message in messages], batch_size=batch_size, bundle=bundle)
+
+
+def new_analysis_data():
+    return {
+        'total_messages': 0, 'neutral_count': 0, 'positive_count': 0,
+        'harassment_count': 0, 'extortion_count': 0
+    }
+
+
+def merge_analysis_data(target, other):
+    """Suma los conteos de `other` en `target` (sin porcentajes)."""
+    for key in new_analysis_data():
+        target[key] += other[key]
+    return target
+
+
+def add_percentages(analysis_data):
+    total = analysis_data['total_messages']
+    if total > 0:
+        analysis_data['neutral_percentage'] = (analysis_data['neutral_count'] / total) * 100
+        analysis_data['positive_percentage'] = (analysis_data['positive_count'] / total) * 100
+        analysis_data['harassment_percentage'] = (analysis_data['harassment_count'] / total) * 100
+        analysis_data['extortion_percentage'] = (analysis_data['extortion_count'] / total) * 100
+    return analysis_data
+
+
+def save_message_analyses(analyses, batch_size=None):
+    """
+    Inserta o actualiza en bloque los MessageAnalysis de una parte, en una sola
+    transacción: un INSERT ... ON CONFLICT por lote donde el motor lo admite y,
+    si no (p. ej. SQL Server), una consulta para saber cuáles ya existen seguida
+    de un UPDATE y un INSERT en bloque.
+    """
+    if batch_size is None:
+        batch_size = ml._get_setting('EMOTION_ANALYSIS_WRITE_BATCH_SIZE', DEFAULT_ANALYSIS_WRITE_BATCH_SIZE)
+    # Un solo análisis por mensaje (gana el último)
+    analyses = list({analysis.message_id: analysis for analysis in analyses}.values())
+
+    with transaction.atomic():
+        if connection.features.supports_update_conflicts_with_target:
+            MessageAnalysis.objects.bulk_create(
+                analyses,
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=['message'],
+                update_fields=MESSAGE_ANALYSIS_UPDATE_FIELDS
+            )
+            return
+
+        message_ids = [analysis.message_id for analysis in analyses]
+        existing = {}
+        for start in range(0, len(message_ids), STORE_LOOKUP_CHUNK):
+            existing.update(MessageAnalysis.objects.filter(
+                message_id__in=message_ids[start:start + STORE_LOOKUP_CHUNK]
+            ).values_list('message_id', 'id'))
+
+        updated = []
+        created = []
+        for analysis in analyses:
+            if analysis.message_id in existing:
+                analysis.pk = existing[analysis.message_id]
+                updated.append(analysis)
+            else:
+                created.append(analysis)
+        MessageAnalysis.objects.bulk_update(updated, MESSAGE_ANALYSIS_UPDATE_FIELDS, batch_size=batch_size)
+        MessageAnalysis.objects.bulk_create(created, batch_size=batch_size)
+
+
+def iter_message_chunks(queryset=None, chunk_size=None, after_id=None, fields=('id', 'content')):
+    """
+    Recorre los mensajes de `queryset` (por defecto todos) en listas de hasta
+    `chunk_size` tuplas (id, contenido), o de los campos `fields` (el primero
+    debe ser 'id'), en orden de ID y empezando después de `after_id` si se
+    indica. Cada parte es una consulta `id > último id` sobre la clave
+    primaria, sin OFFSET ni caché del queryset, así que solo hay una parte en
+    memoria a la vez.
+    """
+    if queryset is None:
+        queryset = Message.objects.all()
+    if chunk_size is None:
+        chunk_size = ml._get_setting('EMOTION_ANALYSIS_CHUNK_SIZE', DEFAULT_ANALYSIS_CHUNK_SIZE)
+    queryset = queryset.order_by('id').values_list(*fields)
+
+    last_id = after_id
+    while True:
+        page = queryset if last_id is None else queryset.filter(id__gt=last_id)
+        rows = list(page[:chunk_size])
+        if not rows:
+            return
+        # Con DEBUG, Django guarda cada consulta ejecutada; se descartan para
+        # que el registro no crezca con el corpus
+        reset_queries()
+        yield rows
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1][0]
+
+
+def analysis_bundle():
+    """Bundle activo para un análisis; lanza AnalysisError si no se pudo cargar."""
+    ml.check_model_version()
+    bundle = ml.get_model_bundle()
+    if bundle is None:
+        raise AnalysisError("Error en la carga del modelo o tokenizador.")
+    return bundle
+
+
+def analyze_message_rows(rows, batch_size=None, bundle=None):
+    """
+    Clasifica tuplas (id, contenido), guarda en bloque el MessageAnalysis de
+    cada mensaje (ver save_message_analyses) y devuelve (analysis_data, rutas): los conteos por categoría (sin
+    porcentajes) y cuántos resultados salieron de cada ruta ('almacen',
+    'cache', 'reglas', 'modelo'). Cada MessageAnalysis registra la versión de
+    modelo y reglas que lo produjo.
+
+    Si no se puede guardar la parte lanza AnalysisError, para que la
+    transacción que la contiene se revierta en lugar de darla por analizada.
+    """
+    analysis_data = new_analysis_data()
+    routes = Counter()
+
+    if bundle is None:
+        bundle = analysis_bundle()
+    version = current_prediction_version(bundle)
+
+    results = classify_texts([content for _, content in rows], batch_size=batch_size, bundle=bundle)
+    if isinstance(results, str):
+        raise AnalysisError(results)
+
+    try:
+        save_message_analyses([
+            MessageAnalysis(
+                message_id=message_id,
+                emotion_label=result['etiqueta'],
+                confidence=result['confianza'],
+                model_version=version
+            )
+            for (message_id, _), result in zip(rows, results)
+        ])
+    except DatabaseError as e:
+        raise AnalysisError(
+            f"Error guardando el análisis de los mensajes {rows[0][0]} a {rows[-1][0]}: {e}"
+        ) from e
+
+    # Contar por categorías
+    for result in results:
+        analysis_data['total_messages'] += 1
+        label_field = LABEL_COUNT_FIELDS.get(result['etiqueta'])
+        if label_field:
+            analysis_data[label_field] += 1
+        routes[result['ruta']] += 1
+
+    return analysis_data, routes
+
+
+def analyze_messages(messages, batch_size=None):
+    """Clasifica y guarda una lista de Message (ver analyze_message_rows)."""
+    return analyze_message_rows([(message.id, message.content) for message in messages], batch_size=batch_size)
+
+
+def aggregate_analysis_counts(queryset=None, version=None):
+    """
+    Conteos por categoría de los MessageAnalysis ya guardados de los mensajes
+    de `queryset` (por defecto todos) con un solo GROUP BY sobre la etiqueta,
+    sin cargar los análisis ni ejecutar el modelo. Con `version` solo cuentan
+    los análisis de esa versión.
+    """
+    if queryset is None:
+        queryset = Message.objects.all()
+    if version is None:
+        queryset = queryset.filter(analysis__isnull=False)
+    else:
+        queryset = queryset.filter(analysis__model_version=version)
+
+    analysis_data = new_analysis_data()
+    counts = queryset.order_by().values_list('analysis__emotion_label').annotate(count=Count('id'))
+    for label, count in counts:
+        analysis_data['total_messages'] += count
+        label_field = LABEL_COUNT_FIELDS.get(label)
+        if label_field:
+            analysis_data[label_field] += count
+    return analysis_data
+
+
+def count_current_analyses(queryset, version):
+    """Conteos de los mensajes de `queryset` ya analizados con la versión `version`."""
+    return aggregate_analysis_counts(queryset, version=version)
+
+
+def report_analysis_data(queryset=None):
+    """
+    Estadísticas de un reporte (conteos y porcentajes) a partir de los
+    análisis guardados de `queryset`; ver aggregate_analysis_counts.
+    """
+    return add_percentages(aggregate_analysis_counts(queryset))
+
+
+def create_conversation_report(conversation, created_by, rebuild=False, report_only=False):
+    """
+    Clasifica lo pendiente de `conversation` y crea su ConversationAnalysisReport
+    con los conteos de los análisis guardados (ver aggregate_analysis_counts).
+    Devuelve (reporte, rutas, reporte previo del que partió o None).
+
+    Por defecto parte del último reporte de la conversación hecho con la
+    versión actual: solo clasifica y cuenta los mensajes posteriores a su
+    `last_message_id` y les suma sus conteos, así que el costo depende solo de
+    los mensajes nuevos. Con `rebuild` reclasifica y cuenta toda la conversación;
+    con `report_only` solo cuenta lo ya guardado, sin ejecutar el modelo.
+    """
+    queryset = conversation.messages.all()
+    # Los mensajes enviados mientras se genera el reporte quedan para el siguiente
+    last_message_id = queryset.aggregate(last_id=Max('id'))['last_id']
+    if last_message_id is not None:
+        queryset = queryset.filter(id__lte=last_message_id)
+
+    routes = Counter()
+    previous = None
+    version = ''
+    if not report_only:
+        version = current_prediction_version(analysis_bundle())
+        if not rebuild:
+            previous = (
+                conversation.analysis_reports
+                .filter(model_version=version, last_message_id__isnull=False)
+                .order_by('-last_message_id', '-id')
+                .first()
+            )
+        if previous is not None:
+            queryset = queryset.filter(id__gt=previous.last_message_id)
+        _, routes = analyze_queryset(queryset, incremental=not rebuild)
+
+    analysis_data = aggregate_analysis_counts(queryset)
+    if previous is not None:
+        merge_analysis_data(analysis_data, {key: getattr(previous, key) for key in new_analysis_data()})
+    add_percentages(analysis_data)
+
+    report = ConversationAnalysisReport.objects.create(
+        conversation=conversation,
+        created_by=created_by,
+        last_message_id=last_message_id,
+        model_version=version,
+        **analysis_data
+    )
+    return report, routes, previous
+
+
+def analyze_queryset(queryset=None, chunk_size=None, batch_size=None, incremental=False):
+    """
+    Analiza los mensajes de `queryset` (por defecto todos) por partes de
+    EMOTION_ANALYSIS_CHUNK_SIZE mensajes: cada parte se clasifica en bloque,
+    se guarda y se libera antes de leer la siguiente. Todas las partes usan el
+    bundle activo al empezar. Devuelve (analysis_data, rutas).
+
+    Con `incremental` los mensajes ya analizados con la versión actual no se
+    vuelven a clasificar: se cuentan con su etiqueta guardada y en
+    rutas['omitido']. Cada parte trae el mensaje junto con la versión y la
+    etiqueta de su análisis en la misma fila, así que cada mensaje se omite o
+    se clasifica, nunca las dos cosas ni ninguna, aunque otro proceso guarde
+    análisis mientras tanto.
+    """
+    if queryset is None:
+        queryset = Message.objects.all()
+    bundle = analysis_bundle()
+    analysis_data = new_analysis_data()
+    routes = Counter()
+
+    if not incremental:
+        for rows in iter_message_chunks(queryset, chunk_size):
+            chunk_data, chunk_routes = analyze_message_rows(rows, batch_size=batch_size, bundle=bundle)
+            merge_analysis_data(analysis_data, chunk_data)
+            routes.update(chunk_routes)
+        return analysis_data, routes
+
+    version = current_prediction_version(bundle)
+    fields = ('id', 'content', 'analysis__model_version', 'analysis__emotion_label')
+    for rows in iter_message_chunks(queryset, chunk_size, fields=fields):
+        pending = []
+        for message_id, content, analysis_version, label in rows:
+            if analysis_version != version:
+                # Sin análisis o con uno de otra versión
+                pending.append((message_id, content))
+                continue
+            analysis_data['total_messages'] += 1
+            label_field = LABEL_COUNT_FIELDS.get(label)
+            if label_field:
+                analysis_data[label_field] += 1
+            routes['omitido'] += 1
+
+        if pending:
+            chunk_data, chunk_routes = analyze_message_rows(pending, batch_size=batch_size, bundle=bundle)
+            merge_analysis_data(analysis_data, chunk_data)
+            routes.update(chunk_routes)
+
+    return analysis_data, routes
+
+
+def iter_id_ranges(shard_size):
+    """
+    Genera rangos (primer id, último id) que cubren todos los mensajes con
+    `shard_size` mensajes cada uno. Cada rango cuesta una consulta de una
+    sola fila, sin leer la lista completa de IDs.
+    """
+    ids = Message.objects.order_by('id').values_list('id', flat=True)
+    first_id = ids.first()
+    while first_id is not None:
+        last_id = next(iter(ids.filter(id__gte=first_id)[shard_size - 1:shard_size]), None)
+        if last_id is None:
+            yield first_id, ids.last()
+            return
+        yield first_id, last_id
+        first_id = ids.filter(id__gt=last_id).first()
+
+
+def analyze_corpus(workers=None, shard_size=None, incremental=False):
+    """
+    Analiza todos los mensajes recorriéndolos por partes (ver analyze_queryset).
+    Con más de un proceso (EMOTION_ANALYSIS_WORKERS) reparte rangos contiguos
+    de IDs de EMOTION_ANALYSIS_SHARD_SIZE mensajes entre procesos que cargan el
+    modelo una vez y recorren su rango de la misma forma; este proceso solo
+    suma los conteos. Con `incremental` solo se clasifican los mensajes nuevos
+    o analizados con otra versión. Devuelve (analysis_data, rutas).
+    """
+    if workers is None:
+        workers = ml._get_setting('EMOTION_ANALYSIS_WORKERS', 1)
+    if shard_size is None:
+        shard_size = ml._get_setting('EMOTION_ANALYSIS_SHARD_SIZE', 5000)
+
+    if workers <= 1:
+        # En un solo proceso el corpus se recorre por partes, sin dividirlo
+        return analyze_queryset(incremental=incremental)
+
+    # Solo se guardan los extremos de cada rango, no la lista de IDs
+    id_ranges = list(iter_id_ranges(shard_size))
+    analysis_data = new_analysis_data()
+    routes = Counter()
+
+    analyze_range = partial(analyze_id_range, incremental=incremental)
+    if len(id_ranges) <= 1:
+        shard_results = map(analyze_range, id_ranges)
+    else:
+        # Las conexiones abiertas no deben heredarse en los procesos hijos
+        connections.close_all()
+        pool = ProcessPoolExecutor(
+            max_workers=min(workers, len(id_ranges)),
+            initializer=init_worker,
+            initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'AplicacionSentimientos.settings'),)
+        )
+        with pool:
+            shard_results = list(pool.map(analyze_range, id_ranges))
+
+    for shard_data, shard_routes in shard_results:
+        merge_analysis_data(analysis_data, shard_data)
+        routes.update(shard_routes)
+
+    return analysis_data, routes
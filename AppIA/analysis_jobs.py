@@ -0,0 +1,408 @@
+# AppIA/analysis_jobs.py
+"""
+Análisis general en segundo plano sin broker externo.
+
+La vista crea un AnalysisJob y responde de inmediato; uno o más procesos
+'python manage.py run_analysis_jobs' toman los trabajos pendientes de la
+base de datos y los ejecutan. Cada parte de mensajes se guarda en la misma
+transacción que el avance del trabajo (último ID, conteos), así que si el
+proceso se cae, el trabajo se retoma desde la última parte confirmada cuando
+deja de dar señales durante EMOTION_ANALYSIS_JOB_STALE_SECONDS.
+
+Con EMOTION_ANALYSIS_DISTRIBUTED el trabajo se reparte además entre varios
+procesos o máquinas que comparten la base de datos: el primero que lo toma lo
+divide en rangos de IDs (AnalysisShard) y cada proceso toma rangos con un
+arriendo de EMOTION_ANALYSIS_LEASE_SECONDS que renueva con cada parte
+guardada. Un rango cuyo arriendo vence se retoma desde su última parte
+confirmada. El proceso que termina el último rango cierra el trabajo; si se
+cae antes de hacerlo, lo cierra el siguiente proceso que busque trabajo.
+"""
+import os
+import socket
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import ml
+from .analysis import (
+    aggregate_analysis_counts, analysis_bundle, analyze_message_rows, count_current_analyses, current_prediction_version,
+    iter_id_ranges, iter_message_chunks, merge_analysis_data, new_analysis_data
+)
+from .models import AnalysisJob, AnalysisShard, Message
+
+
+class JobLost(Exception):
+    """Otro proceso retomó el trabajo o el rango (este dejó de dar señales a tiempo)."""
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def submit_analysis_job(user, incremental=True, sharded=None):
+    """
+    Encola un análisis general y lo devuelve sin ejecutarlo. Con `sharded`
+    (por defecto EMOTION_ANALYSIS_DISTRIBUTED) se reparte por rangos de IDs.
+    """
+    if sharded is None:
+        sharded = ml._get_setting('EMOTION_ANALYSIS_DISTRIBUTED', False)
+    return AnalysisJob.objects.create(created_by=user, incremental=incremental, sharded=sharded)
+
+
+def claim_job(worker=None):
+    """
+    Toma el trabajo pendiente más antiguo, o uno en curso cuyo proceso dejó de
+    dar señales, y lo devuelve; None si no hay ninguno. La toma es un UPDATE
+    condicionado al estado leído, así que dos procesos nunca toman el mismo.
+    Un trabajo repartido ya dividido en rangos no se retoma aquí: sus rangos
+    tienen su propio arriendo (ver claim_shard).
+    """
+    worker = worker or worker_name()
+    now = timezone.now()
+    stale_before = now - timedelta(seconds=ml._get_setting('EMOTION_ANALYSIS_JOB_STALE_SECONDS', 300))
+    candidates = AnalysisJob.objects.filter(
+        Q(status=AnalysisJob.STATUS_PENDING) |
+        Q(status=AnalysisJob.STATUS_RUNNING, heartbeat_at__lt=stale_before, shard_count=0)
+    ).order_by('created_at', 'id')
+
+    for job in candidates[:10]:
+        claimed = AnalysisJob.objects.filter(
+            pk=job.pk, status=job.status, worker=job.worker, heartbeat_at=job.heartbeat_at
+        ).update(
+            status=AnalysisJob.STATUS_RUNNING, worker=worker, heartbeat_at=now,
+            started_at=now, processed_at_start=F('processed')
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+def _save_progress(job, **fields):
+    """Guarda el avance solo si este proceso sigue siendo el dueño del trabajo."""
+    fields['heartbeat_at'] = timezone.now()
+    if not AnalysisJob.objects.filter(pk=job.pk, worker=job.worker).update(**fields):
+        raise JobLost(f"El trabajo {job.pk} fue retomado por otro proceso.")
+    for name, value in fields.items():
+        setattr(job, name, value)
+
+
+def run_job(job, chunk_size=None, batch_size=None):
+    """
+    Ejecuta (o retoma) un trabajo ya tomado con claim_job. Cada parte de
+    mensajes y el avance del trabajo se confirman en una sola transacción.
+    """
+    if job.sharded:
+        return _run_sharded_job(job, chunk_size=chunk_size, batch_size=batch_size)
+
+    try:
+        bundle = analysis_bundle()
+        version = current_prediction_version(bundle)
+        queryset = Message.objects.all()
+
+        if job.last_message_id is None and job.processed == 0:
+            # Primera ejecución: contar lo que hay que clasificar
+            analysis_data = new_analysis_data()
+            if job.incremental:
+                analysis_data = count_current_analyses(queryset, version)
+            pending = queryset.exclude(analysis__model_version=version) if job.incremental else queryset
+            _save_progress(
+                job,
+                total=pending.count(),
+                skipped=analysis_data['total_messages'],
+                analysis_data=analysis_data,
+                routes={'omitido': analysis_data['total_messages']} if job.incremental else {},
+            )
+
+        if job.incremental:
+            queryset = queryset.exclude(analysis__model_version=version)
+
+        for rows in iter_message_chunks(queryset, chunk_size, after_id=job.last_message_id):
+            with transaction.atomic():
+                chunk_data, chunk_routes = analyze_message_rows(rows, batch_size=batch_size, bundle=bundle)
+                _save_progress(
+                    job,
+                    processed=job.processed + len(rows),
+                    last_message_id=rows[-1][0],
+                    analysis_data=merge_analysis_data(dict(job.analysis_data), chunk_data),
+                    routes=dict(Counter(job.routes) + chunk_routes),
+                )
+
+        # Las estadísticas finales salen de los análisis guardados, con un GROUP BY
+        _save_progress(
+            job, status=AnalysisJob.STATUS_DONE, analysis_data=aggregate_analysis_counts(), finished_at=timezone.now()
+        )
+    except JobLost as e:
+        print(e)
+    except Exception as e:
+        print(f"Error en el trabajo de análisis {job.pk}: {e}")
+        job.status, job.error = AnalysisJob.STATUS_FAILED, str(e)
+        AnalysisJob.objects.filter(pk=job.pk, worker=job.worker).update(
+            status=job.status, error=job.error, finished_at=timezone.now()
+        )
+    return job
+
+
+# --- Trabajos repartidos por rangos de IDs ---
+
+def _lease_expiry(now=None):
+    return (now or timezone.now()) + timedelta(seconds=ml._get_setting('EMOTION_ANALYSIS_LEASE_SECONDS', 120))
+
+
+def plan_shards(job, shard_size=None):
+    """
+    Divide un trabajo repartido ya tomado en rangos de EMOTION_ANALYSIS_SHARD_SIZE
+    mensajes y guarda los conteos iniciales, todo en una transacción. Los
+    mensajes enviados después quedan para el análisis al escribir o el
+    siguiente análisis incremental. Devuelve el número de rangos.
+    """
+    if shard_size is None:
+        shard_size = ml._get_setting('EMOTION_ANALYSIS_SHARD_SIZE', 5000)
+    version = current_prediction_version(analysis_bundle())
+    queryset = Message.objects.all()
+    analysis_data = count_current_analyses(queryset, version) if job.incremental else new_analysis_data()
+    pending = queryset.exclude(analysis__model_version=version) if job.incremental else queryset
+
+    with transaction.atomic():
+        shards = AnalysisShard.objects.bulk_create([
+            AnalysisShard(job=job, first_message_id=first_id, last_message_id=last_id,
+                          analysis_data=new_analysis_data())
+            for first_id, last_id in iter_id_ranges(shard_size)
+        ])
+        _save_progress(
+            job,
+            shard_count=len(shards),
+            total=pending.count(),
+            skipped=analysis_data['total_messages'],
+            analysis_data=analysis_data,
+            routes={'omitido': analysis_data['total_messages']} if job.incremental else {},
+        )
+        if not shards:
+            _save_progress(job, status=AnalysisJob.STATUS_DONE, finished_at=timezone.now())
+    return len(shards)
+
+
+def claim_shard(worker=None, job=None):
+    """
+    Toma un rango pendiente, o uno cuyo arriendo venció, de un trabajo en curso
+    (solo de `job` si se indica) y lo devuelve con su trabajo; None si no hay.
+    """
+    worker = worker or worker_name()
+    now = timezone.now()
+    candidates = AnalysisShard.objects.filter(
+        Q(status=AnalysisShard.STATUS_PENDING) |
+        Q(status=AnalysisShard.STATUS_RUNNING, lease_expires_at__lt=now),
+        job__status=AnalysisJob.STATUS_RUNNING,
+    ).order_by('job_id', 'first_message_id')
+    if job is not None:
+        candidates = candidates.filter(job=job)
+
+    for shard in candidates[:10]:
+        claimed = AnalysisShard.objects.filter(
+            pk=shard.pk, status=shard.status, worker=shard.worker, lease_expires_at=shard.lease_expires_at
+        ).update(status=AnalysisShard.STATUS_RUNNING, worker=worker, lease_expires_at=_lease_expiry(now))
+        if claimed:
+            return AnalysisShard.objects.select_related('job').get(pk=shard.pk)
+    return None
+
+
+def _save_shard_progress(shard, **fields):
+    """Guarda el avance del rango y renueva su arriendo si este proceso sigue siendo el dueño."""
+    fields['lease_expires_at'] = _lease_expiry()
+    if not AnalysisShard.objects.filter(pk=shard.pk, worker=shard.worker).update(**fields):
+        raise JobLost(f"El rango {shard.first_message_id}-{shard.last_message_id} fue retomado por otro proceso.")
+    for name, value in fields.items():
+        setattr(shard, name, value)
+
+
+def _finish_sharded_job(job):
+    """
+    Si ya no quedan rangos sin terminar, cierra el trabajo con las estadísticas
+    de los análisis guardados (un GROUP BY) y la suma de las rutas de cada
+    rango. Si dos procesos terminan a la vez, el UPDATE condicionado al estado
+    deja que solo uno lo cierre.
+    """
+    if job.shards.exclude(status=AnalysisShard.STATUS_DONE).exists():
+        return False
+    routes = Counter(AnalysisJob.objects.values_list('routes', flat=True).get(pk=job.pk))
+    for shard_routes in job.shards.values_list('routes', flat=True):
+        routes.update(shard_routes)
+
+    now = timezone.now()
+    return bool(AnalysisJob.objects.filter(pk=job.pk, status=AnalysisJob.STATUS_RUNNING).update(
+        status=AnalysisJob.STATUS_DONE, analysis_data=aggregate_analysis_counts(), routes=dict(routes),
+        heartbeat_at=now, finished_at=now
+    ))
+
+
+def close_finished_sharded_jobs():
+    """
+    Cierra los trabajos repartidos en curso cuyos rangos ya terminaron todos.
+    Normalmente los cierra el proceso que termina el último rango; esto cubre
+    el caso en que ese proceso se cae entre terminar el rango y cerrar el
+    trabajo. Devuelve cuántos cerró.
+    """
+    finished = AnalysisJob.objects.filter(status=AnalysisJob.STATUS_RUNNING, shard_count__gt=0).exclude(
+        shards__status__in=[AnalysisShard.STATUS_PENDING, AnalysisShard.STATUS_RUNNING]
+    )
+    return sum(_finish_sharded_job(job) for job in finished)
+
+
+def run_shard(shard, chunk_size=None, batch_size=None):
+    """
+    Ejecuta (o retoma) un rango tomado con claim_shard. Cada parte de mensajes,
+    el avance del rango con su arriendo renovado y el contador del trabajo se
+    confirman en una sola transacción, así que un rango retomado no cuenta dos
+    veces lo ya guardado. La parte debe tardar menos que el arriendo.
+    """
+    job = shard.job
+    try:
+        bundle = analysis_bundle()
+        version = current_prediction_version(bundle)
+        queryset = Message.objects.filter(id__gte=shard.first_message_id, id__lte=shard.last_message_id)
+        if job.incremental:
+            queryset = queryset.exclude(analysis__model_version=version)
+
+        for rows in iter_message_chunks(queryset, chunk_size, after_id=shard.checkpoint_id):
+            with transaction.atomic():
+                chunk_data, chunk_routes = analyze_message_rows(rows, batch_size=batch_size, bundle=bundle)
+                _save_shard_progress(
+                    shard,
+                    processed=shard.processed + len(rows),
+                    checkpoint_id=rows[-1][0],
+                    analysis_data=merge_analysis_data(dict(shard.analysis_data), chunk_data),
+                    routes=dict(Counter(shard.routes) + chunk_routes),
+                )
+                AnalysisJob.objects.filter(pk=job.pk).update(
+                    processed=F('processed') + len(rows), heartbeat_at=timezone.now()
+                )
+
+        _save_shard_progress(shard, status=AnalysisShard.STATUS_DONE)
+        _finish_sharded_job(job)
+    except JobLost as e:
+        print(e)
+    except Exception as e:
+        print(f"Error en el rango {shard.first_message_id}-{shard.last_message_id} del trabajo {job.pk}: {e}")
+        # Los demás procesos dejan de tomar rangos de un trabajo con error
+        AnalysisJob.objects.filter(pk=job.pk, status=AnalysisJob.STATUS_RUNNING).update(
+            status=AnalysisJob.STATUS_FAILED, error=str(e), finished_at=timezone.now()
+        )
+    return shard
+
+
+def _plan_sharded_job(job):
+    """Divide el trabajo si aún no se hizo. Devuelve False si no se pudo (el trabajo queda fallido o lo retomó otro)."""
+    try:
+        if not job.shard_count:
+            plan_shards(job)
+    except JobLost as e:
+        print(e)
+        return False
+    except Exception as e:
+        print(f"Error al dividir el trabajo de análisis {job.pk}: {e}")
+        job.status, job.error = AnalysisJob.STATUS_FAILED, str(e)
+        AnalysisJob.objects.filter(pk=job.pk, worker=job.worker).update(
+            status=job.status, error=job.error, finished_at=timezone.now()
+        )
+        return False
+    return True
+
+
+def _run_sharded_job(job, chunk_size=None, batch_size=None):
+    """Divide el trabajo si aún no se hizo y ejecuta rangos hasta que no quede ninguno libre."""
+    if not _plan_sharded_job(job):
+        return job
+
+    while True:
+        shard = claim_shard(job.worker, job=job)
+        if shard is None:
+            break
+        run_shard(shard, chunk_size=chunk_size, batch_size=batch_size)
+    job.refresh_from_db()
+    return job
+
+
+def sharded_work_in_progress():
+    """
+    Indica si algún trabajo repartido en curso todavía puede dejar rangos libres:
+    otro proceso lo está dividiendo o le quedan rangos sin terminar (cuyo
+    arriendo puede vencer).
+    """
+    return AnalysisJob.objects.filter(status=AnalysisJob.STATUS_RUNNING, sharded=True).filter(
+        Q(shard_count=0) |
+        Q(shards__status__in=[AnalysisShard.STATUS_PENDING, AnalysisShard.STATUS_RUNNING])
+    ).exists()
+
+
+def run_worker(poll_interval=2.0, once=False, chunk_size=None):
+    """
+    Bucle del proceso de trabajos: primero ayuda con los rangos libres de los
+    trabajos repartidos en curso y, si no hay, toma el siguiente trabajo. Un
+    trabajo repartido solo se divide aquí; sus rangos se toman en las vueltas
+    siguientes como los de cualquier otro. Con `once` termina cuando ya no
+    quedan pendientes ni trabajos repartidos que otro proceso esté dividiendo
+    o ejecutando. Devuelve cuántos trabajos y rangos ejecutó.
+    """
+    worker = worker_name()
+    executed = 0
+    while True:
+        shard = claim_shard(worker)
+        if shard is not None:
+            run_shard(shard, chunk_size=chunk_size)
+            executed += 1
+            continue
+        close_finished_sharded_jobs()
+        job = claim_job(worker)
+        if job is None:
+            if once and not sharded_work_in_progress():
+                return executed
+            time.sleep(poll_interval)
+            continue
+        if job.sharded:
+            _plan_sharded_job(job)
+        else:
+            run_job(job, chunk_size=chunk_size)
+        executed += 1
+
+
+def job_progress(job, now=None):
+    """
+    Avance de un trabajo para la API de progreso: procesados/total, ritmo de
+    la ejecución actual (mensajes por segundo), tiempo restante estimado y si
+    sigue sin que ningún proceso de trabajos lo tome.
+    """
+    now = now or timezone.now()
+    rate = None
+    eta_seconds = None
+    # Pendiente desde hace rato: probablemente no hay ningún 'run_analysis_jobs' en marcha
+    unclaimed_seconds = ml._get_setting('EMOTION_ANALYSIS_UNCLAIMED_WARNING_SECONDS', 30)
+    waiting_for_worker = (job.status == AnalysisJob.STATUS_PENDING
+                          and (now - job.created_at).total_seconds() > unclaimed_seconds)
+    if job.status == AnalysisJob.STATUS_RUNNING and job.started_at is not None:
+        elapsed = (now - job.started_at).total_seconds()
+        done_this_run = job.processed - job.processed_at_start
+        if elapsed > 0 and done_this_run > 0:
+            rate = done_this_run / elapsed
+            eta_seconds = max(job.total - job.processed, 0) / rate
+
+    return {
+        'id': job.pk,
+        'status': job.status,
+        'incremental': job.incremental,
+        'processed': job.processed,
+        'total': job.total,
+        'skipped': job.skipped,
+        'percent': job.processed / job.total * 100 if job.total
+        else (100.0 if job.status == AnalysisJob.STATUS_DONE else 0.0),
+        'rate_per_second': rate,
+        'eta_seconds': eta_seconds,
+        'routes': job.routes,
+        'error': job.error,
+        'waiting_for_worker': waiting_for_worker,
+        'shards': job.shard_count,
+        'shards_done': job.shards.filter(status=AnalysisShard.STATUS_DONE).count() if job.shard_count else 0,
+    }
@@ -1,6 +1,81 @@
+import gc
+import os
+import sys
+
 from django.apps import AppConfig
+from django.conf import settings
+
+# Comandos de manage.py que clasifican mensajes en cuanto arrancan; los demás
+# (migrate, makemigrations, shell, test...) cargan el modelo solo si lo usan
+PRELOAD_COMMANDS = {'runserver', 'run_analysis_jobs'}
+
+# Servidores WSGI/ASGI conocidos que importan la aplicación para atender peticiones
+SERVER_PROGRAMS = {'gunicorn', 'uwsgi', 'uvicorn', 'daphne'}
+
+# Formas de lanzar los comandos de Django (manage.py, django-admin, python -m django)
+MANAGEMENT_PROGRAMS = {'manage', 'django-admin', 'django'}
+
+
+def _program_name(argv):
+    """Nombre del programa sin extensión; con `python -m paquete`, el del paquete."""
+    if not argv:
+        return ''
+    program = os.path.basename(argv[0])
+    if program == '__main__.py':
+        program = os.path.basename(os.path.dirname(argv[0]))
+    return os.path.splitext(program)[0]
+
+
+def _env_flag(name):
+    """True/False según la variable de entorno `name` ('1', 'true', 'sí'...), o None si no está."""
+    value = os.environ.get(name, '').strip().lower()
+    if value in ('1', 'true', 'yes', 'si', 'sí'):
+        return True
+    if value in ('0', 'false', 'no'):
+        return False
+    return None
+
+
+def should_preload_model(argv=None):
+    """
+    Decide si el proceso carga el modelo al arrancar: EMOTION_PRELOAD_MODEL
+    (True/False) en settings.py o en el entorno o, si no se indica, solo en
+    los servidores conocidos (gunicorn, uwsgi...) y en los comandos de
+    PRELOAD_COMMANDS. Cualquier otro programa que importe Django (scripts,
+    celery, pytest...) carga el modelo al usarlo por primera vez.
+    """
+    preload = getattr(settings, 'EMOTION_PRELOAD_MODEL', None)
+    if preload is None:
+        preload = _env_flag('EMOTION_PRELOAD_MODEL')
+    if preload is not None:
+        return preload
+
+    argv = sys.argv if argv is None else argv
+    program = _program_name(argv)
+    if program in SERVER_PROGRAMS:
+        return True
+    if program not in MANAGEMENT_PROGRAMS or len(argv) < 2:
+        return False
+    command = argv[1]
+    if command not in PRELOAD_COMMANDS:
+        return False
+    if command == 'runserver':
+        # El autorecargador de runserver vigila archivos en un proceso padre
+        # que no atiende peticiones; solo carga el proceso hijo (RUN_MAIN)
+        return '--noreload' in argv or os.environ.get('RUN_MAIN') == 'true'
+    return True
 
 
 class AppiaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'AppIA'
+
+    def ready(self):
+        if should_preload_model():
+            from . import ml
+            if ml.load_model() is not None:
+                # Con gunicorn --preload el proceso maestro carga el modelo y
+                # luego se bifurca: mover los objetos ya creados a la generación
+                # permanente evita que el recolector de basura de cada worker
+                # los toque y rompa el copy-on-write de sus páginas
+                gc.freeze()
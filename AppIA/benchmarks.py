@@ -0,0 +1,335 @@
+# AppIA/benchmarks.py
+"""
+Mediciones de rendimiento de la inferencia que no necesitan base de datos.
+
+Los textos de prueba son sintéticos: mensajes de chat en español armados con
+frases comunes y, en una fracción de ellos, palabras clave de las reglas, o
+palabras del propio vocabulario del tokenizador. Todo funciona sin conexión.
+"""
+import os
+import platform
+import random
+import subprocess
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+import numpy as np
+
+from . import ml
+
+# Rangos de palabras por mensaje para cada perfil de longitud
+LENGTH_PROFILES = {
+    'corto': (1, 5),
+    'medio': (6, 20),
+    'largo': (21, 60),
+}
+
+# Fragmentos para armar mensajes de chat
+CHAT_PHRASES = [
+    'hola', 'buenos días', 'qué tal', 'cómo estás', 'ok', 'dale', 'jajaja', 'sí claro',
+    'nos vemos mañana', 'ya llegué', 'te aviso cuando salga', 'dónde estás',
+    'la reunión de hoy fue muy productiva', 'el informe se entregó a tiempo',
+    'mañana tengo examen de matemáticas', 'me pasas la tarea por favor',
+    'vamos al cine el sábado', 'está lloviendo mucho aquí', 'ya comí gracias',
+    'el equipo trabajó bien', 'no encuentro las llaves', 'llámame cuando puedas',
+    'me siento muy feliz con los resultados', 'qué bueno verte', 'felicidades por tu trabajo',
+    'no me escribas más', 'me siento intimidado', 'déjame en paz',
+]
+FILLER_WORDS = ['pues', 'oye', 'bueno', 'entonces', 'también', 'porque', 'y', 'pero', 'que', 'la', 'el', 'de']
+
+
+def _keyword_phrases():
+    return (ml.STRONG_POSITIVE_KEYWORDS + ml.MILD_POSITIVE_KEYWORDS + ml.CRITICAL_VIOLENCE_KEYWORDS
+            + ml.MODERATE_VIOLENCE_KEYWORDS + ml.CRITICAL_EXTORTION_KEYWORDS + ml.MODERATE_EXTORTION_KEYWORDS)
+
+
+def generate_spanish_messages(count, min_words=1, max_words=20, seed=0, keyword_rate=0.15):
+    """
+    Genera `count` mensajes de chat en español con entre `min_words` y
+    `max_words` palabras. Una fracción `keyword_rate` de los mensajes incluye
+    alguna palabra clave de las reglas, para ejercitar todas sus ramas.
+    """
+    rng = random.Random(seed)
+    keywords = _keyword_phrases()
+
+    messages = []
+    for _ in range(count):
+        target = rng.randint(min_words, max_words)
+        words = []
+        while len(words) < target:
+            source = CHAT_PHRASES if rng.random() < 0.7 else FILLER_WORDS
+            words += rng.choice(source).split()
+        words = words[:target]
+
+        # La palabra clave reemplaza palabras en una posición al azar, sin cortarse
+        if rng.random() < keyword_rate:
+            keyword = rng.choice(keywords).split()
+            position = rng.randint(0, max(len(words) - len(keyword), 0))
+            words[position:position + len(keyword)] = keyword
+        messages.append(' '.join(words))
+    return messages
+
+
+def distinct_messages(count, min_words=1, max_words=20, seed=0, max_rounds=20):
+    """
+    Genera hasta `count` mensajes distintos tras normalizar (como los agrupa
+    predict_emotion_batch), para que la deduplicación no reduzca el trabajo
+    medido. Con perfiles cortos puede haber menos combinaciones que `count`.
+    """
+    messages = {}
+    for round_index in range(max_rounds):
+        for text in generate_spanish_messages(count, min_words, max_words, seed=seed + round_index):
+            messages.setdefault(ml.normalize_cache_text(text), text)
+            if len(messages) == count:
+                return list(messages.values())
+    return list(messages.values())
+
+
+def synthetic_texts(count, seed=0, max_words=ml.MAX_SEQUENCE_LENGTH):
+    """
+    Genera `count` textos con palabras del vocabulario y palabras desconocidas.
+    Las longitudes siguen una distribución geométrica (media ~8 palabras)
+    con algunos mensajes largos de hasta `max_words` palabras.
+    """
+    rng = random.Random(seed)
+    tokenizer = ml.get_model_bundle().tokenizer
+    vocabulary = [word for word in tokenizer.word_index if word != tokenizer.oov_token]
+    vocabulary += ['jajaja', 'oye', 'mañana', 'porfa', 'xd']
+
+    texts = []
+    for _ in range(count):
+        if rng.random() < 0.05:
+            length = rng.randint(20, max_words)
+        else:
+            length = min(1 + int(rng.expovariate(1 / 7)), max_words)
+        texts.append(' '.join(rng.choice(vocabulary) for _ in range(length)))
+    return texts
+
+
+def _best_time(function, repeats):
+    """Mejor tiempo (en segundos) de `repeats` ejecuciones de `function`."""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark_length_bucketing(texts, batch_size=ml.DEFAULT_BATCH_SIZE, repeats=5):
+    """
+    Compara predict_probabilities con matrices de MAX_SEQUENCE_LENGTH columnas
+    y con agrupación por longitud sobre los mismos textos (solo tokenizador y
+    modelo, sin reglas ni caché). Devuelve tiempos, speedup y la diferencia
+    máxima entre ambas salidas.
+    """
+    tokenizer = ml.get_model_bundle().tokenizer
+    fixed = ml.predict_probabilities(texts, batch_size, length_bucketing=False)
+    bucketed = ml.predict_probabilities(texts, batch_size, length_bucketing=True)
+
+    fixed_seconds = _best_time(
+        lambda: ml.predict_probabilities(texts, batch_size, length_bucketing=False), repeats)
+    bucketed_seconds = _best_time(
+        lambda: ml.predict_probabilities(texts, batch_size, length_bucketing=True), repeats)
+
+    return {
+        'messages': len(texts),
+        'batch_size': batch_size,
+        'mean_tokens': float(np.mean([len(tokenizer.text_to_sequence(text)) for text in texts])),
+        'fixed_seconds': fixed_seconds,
+        'bucketed_seconds': bucketed_seconds,
+        'speedup': fixed_seconds / bucketed_seconds if bucketed_seconds else float('inf'),
+        'max_abs_difference': float(np.abs(fixed - bucketed).max()),
+        'same_labels': bool((fixed.argmax(axis=1) == bucketed.argmax(axis=1)).all()),
+    }
+
+
+def _benchmark_bundle():
+    """
+    Copia del bundle activo con el mismo modelo y tokenizador. Al no ser el
+    bundle activo, predict_emotion_batch no usa la caché LRU, así que cada
+    llamada mide la clasificación completa y no un acierto de caché.
+    """
+    bundle = ml.get_model_bundle()
+    return ml.ModelBundle(bundle.version, bundle.model, bundle.tokenizer)
+
+
+def _percentiles(latencies):
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p95_ms': float(np.percentile(latencies_ms, 95)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+        'mean_ms': float(latencies_ms.mean()),
+    }
+
+
+def time_stages(texts, batch_size, bundle, length_bucketing=None):
+    """
+    Tiempo total (segundos) de cada etapa del pipeline para `texts`: tokenizar,
+    pasada del modelo y apply_keyword_correction, midiendo cada etapa por separado
+    con el mismo camino que predict_probabilities.
+    """
+    texts = list(texts)
+    stages = {'tokenize': 0.0, 'forward': 0.0, 'rules': 0.0}
+    bucketing = ml._length_bucketing_enabled(length_bucketing, bundle)
+
+    for start in range(0, len(texts), batch_size):
+        chunk = texts[start:start + batch_size]
+
+        begin = time.perf_counter()
+        if bucketing:
+            batches = list(bundle.tokenizer.encode_bucketed(chunk, ml.MAX_SEQUENCE_LENGTH, batch_size))
+        else:
+            batches = [(list(range(len(chunk))), bundle.tokenizer.encode_batch(chunk, ml.MAX_SEQUENCE_LENGTH))]
+        stages['tokenize'] += time.perf_counter() - begin
+
+        begin = time.perf_counter()
+        probs = np.empty((len(chunk), len(ml.EMOTION_LABELS)), dtype=np.float32)
+        for indices, matrix in batches:
+            if bucketing:
+                probs[indices] = bundle.model.predict_on_batch(matrix, padded_length=ml.MAX_SEQUENCE_LENGTH)
+            else:
+                probs[indices] = np.asarray(bundle.model.predict_on_batch(matrix))
+        stages['forward'] += time.perf_counter() - begin
+
+        begin = time.perf_counter()
+        predicted = probs.argmax(axis=1)
+        for text, class_index, row in zip(chunk, predicted, probs):
+            ml.apply_keyword_correction(text, ml.EMOTION_LABELS[int(class_index)], float(row[class_index]))
+        stages['rules'] += time.perf_counter() - begin
+
+    return stages
+
+
+def benchmark_single(texts, bundle, repeats=1, fast_path=False):
+    """Latencia de clasificar los mensajes uno por uno (como predict_emotion)."""
+    latencies = []
+    routes = Counter()
+    for _ in range(repeats):
+        for text in texts:
+            start = time.perf_counter()
+            results = ml.predict_emotion_batch([text], bundle=bundle, fast_path=fast_path)
+            latencies.append(time.perf_counter() - start)
+            routes.update(result['ruta'] for result in results)
+    return {
+        'mode': 'single',
+        'batch_size': 1,
+        'messages': len(texts) * repeats,
+        'messages_per_second': len(latencies) / sum(latencies),
+        'latency': _percentiles(latencies),
+        'routes': dict(routes),
+        'stages_us_per_message': _stages_per_message(time_stages(texts, 1, bundle), len(texts)),
+    }
+
+
+def benchmark_batched(texts, bundle, batch_size, repeats=1, fast_path=False):
+    """Latencia por lote y mensajes/segundo con predict_emotion_batch."""
+    latencies = []
+    routes = Counter()
+    for _ in range(repeats):
+        for start in range(0, len(texts), batch_size):
+            chunk = texts[start:start + batch_size]
+            begin = time.perf_counter()
+            results = ml.predict_emotion_batch(chunk, batch_size=batch_size, bundle=bundle, fast_path=fast_path)
+            latencies.append(time.perf_counter() - begin)
+            routes.update(result['ruta'] for result in results)
+    return {
+        'mode': 'batch',
+        'batch_size': batch_size,
+        'messages': len(texts) * repeats,
+        'messages_per_second': len(texts) * repeats / sum(latencies),
+        'latency': _percentiles(latencies),
+        'routes': dict(routes),
+        'stages_us_per_message': _stages_per_message(time_stages(texts, batch_size, bundle), len(texts)),
+    }
+
+
+def _stages_per_message(stages, count):
+    return {stage: seconds / count * 1e6 for stage, seconds in stages.items()}
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmark_suite(messages=2000, batch_sizes=(16, 64, 256), lengths=tuple(LENGTH_PROFILES),
+                        repeats=3, seed=0, fast_path=False):
+    """
+    Ejecuta la inferencia individual y por lotes para cada perfil de longitud
+    y tamaño de lote. Devuelve un diccionario serializable a JSON con los
+    metadatos de la ejecución (commit, versión del modelo, parámetros) y un
+    resultado por combinación.
+
+    Para medir el modelo y no los atajos, los mensajes son distintos entre sí
+    (sin deduplicación posible), no se usa la caché (ver _benchmark_bundle) y
+    la ruta rápida está desactivada salvo con `fast_path`. Cada resultado
+    informa cuántos mensajes resolvió cada ruta.
+    """
+    bundle = _benchmark_bundle()
+    results = []
+    for length in lengths:
+        min_words, max_words = LENGTH_PROFILES[length]
+        texts = distinct_messages(messages, min_words, max_words, seed=seed)
+
+        # Pasada de calentamiento
+        ml.predict_emotion_batch(texts[:256], bundle=bundle, fast_path=fast_path)
+
+        runs = [benchmark_single(texts[:min(len(texts), 1000)], bundle, repeats, fast_path)]
+        runs += [benchmark_batched(texts, bundle, batch_size, repeats, fast_path) for batch_size in batch_sizes]
+        for run in runs:
+            run['length'] = length
+            run['words'] = [min_words, max_words]
+            run['distinct_messages'] = len(texts)
+        results.extend(runs)
+
+    return {
+        'metadata': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'git_revision': _git_revision(),
+            'model_version': bundle.version,
+            'rules_version': ml.RULES_VERSION,
+            'backend': ml._inference_backend(),
+            'weights_precision': getattr(bundle.model, 'precision', None),
+            'length_bucketing': ml._length_bucketing_enabled(None, bundle),
+            'fast_path': ml._fast_path_enabled(fast_path),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'cpu_count': os.cpu_count(),
+            'messages': messages,
+            'repeats': repeats,
+            'seed': seed,
+        },
+        'results': results,
+    }
+
+
+def compare_results(previous, current):
+    """
+    Cambio relativo de mensajes/segundo y de p95 entre dos ejecuciones de
+    run_benchmark_suite, para las combinaciones presentes en ambas.
+    """
+    def key(run):
+        return run['length'], run['mode'], run['batch_size']
+
+    previous_runs = {key(run): run for run in previous['results']}
+    comparison = []
+    for run in current['results']:
+        before = previous_runs.get(key(run))
+        if before is None:
+            continue
+        comparison.append({
+            'length': run['length'],
+            'mode': run['mode'],
+            'batch_size': run['batch_size'],
+            'throughput_change': run['messages_per_second'] / before['messages_per_second'] - 1,
+            'p95_change': run['latency']['p95_ms'] / before['latency']['p95_ms'] - 1,
+        })
+    return comparison
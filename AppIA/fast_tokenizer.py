@@ -0,0 +1,254 @@
+# AppIA/fast_tokenizer.py
+"""
+Tokenizador de ejecución que reemplaza al Tokenizer de Keras serializado.
+
+Reproduce exactamente Tokenizer.texts_to_sequences (minúsculas, filtros,
+separador y token OOV) a partir de un vocabulario en JSON recortado a las
+`num_words` palabras que el modelo realmente usa, sin importar Keras ni
+TensorFlow. Además escribe los índices directamente en una matriz int32
+preasignada para todo el lote.
+
+El vocabulario también puede guardarse en formato plano (un directorio con
+arrays .npy ordenados, ver `save_flat`) que se abre con mmap: todos los
+procesos de un servidor comparten la misma copia en la caché de páginas del
+sistema operativo en lugar de construir cada uno su propio diccionario.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# Filtros por defecto del Tokenizer de Keras
+DEFAULT_FILTERS = '!"#$%&()*+,-./:;<=>?@[\\]^_`{|}~\t\n'
+
+
+class VocabTokenizer:
+    """
+    Equivalente de ejecución del Tokenizer de Keras (sin char_level ni analyzer).
+
+    `word_index` solo necesita las palabras con índice menor que `num_words`:
+    el resto se comporta igual que una palabra desconocida.
+    """
+
+    def __init__(self, word_index, num_words=None, oov_token=None,
+                 filters=DEFAULT_FILTERS, lower=True, split=' '):
+        self._configure(num_words, oov_token, filters, lower, split)
+
+        # Palabras que el modelo ve con su propio índice; las demás son OOV
+        self.word_index = {
+            word: index for word, index in word_index.items()
+            if not num_words or index < num_words
+        }
+        # Índice del token OOV (Keras lo usa aunque supere num_words)
+        self.oov_index = word_index.get(oov_token) if oov_token is not None else None
+        if self.oov_index is not None:
+            self.word_index[oov_token] = self.oov_index
+
+    def _configure(self, num_words, oov_token, filters, lower, split):
+        self.num_words = num_words
+        self.oov_token = oov_token
+        self.filters = filters
+        self.lower = lower
+        self.split = split
+        self._translation = str.maketrans({char: split for char in filters})
+
+    def _config(self):
+        return {
+            'num_words': self.num_words,
+            'oov_token': self.oov_token,
+            'filters': self.filters,
+            'lower': self.lower,
+            'split': self.split,
+        }
+
+    @classmethod
+    def from_keras(cls, keras_tokenizer):
+        """Construye el tokenizador a partir de un Tokenizer de Keras ya cargado."""
+        if keras_tokenizer.char_level or getattr(keras_tokenizer, 'analyzer', None) is not None:
+            raise ValueError("Solo se soportan tokenizadores por palabras sin analyzer personalizado.")
+        return cls(
+            word_index=keras_tokenizer.word_index,
+            num_words=keras_tokenizer.num_words,
+            oov_token=keras_tokenizer.oov_token,
+            filters=keras_tokenizer.filters,
+            lower=keras_tokenizer.lower,
+            split=keras_tokenizer.split,
+        )
+
+    @classmethod
+    def load(cls, path):
+        """
+        Carga el vocabulario exportado con `save` (JSON) o, si `path` es un
+        directorio, el formato plano de `save_flat` mapeado en memoria.
+        """
+        if os.path.isdir(path):
+            return MmapVocabTokenizer.load(path)
+        with open(path, encoding='utf-8') as handle:
+            config = json.load(handle)
+        return cls(**config)
+
+    def save(self, path):
+        config = self._config()
+        config['word_index'] = dict(sorted(self.word_index.items(), key=lambda item: item[1]))
+        with open(path, 'w', encoding='utf-8') as handle:
+            json.dump(config, handle, ensure_ascii=False, indent=1)
+
+    def _flat_arrays(self):
+        """Palabras en UTF-8 ordenadas (ancho fijo) y sus índices, como en `save_flat`."""
+        encoded = sorted((word.encode('utf-8'), index) for word, index in self.word_index.items())
+        width = max((len(word) for word, _ in encoded), default=1)
+        return (np.array([word for word, _ in encoded], dtype=f'S{width}'),
+                np.array([index for _, index in encoded], dtype=np.int32))
+
+    def save_flat(self, directory):
+        """
+        Guarda el vocabulario en formato plano: las palabras en UTF-8 ordenadas
+        (words.npy, ancho fijo), sus índices (indices.npy) y la configuración.
+        """
+        os.makedirs(directory, exist_ok=True)
+        words, indices = self._flat_arrays()
+        np.save(os.path.join(directory, 'words.npy'), words)
+        np.save(os.path.join(directory, 'indices.npy'), indices)
+        with open(os.path.join(directory, 'config.json'), 'w', encoding='utf-8') as handle:
+            json.dump(self._config(), handle, ensure_ascii=False, indent=1)
+
+    def fingerprint(self):
+        """
+        Huella (sha1) del vocabulario y la configuración: la misma para el JSON
+        y para la copia plana, porque no depende del formato del archivo.
+        """
+        digest = hashlib.sha1()
+        digest.update(json.dumps(self._config(), sort_keys=True).encode('utf-8'))
+        for values in self._flat_arrays():
+            values = np.ascontiguousarray(values)
+            digest.update(f'{values.dtype.str}{values.shape}'.encode('utf-8'))
+            digest.update(values.data)
+        return digest.hexdigest()
+
+    def text_to_word_sequence(self, text):
+        if self.lower:
+            text = text.lower()
+        return [word for word in text.translate(self._translation).split(self.split) if word]
+
+    def text_to_sequence(self, text):
+        """Índices de las palabras de un texto (igual que Keras, sin relleno)."""
+        get = self.word_index.get
+        oov_index = self.oov_index
+        if oov_index is None:
+            return [index for index in map(get, self.text_to_word_sequence(text)) if index is not None]
+        return [get(word, oov_index) for word in self.text_to_word_sequence(text)]
+
+    def texts_to_sequences(self, texts):
+        return [self.text_to_sequence(text) for text in texts]
+
+    def encode_batch(self, texts, maxlen, out=None):
+        """
+        Tokeniza un lote y escribe los índices en una matriz int32 de forma
+        (len(texts), maxlen), con relleno y truncado al final ('post').
+        Si se pasa `out`, se reutiliza esa matriz en lugar de crear otra.
+        """
+        if out is None:
+            out = np.zeros((len(texts), maxlen), dtype=np.int32)
+        else:
+            out[:] = 0
+
+        for row, sequence in enumerate(self.texts_to_sequences(texts)):
+            sequence = sequence[:maxlen]
+            out[row, :len(sequence)] = sequence
+        return out
+
+    def encode_bucketed(self, texts, maxlen, batch_size):
+        """
+        Tokeniza un lote agrupando los textos por longitud: los ordena por
+        cantidad de tokens y genera bloques de hasta `batch_size` filas, cada
+        uno rellenado solo hasta su secuencia más larga (como máximo `maxlen`).
+
+        Genera tuplas (índices, matriz), donde `índices` son las posiciones de
+        cada fila de la matriz en `texts`, para poder restaurar el orden.
+        """
+        sequences = [sequence[:maxlen] for sequence in self.texts_to_sequences(texts)]
+        order = sorted(range(len(sequences)), key=lambda index: len(sequences[index]))
+
+        for start in range(0, len(order), batch_size):
+            indices = order[start:start + batch_size]
+            width = max(len(sequences[indices[-1]]), 1)
+            matrix = np.zeros((len(indices), width), dtype=np.int32)
+            for row, index in enumerate(indices):
+                sequence = sequences[index]
+                matrix[row, :len(sequence)] = sequence
+            yield indices, matrix
+
+
+class MmapVocabTokenizer(VocabTokenizer):
+    """
+    Variante de VocabTokenizer sobre el formato plano de `save_flat`, abierto
+    con mmap. Las palabras de todo un lote se buscan juntas con una búsqueda
+    binaria vectorizada sobre el array ordenado, sin diccionario en memoria.
+    """
+
+    def __init__(self, words, indices, num_words=None, oov_token=None,
+                 filters=DEFAULT_FILTERS, lower=True, split=' '):
+        self._configure(num_words, oov_token, filters, lower, split)
+        self._words = words
+        self._indices = indices
+        self.oov_index = None
+        if oov_token is not None:
+            (oov_index,) = self.lookup([oov_token])
+            self.oov_index = int(oov_index) if oov_index >= 0 else None
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, 'config.json'), encoding='utf-8') as handle:
+            config = json.load(handle)
+        return cls(
+            words=np.load(os.path.join(path, 'words.npy'), mmap_mode='r'),
+            indices=np.load(os.path.join(path, 'indices.npy'), mmap_mode='r'),
+            **config
+        )
+
+    @property
+    def word_index(self):
+        """Diccionario completo (se construye en cada llamada; solo para herramientas)."""
+        return {word.decode('utf-8'): int(index) for word, index in zip(self._words, self._indices)}
+
+    def lookup(self, words):
+        """Índice de cada palabra, o -1 si no está en el vocabulario."""
+        if not words or not len(self._words):
+            return np.full(len(words), -1, dtype=np.int64)
+        encoded = [word.encode('utf-8') for word in words]
+        width = self._words.dtype.itemsize
+        # Las palabras más largas que el ancho del array no pueden estar
+        fits = np.fromiter((len(word) <= width for word in encoded), dtype=bool, count=len(encoded))
+        queries = np.array(encoded, dtype=f'S{width}')
+
+        positions = np.minimum(np.searchsorted(self._words, queries), len(self._words) - 1)
+        found = fits & (self._words[positions] == queries)
+        return np.where(found, self._indices[positions], -1)
+
+    def text_to_sequence(self, text):
+        return self.texts_to_sequences([text])[0]
+
+    def texts_to_sequences(self, texts):
+        word_sequences = [self.text_to_word_sequence(text) for text in texts]
+        indices = self.lookup([word for words in word_sequences for word in words]).tolist()
+
+        sequences = []
+        start = 0
+        for words in word_sequences:
+            sequence = indices[start:start + len(words)]
+            start += len(words)
+            if self.oov_index is None:
+                sequences.append([index for index in sequence if index >= 0])
+            else:
+                sequences.append([index if index >= 0 else self.oov_index for index in sequence])
+        return sequences
+
+    def _flat_arrays(self):
+        return self._words, self._indices
+
+    def save_flat(self, directory):
+        VocabTokenizer(self.word_index, **self._config()).save_flat(directory)
+
+    def save(self, path):
+        VocabTokenizer(self.word_index, **self._config()).save(path)
@@ -0,0 +1,95 @@
+# AppIA/instrumentation.py
+"""
+Métricas opcionales por etapa de la inferencia (EMOTION_METRICS_ENABLED).
+
+ml.py mide cada etapa (tokenizar, modelo, reglas y la llamada completa) y
+registra qué regla de apply_keyword_correction decidió cada mensaje. Con las
+métricas desactivadas, ml.INFERENCE_METRICS es None y el pipeline solo hace
+una comparación con None por lote: no se llama al reloj ni se toma el lock.
+
+Las métricas son por proceso: las del servidor web se leen en la vista
+/management/metrics/inferencia/, y 'python manage.py inference_metrics'
+clasifica una muestra de mensajes con las métricas activadas y las muestra.
+"""
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+
+# Límites superiores (en milisegundos) de los intervalos del histograma
+LATENCY_BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+# Etapas medidas, en el orden en que ocurren
+STAGES = ('tokenize', 'forward', 'rules', 'predict_emotion_batch')
+
+
+class StageStats:
+    """Conteos y histograma de latencia de una etapa."""
+
+    __slots__ = ('calls', 'messages', 'total_seconds', 'max_seconds', 'histogram')
+
+    def __init__(self):
+        self.calls = 0
+        self.messages = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        # Un intervalo por límite más uno para lo que supera el último
+        self.histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def add(self, seconds, messages):
+        self.calls += 1
+        self.messages += messages
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.histogram[bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)] += 1
+
+    def snapshot(self):
+        labels = [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        return {
+            'calls': self.calls,
+            'messages': self.messages,
+            'total_ms': self.total_seconds * 1000,
+            'mean_ms_per_call': self.total_seconds * 1000 / self.calls if self.calls else 0.0,
+            'mean_us_per_message': self.total_seconds * 1e6 / self.messages if self.messages else 0.0,
+            'max_ms': self.max_seconds * 1000,
+            'histogram': dict(zip(labels, self.histogram)),
+        }
+
+
+class InferenceMetrics:
+    """
+    Métricas de un proceso: una StageStats por etapa y un contador de la
+    regla que decidió cada mensaje clasificado ('mensaje_corto',
+    'prioridad_1' ... 'prioridad_7' o 'default'). Segura entre hilos.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self.stages = {stage: StageStats() for stage in STAGES}
+            self.rules = Counter()
+            self.routes = Counter()
+
+    def record(self, stage, seconds, messages=1):
+        """Registra una llamada a `stage` que procesó `messages` mensajes."""
+        with self._lock:
+            self.stages[stage].add(seconds, messages)
+
+    def record_outcomes(self, rules, routes):
+        """Suma las reglas que decidieron y las rutas ('cache', 'reglas', 'modelo')."""
+        with self._lock:
+            self.rules.update(rules)
+            self.routes.update(routes)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'since': self.started_at,
+                'stages': {stage: stats.snapshot() for stage, stats in self.stages.items()},
+                'rules': dict(self.rules.most_common()),
+                'routes': dict(self.routes),
+            }
@@ -0,0 +1,115 @@
+# AppIA/keyword_matcher.py
+"""
+Búsqueda de palabras clave en una sola pasada (autómata de Aho-Corasick).
+
+apply_keyword_correction necesita saber cuántas palabras clave de cada
+categoría aparecen en un mensaje. En lugar de recorrer el texto una vez por
+palabra clave, el autómata se compila una sola vez y encuentra todas las
+coincidencias (incluidas las solapadas, p. ej. 'te amo' y 'amo') recorriendo
+el texto carácter por carácter.
+"""
+from collections import deque
+
+
+# Vocales acentuadas -> vocal simple. La 'ñ' se conserva a propósito para no
+# confundir palabras distintas ('año' / 'ano').
+ACCENT_TRANSLATION = str.maketrans('áàäâéèëêíìïîóòöôúùüû', 'aaaaeeeeiiiioooouuuu')
+
+
+class KeywordMatcher:
+    """
+    Autómata precompilado sobre varias listas de palabras clave.
+
+    `count(text)` devuelve, por categoría, cuántas palabras clave distintas
+    aparecen como subcadena del texto en minúsculas; es decir, lo mismo que
+    `sum(1 for keyword in lista if keyword in text.lower())`.
+    Con `normalize_accents=True` se ignoran las tildes tanto en las palabras
+    clave como en el texto, de modo que 'aléjate' y 'alejate' cuentan igual.
+    """
+
+    def __init__(self, categories, normalize_accents=False):
+        self.normalize_accents = normalize_accents
+        self.categories = tuple(categories)
+
+        # Palabras clave normalizadas (sin duplicados) y sus categorías
+        pattern_ids = {}
+        pattern_categories = []
+        for category, keywords in categories.items():
+            for keyword in keywords:
+                pattern = self.normalize(keyword)
+                if not pattern:
+                    continue
+                if pattern not in pattern_ids:
+                    pattern_ids[pattern] = len(pattern_categories)
+                    pattern_categories.append(set())
+                pattern_categories[pattern_ids[pattern]].add(category)
+        self.patterns = tuple(pattern_ids)
+        self._pattern_categories = [tuple(sorted(cats)) for cats in pattern_categories]
+
+        self._build(pattern_ids)
+
+    def normalize(self, text):
+        """Aplica al texto la misma normalización que a las palabras clave."""
+        text = text.lower()
+        if self.normalize_accents:
+            text = text.translate(ACCENT_TRANSLATION)
+        return text
+
+    def _build(self, pattern_ids):
+        # 1. Trie con las palabras clave
+        goto = [{}]
+        outputs = [set()]
+        for pattern, pattern_id in pattern_ids.items():
+            state = 0
+            for char in pattern:
+                if char not in goto[state]:
+                    goto.append({})
+                    outputs.append(set())
+                    goto[state][char] = len(goto) - 1
+                state = goto[state][char]
+            outputs[state].add(pattern_id)
+
+        # 2. Enlaces de fallo en anchura y transiciones completas (DFA), para
+        #    que la búsqueda sea una sola consulta de diccionario por carácter
+        fail = [0] * len(goto)
+        transitions = [dict(edges) for edges in goto]
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            outputs[state] |= outputs[fail[state]]
+            for char, target in goto[state].items():
+                fail[target] = transitions[fail[state]].get(char, 0)
+                queue.append(target)
+            for char, target in transitions[fail[state]].items():
+                transitions[state].setdefault(char, target)
+
+        self._transitions = transitions
+        self._outputs = [frozenset(ids) if ids else None for ids in outputs]
+
+    def find(self, text):
+        """Devuelve los índices (en self.patterns) de las palabras clave presentes."""
+        transitions = self._transitions
+        outputs = self._outputs
+        matched = set()
+        state = 0
+        for char in self.normalize(text):
+            state = transitions[state].get(char, 0)
+            if outputs[state] is not None:
+                matched |= outputs[state]
+        return matched
+
+    def count(self, text):
+        """Cantidad de palabras clave distintas presentes, por categoría."""
+        counts = dict.fromkeys(self.categories, 0)
+        for pattern_id in self.find(text):
+            for category in self._pattern_categories[pattern_id]:
+                counts[category] += 1
+        return counts
+
+    def matches(self, text):
+        """Palabras clave presentes (normalizadas), por categoría; solo las categorías con alguna."""
+        found = {}
+        for pattern_id in self.find(text):
+            for category in self._pattern_categories[pattern_id]:
+                found.setdefault(category, []).append(self.patterns[pattern_id])
+        return {category: sorted(keywords) for category, keywords in found.items()}
@@ -0,0 +1,151 @@
+# AppIA/live_analysis.py
+"""
+Análisis al escribir: cada mensaje nuevo se clasifica poco después de enviarse.
+
+send_message encola (id, contenido, fecha de envío) cuando la transacción que
+creó el mensaje se confirma; encolar es solo un `put` en una cola en memoria,
+así que el envío no espera al modelo. Un hilo de fondo por proceso junta los
+mensajes pendientes hasta EMOTION_LIVE_ANALYSIS_MAX_BATCH o hasta que pasan
+EMOTION_LIVE_ANALYSIS_MAX_WAIT_MS desde el primero, los clasifica en bloque y
+guarda sus MessageAnalysis. La cola usa la misma base de micro-lotes que el
+despachador de inferencia (micro_batching.py) y, con EMOTION_USE_DISPATCHER,
+la pasada del modelo de cada micro-lote se envía al despachador, donde se
+junta con las clasificaciones concurrentes de las vistas.
+
+El retraso desde el envío hasta que el MessageAnalysis queda guardado se mide
+por mensaje (ver `stats`). Si el proceso termina con mensajes en la cola, el
+siguiente análisis incremental los clasifica.
+
+Antes de eso, las amenazas críticas se revisan de forma síncrona al enviar
+(`flag_critical_message`): una pasada del autómata de palabras clave críticas
+y, solo si hay coincidencia, un INSERT en FlaggedMessage.
+"""
+import threading
+import time
+
+from django.db import close_old_connections, transaction
+
+from . import ml
+from .analysis import AnalysisError, analyze_message_rows
+from .instrumentation import StageStats
+from .micro_batching import MicroBatcher
+from .models import FlaggedMessage
+
+
+class MessageAnalysisQueue(MicroBatcher):
+    """
+    Cola de mensajes por clasificar con un hilo de fondo que los procesa en
+    micro-lotes (ver micro_batching.py). Con `background=False` no arranca el
+    hilo y los mensajes se procesan al llamar a `drain` (consola, pruebas).
+    """
+
+    thread_name = 'live-analysis'
+
+    def __init__(self, max_batch_size=64, max_wait_ms=50, background=True):
+        super().__init__(max_batch_size, max_wait_ms, background)
+        self.lag = StageStats()
+        self.batches = 0
+        self.messages = 0
+        self.errors = 0
+
+    def enqueue(self, message_id, content, sent_at=None):
+        """Encola un mensaje; `sent_at` (time.time()) es el inicio del retraso medido."""
+        self.put((message_id, content, time.time() if sent_at is None else sent_at))
+
+    def _process(self, batch):
+        rows = [(message_id, content) for message_id, content, _ in batch]
+        try:
+            analyze_message_rows(rows)
+        except AnalysisError as e:
+            print(f"Error en el análisis al escribir de {len(rows)} mensajes: {e}")
+            with self._lock:
+                self.errors += len(rows)
+            return
+
+        finished = time.time()
+        with self._lock:
+            self.batches += 1
+            self.messages += len(batch)
+            for _, _, sent_at in batch:
+                self.lag.add(max(finished - sent_at, 0.0), 1)
+
+    def _before_background_batch(self):
+        # El hilo mantiene su propia conexión; descartarla si caducó
+        close_old_connections()
+
+    def _batch_failed(self, batch, error):
+        print(f"Error en el análisis al escribir: {error}")
+        with self._lock:
+            self.errors += len(batch)
+
+    def stats(self):
+        """Profundidad de la cola, contadores, histogramas e histograma del retraso envío → MessageAnalysis."""
+        stats = self.batching_stats()
+        with self._lock:
+            stats.update({
+                'batches': self.batches,
+                'messages': self.messages,
+                'errors': self.errors,
+                'mean_batch_size': self.messages / self.batches if self.batches else 0.0,
+                'lag': self.lag.snapshot(),
+            })
+        return stats
+
+
+_analysis_queue = None
+_analysis_queue_lock = threading.Lock()
+
+def get_analysis_queue():
+    """
+    Devuelve la cola del proceso, creándola con EMOTION_LIVE_ANALYSIS_MAX_BATCH
+    y EMOTION_LIVE_ANALYSIS_MAX_WAIT_MS la primera vez.
+    """
+    global _analysis_queue
+    with _analysis_queue_lock:
+        if _analysis_queue is None:
+            _analysis_queue = MessageAnalysisQueue(
+                max_batch_size=ml._get_setting('EMOTION_LIVE_ANALYSIS_MAX_BATCH', 64),
+                max_wait_ms=ml._get_setting('EMOTION_LIVE_ANALYSIS_MAX_WAIT_MS', 50),
+            )
+        return _analysis_queue
+
+def analyze_on_commit(message):
+    """
+    Programa la clasificación de `message` para cuando se confirme la
+    transacción que lo creó (EMOTION_ANALYZE_ON_WRITE). No bloquea.
+    """
+    if not ml._get_setting('EMOTION_ANALYZE_ON_WRITE', True):
+        return
+    sent_at = message.created_at.timestamp()
+    transaction.on_commit(lambda: get_analysis_queue().enqueue(message.id, message.content, sent_at))
+
+def flag_critical_message(message):
+    """
+    Revisa `message` contra las amenazas críticas y, si alguna coincide, lo
+    registra en FlaggedMessage (violencia antes que extorsión si hay ambas).
+    Devuelve el FlaggedMessage o None. Con EMOTION_CRITICAL_LANE = False no hace nada.
+
+    Un error al revisar o al registrar no impide el envío: se informa y el
+    mensaje queda para el análisis completo, que también lo clasifica.
+    """
+    if not ml._get_setting('EMOTION_CRITICAL_LANE', True):
+        return None
+    try:
+        matches = ml.find_critical_keywords(message.content)
+        if not matches:
+            return None
+
+        category = (FlaggedMessage.CATEGORY_VIOLENCE if FlaggedMessage.CATEGORY_VIOLENCE in matches
+                    else FlaggedMessage.CATEGORY_EXTORTION)
+        keywords = ', '.join(keyword for category_keywords in matches.values() for keyword in category_keywords)
+        # Punto de guardado propio: si el INSERT falla no se revierte el mensaje
+        with transaction.atomic():
+            return FlaggedMessage.objects.create(
+                message=message,
+                conversation_id=message.conversation_id,
+                category=category,
+                matched_keywords=keywords[:255],
+            )
+    except Exception as e:
+        print(f"Error al señalar el mensaje {message.id} como amenaza crítica: {e}")
+        return None
@@ -0,0 +1,83 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide la inferencia de emociones (individual y por lotes) con mensajes sintéticos en "
+        "español: latencia p50/p95/p99, mensajes por segundo y tiempo por etapa (tokenizar, "
+        "modelo y apply_keyword_correction). Usa mensajes distintos entre sí, sin la base de datos, "
+        "la caché ni (salvo con --fast-path) la ruta rápida, para medir el modelo y no los atajos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2000, help="Mensajes por perfil de longitud")
+        parser.add_argument('--batch-sizes', default='16,64,256', help="Tamaños de lote separados por comas")
+        parser.add_argument('--lengths', default='corto,medio,largo',
+                            help="Perfiles de longitud separados por comas (corto, medio, largo)")
+        parser.add_argument('--repeats', type=int, default=3, help="Repeticiones de cada medición")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--fast-path', action='store_true',
+                            help="Medir con la ruta rápida (EMOTION_FAST_PATH): las reglas evitan parte del modelo")
+        parser.add_argument('--output', help="Archivo JSON donde guardar los resultados")
+        parser.add_argument('--compare', help="JSON de una ejecución anterior para comparar")
+
+    def handle(self, *args, **options):
+        from AppIA import ml
+        from AppIA.benchmarks import LENGTH_PROFILES, compare_results, run_benchmark_suite
+
+        if ml.get_model_bundle() is None:
+            raise CommandError("El modelo o el tokenizador no están cargados.")
+
+        lengths = [length.strip() for length in options['lengths'].split(',') if length.strip()]
+        unknown = set(lengths) - set(LENGTH_PROFILES)
+        if unknown:
+            raise CommandError(f"Perfiles de longitud desconocidos: {', '.join(sorted(unknown))}")
+        try:
+            batch_sizes = [int(size) for size in options['batch_sizes'].split(',') if size.strip()]
+        except ValueError:
+            raise CommandError("--batch-sizes debe ser una lista de enteros separados por comas.")
+
+        report = run_benchmark_suite(
+            messages=options['messages'], batch_sizes=batch_sizes, lengths=lengths,
+            repeats=options['repeats'], seed=options['seed'], fast_path=options['fast_path']
+        )
+
+        metadata = report['metadata']
+        self.stdout.write(
+            f"Modelo {metadata['model_version']} ({metadata['backend']}, {metadata['weights_precision']}), "
+            f"reglas {metadata['rules_version']}, commit {metadata['git_revision'] or '?'}, "
+            f"ruta rápida {'sí' if metadata['fast_path'] else 'no'}"
+        )
+        self.stdout.write(
+            f"{'longitud':8} {'modo':6} {'lote':>5} {'msg/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+            f"   µs/msg: tokenizar / modelo / reglas   rutas"
+        )
+        for run in report['results']:
+            latency = run['latency']
+            stages = run['stages_us_per_message']
+            self.stdout.write(
+                f"{run['length']:8} {run['mode']:6} {run['batch_size']:5d} {run['messages_per_second']:10.0f} "
+                f"{latency['p50_ms']:9.3f} {latency['p95_ms']:9.3f} {latency['p99_ms']:9.3f}"
+                f"   {stages['tokenize']:.1f} / {stages['forward']:.1f} / {stages['rules']:.1f}"
+                f"   {', '.join(f'{route} {count}' for route, count in sorted(run['routes'].items()))}"
+            )
+
+        if options['compare']:
+            try:
+                with open(options['compare'], encoding='utf-8') as handle:
+                    previous = json.load(handle)
+            except (IOError, ValueError) as e:
+                raise CommandError(f"No se pudo leer {options['compare']}: {e}")
+            self.stdout.write(f"Comparación con {previous['metadata'].get('git_revision') or options['compare']}:")
+            for change in compare_results(previous, report):
+                self.stdout.write(
+                    f"  {change['length']:8} {change['mode']:6} {change['batch_size']:5d} "
+                    f"msg/s {change['throughput_change']:+.1%}  p95 {change['p95_change']:+.1%}"
+                )
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as handle:
+                json.dump(report, handle, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Resultados guardados en {options['output']}"))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide la inferencia en bloque con matrices de longitud fija y con "
+        "agrupación por longitud (EMOTION_LENGTH_BUCKETING) sobre textos sintéticos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=20000, help="Cantidad de textos sintéticos")
+        parser.add_argument('--batch-size', type=int, default=256, help="Textos por cada pasada del modelo")
+        parser.add_argument('--repeats', type=int, default=5, help="Repeticiones (se informa la mejor)")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        from AppIA import ml
+        from AppIA.benchmarks import benchmark_length_bucketing, synthetic_texts
+
+        bundle = ml.get_model_bundle()
+        if bundle is None:
+            raise CommandError("El modelo o el tokenizador no están cargados.")
+        if not getattr(bundle.model, 'supports_padded_length', False):
+            raise CommandError("La agrupación por longitud requiere EMOTION_INFERENCE_BACKEND = 'numpy'.")
+
+        texts = synthetic_texts(options['messages'], seed=options['seed'])
+        result = benchmark_length_bucketing(texts, batch_size=options['batch_size'], repeats=options['repeats'])
+
+        self.stdout.write(
+            f"{result['messages']} mensajes, {result['mean_tokens']:.1f} tokens de media, "
+            f"lotes de {result['batch_size']}"
+        )
+        self.stdout.write(f"  Longitud fija:          {result['fixed_seconds'] * 1000:.1f} ms")
+        self.stdout.write(f"  Agrupación por longitud: {result['bucketed_seconds'] * 1000:.1f} ms")
+        self.stdout.write(
+            f"  Speedup: {result['speedup']:.2f}x, diferencia máxima {result['max_abs_difference']:.2e}, "
+            f"mismas etiquetas: {'sí' if result['same_labels'] else 'no'}"
+        )
@@ -0,0 +1,85 @@
+import os
+import shutil
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from AppIA.numpy_engine import WEIGHT_PRECISIONS, NumpyEmotionModel, export_keras_weights
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporta los pesos de modelo_emociones.h5 a modelo_emociones.npz para el "
+        "backend de inferencia NumPy y verifica que ambos backends coinciden."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--h5', help="Ruta del modelo Keras (por defecto AppIA/modelo_emociones.h5)")
+        parser.add_argument('--output', help="Ruta del .npz de salida (por defecto AppIA/modelo_emociones.npz)")
+        parser.add_argument('--precision', choices=WEIGHT_PRECISIONS, default='float32',
+                            help="Precisión de la tabla de embeddings (ver 'quantize_inference_weights')")
+        parser.add_argument('--samples', type=int, default=512,
+                            help="Secuencias aleatorias para la verificación de paridad")
+
+    def handle(self, *args, **options):
+        from AppIA import ml
+
+        h5_path = options['h5'] or ml.model_path
+        npz_path = options['output'] or ml.weights_path
+
+        try:
+            keras_model = export_keras_weights(h5_path, npz_path, precision=options['precision'])
+        except (IOError, ValueError) as e:
+            raise CommandError(f"No se pudo exportar el modelo: {e}")
+        self.stdout.write(f"Pesos exportados a {npz_path} ({options['precision']})")
+
+        # Verificación de paridad contra el modelo Keras de referencia
+        numpy_model = NumpyEmotionModel.load(npz_path)
+        # La copia plana (mapeada en memoria) tiene prioridad al cargar; se
+        # regenera en un directorio temporal, se verifica ella misma y solo
+        # reemplaza a la anterior si la paridad se cumple
+        staging_dir = None
+        if os.path.abspath(npz_path) == os.path.abspath(ml.weights_path):
+            staging_dir = ml.staging_flat_dir(ml.weights_flat_path)
+            numpy_model.save_flat(staging_dir)
+            numpy_model = NumpyEmotionModel.load(staging_dir)
+        try:
+            self._check_parity(keras_model, numpy_model, options)
+        except CommandError:
+            if staging_dir is not None:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+        if staging_dir is not None:
+            ml.install_flat_copy(staging_dir, ml.weights_flat_path)
+            self.stdout.write(f"Pesos exportados a {ml.weights_flat_path} (mapeados en memoria)")
+
+    def _check_parity(self, keras_model, numpy_model, options):
+        from AppIA import ml
+
+        vocab_size = numpy_model.embeddings.shape[0]
+        rng = np.random.default_rng(0)
+        sequences = rng.integers(0, vocab_size, size=(options['samples'], ml.MAX_SEQUENCE_LENGTH), dtype=np.int32)
+        # Simular relleno al final como en los mensajes reales
+        lengths = rng.integers(0, ml.MAX_SEQUENCE_LENGTH + 1, size=options['samples'])
+        sequences[np.arange(ml.MAX_SEQUENCE_LENGTH) >= lengths[:, np.newaxis]] = 0
+
+        expected = np.asarray(keras_model.predict_on_batch(sequences))
+        actual = numpy_model.predict_on_batch(sequences)
+        max_diff = float(np.abs(expected - actual).max())
+        same_class = bool((expected.argmax(axis=1) == actual.argmax(axis=1)).all())
+
+        # En precisión reducida solo se informa la diferencia
+        if options['precision'] != 'float32':
+            self.stdout.write(
+                f"Diferencia con Keras en {options['precision']}: máxima {max_diff:.2e}, "
+                f"misma clase en todas las secuencias: {'sí' if same_class else 'no'}."
+            )
+            return
+        if not same_class or max_diff > 1e-5:
+            raise CommandError(
+                f"Los backends no coinciden (diferencia máxima {max_diff:.2e}, "
+                f"misma clase: {same_class})."
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Paridad verificada con {options['samples']} secuencias (diferencia máxima {max_diff:.2e})."
+        ))
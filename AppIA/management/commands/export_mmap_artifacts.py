@@ -0,0 +1,53 @@
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from AppIA.fast_tokenizer import VocabTokenizer
+from AppIA.numpy_engine import NumpyEmotionModel
+
+
+class Command(BaseCommand):
+    help = (
+        "Convierte los pesos (.npz) y el vocabulario (.json) al formato plano de arrays .npy "
+        "que se abre con mmap, para que todos los procesos del servidor compartan una sola "
+        "copia en la caché de páginas, y verifica que producen los mismos resultados."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--weights', help="Pesos de origen (por defecto AppIA/modelo_emociones.npz)")
+        parser.add_argument('--tokenizer', help="Vocabulario de origen (por defecto AppIA/tokenizer_vocab.json)")
+        parser.add_argument('--weights-output', help="Directorio de salida de los pesos (por defecto AppIA/modelo_emociones_npy)")
+        parser.add_argument('--tokenizer-output',
+                            help="Directorio de salida del vocabulario (por defecto AppIA/tokenizer_vocab_npy)")
+
+    def handle(self, *args, **options):
+        from AppIA import ml
+        from AppIA.benchmarks import synthetic_texts
+
+        weights_source = options['weights'] or ml.weights_path
+        tokenizer_source = options['tokenizer'] or ml.vocab_path
+        weights_output = options['weights_output'] or ml.weights_flat_path
+        tokenizer_output = options['tokenizer_output'] or ml.vocab_flat_path
+
+        try:
+            model = NumpyEmotionModel.load(weights_source)
+            tokenizer = VocabTokenizer.load(tokenizer_source)
+        except (IOError, KeyError, ValueError) as e:
+            raise CommandError(f"No se pudieron cargar los artefactos de origen: {e}")
+
+        model.save_flat(weights_output)
+        tokenizer.save_flat(tokenizer_output)
+        self.stdout.write(f"Pesos exportados a {weights_output} ({model.precision})")
+        self.stdout.write(f"Vocabulario exportado a {tokenizer_output} ({len(tokenizer.word_index)} palabras)")
+
+        # Verificación de paridad con textos sintéticos (incluye palabras desconocidas)
+        flat_model = NumpyEmotionModel.load(weights_output)
+        flat_tokenizer = VocabTokenizer.load(tokenizer_output)
+        texts = synthetic_texts(2000) + ['', '¿qué?', 'Ñandú ÁRBOL desconocida', '<unk> hola']
+
+        if flat_tokenizer.texts_to_sequences(texts) != tokenizer.texts_to_sequences(texts):
+            raise CommandError("El vocabulario exportado no reproduce las secuencias originales.")
+
+        sequences = tokenizer.encode_batch(texts, ml.MAX_SEQUENCE_LENGTH)
+        if not np.array_equal(flat_model.predict_on_batch(sequences), model.predict_on_batch(sequences)):
+            raise CommandError("Los pesos exportados no reproducen las probabilidades originales.")
+        self.stdout.write(self.style.SUCCESS(f"Paridad verificada con {len(texts)} textos."))
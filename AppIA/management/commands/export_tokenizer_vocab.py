@@ -0,0 +1,70 @@
+import os
+import pickle
+import shutil
+
+from django.core.management.base import BaseCommand, CommandError
+
+from AppIA.fast_tokenizer import VocabTokenizer
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporta el vocabulario de tokenizer.pickle (recortado a num_words) a "
+        "tokenizer_vocab.json para el tokenizador de ejecución, y verifica que "
+        "produce las mismas secuencias que el Tokenizer de Keras."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pickle', help="Ruta del Tokenizer de Keras (por defecto AppIA/tokenizer.pickle)")
+        parser.add_argument('--output', help="Ruta del JSON de salida (por defecto AppIA/tokenizer_vocab.json)")
+
+    def handle(self, *args, **options):
+        from AppIA import ml
+
+        pickle_path = options['pickle'] or os.path.join(ml.BASE_DIR, 'tokenizer.pickle')
+        vocab_path = options['output'] or ml.vocab_path
+
+        # Deserializar el Tokenizer de Keras requiere tener Keras instalado
+        try:
+            with open(pickle_path, 'rb') as handle:
+                keras_tokenizer = pickle.load(handle)
+        except (IOError, pickle.UnpicklingError, ImportError) as e:
+            raise CommandError(f"No se pudo cargar el tokenizador: {e}")
+
+        try:
+            vocab_tokenizer = VocabTokenizer.from_keras(keras_tokenizer)
+        except ValueError as e:
+            raise CommandError(str(e))
+        vocab_tokenizer.save(vocab_path)
+        self.stdout.write(
+            f"Vocabulario exportado a {vocab_path} "
+            f"({len(vocab_tokenizer.word_index)} de {len(keras_tokenizer.word_index)} palabras)."
+        )
+        # La copia plana (mapeada en memoria) tiene prioridad al cargar; se
+        # regenera en un directorio temporal y solo reemplaza a la anterior si
+        # también reproduce las secuencias de Keras
+        staging_dir = None
+        if os.path.abspath(vocab_path) == os.path.abspath(ml.vocab_path):
+            staging_dir = ml.staging_flat_dir(ml.vocab_flat_path)
+            vocab_tokenizer.save_flat(staging_dir)
+
+        # Verificación de paridad con textos de ejemplo y con el propio vocabulario
+        loaded = [VocabTokenizer.load(vocab_path)]
+        if staging_dir is not None:
+            loaded.append(VocabTokenizer.load(staging_dir))
+        samples = [
+            'Hola, ¿cómo estás?', 'TE VOY A MATAR!!!', 'dame dinero o publico tus fotos',
+            'La reunión de hoy fue muy productiva y el equipo trabajó bien.',
+            'palabra-desconocida\tcon\nfiltros <unk> y   espacios', '',
+        ] + [' '.join(list(keras_tokenizer.word_index)[start:start + 20])
+             for start in range(0, len(keras_tokenizer.word_index), 20)]
+
+        expected = keras_tokenizer.texts_to_sequences(samples)
+        if any(tokenizer.texts_to_sequences(samples) != expected for tokenizer in loaded):
+            if staging_dir is not None:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+            raise CommandError("El tokenizador exportado no reproduce las secuencias de Keras.")
+        if staging_dir is not None:
+            ml.install_flat_copy(staging_dir, ml.vocab_flat_path)
+            self.stdout.write(f"Vocabulario exportado a {ml.vocab_flat_path} (mapeado en memoria)")
+        self.stdout.write(self.style.SUCCESS(f"Paridad verificada con {len(samples)} textos."))
@@ -0,0 +1,66 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Clasifica una muestra de mensajes con las métricas por etapa activadas y muestra "
+        "conteos, latencias e histogramas de tokenizar, modelo y reglas, junto con la regla "
+        "que decidió cada mensaje. Para las métricas del servidor web en ejecución, usar "
+        "/management/metrics/inferencia/ con EMOTION_METRICS_ENABLED = True."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2000, help="Cantidad de mensajes de la muestra")
+        parser.add_argument('--from-db', action='store_true',
+                            help="Usar los mensajes más recientes de la base de datos en lugar de sintéticos")
+        parser.add_argument('--batch-size', type=int, help="Tamaño de lote (por defecto EMOTION_BATCH_SIZE)")
+        parser.add_argument('--json', action='store_true', help="Mostrar el resultado completo en JSON")
+
+    def handle(self, *args, **options):
+        from AppIA import ml
+        from AppIA.benchmarks import generate_spanish_messages
+        from AppIA.models import Message
+
+        if ml.get_model_bundle() is None:
+            raise CommandError("El modelo o el tokenizador no están cargados.")
+
+        if options['from_db']:
+            texts = list(Message.objects.order_by('-id').values_list('content', flat=True)[:options['messages']])
+        else:
+            texts = generate_spanish_messages(options['messages'], 1, 30)
+        if not texts:
+            raise CommandError("No hay mensajes para clasificar.")
+
+        ml.enable_metrics()
+        ml.PREDICTION_CACHE.clear()
+        results = ml.predict_emotion_batch(texts, batch_size=options['batch_size'])
+        if isinstance(results, str):
+            raise CommandError(results)
+        metrics = ml.get_inference_metrics()
+        metrics['despachador'] = ml.get_inference_dispatcher().stats()
+
+        if options['json']:
+            self.stdout.write(json.dumps(metrics, ensure_ascii=False, indent=2))
+            return
+
+        self.stdout.write(f"{len(texts)} mensajes clasificados con el modelo {ml.MODEL_VERSION}")
+        self.stdout.write(f"{'etapa':22} {'llamadas':>8} {'mensajes':>9} {'total ms':>10} {'µs/msg':>8} {'máx ms':>8}")
+        for stage, stats in metrics['stages'].items():
+            self.stdout.write(
+                f"{stage:22} {stats['calls']:8d} {stats['messages']:9d} {stats['total_ms']:10.2f} "
+                f"{stats['mean_us_per_message']:8.2f} {stats['max_ms']:8.2f}"
+            )
+        self.stdout.write("Regla que decidió cada mensaje:")
+        for rule, count in metrics['rules'].items():
+            self.stdout.write(f"  {rule:14} {count:7d}")
+        self.stdout.write(f"Rutas: {metrics['routes']}")
+        dispatcher = metrics['despachador']
+        if dispatcher['batches']:
+            self.stdout.write(
+                f"Despachador: {dispatcher['requests']} peticiones en {dispatcher['batches']} pasadas "
+                f"({dispatcher['mean_batch_size']:.1f} textos por pasada), "
+                f"textos por pasada {dispatcher['batch_size_histogram']}, "
+                f"profundidad de la cola {dispatcher['queue_depth_histogram']}"
+            )
@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Gestiona el registro de versiones del modelo (EMOTION_MODEL_REGISTRY_DIR). "
+        "Los procesos en ejecución cargan la versión activada en segundo plano, sin reiniciarse."
+    )
+
+    def add_arguments(self, parser):
+        subparsers = parser.add_subparsers(dest='action', required=True)
+
+        subparsers.add_parser('list', help="Muestra las versiones registradas y la activa")
+
+        register = subparsers.add_parser('register', help="Registra una versión nueva copiando sus artefactos")
+        register.add_argument('version', help="Nombre de la versión (letras, números, '.', '_' o '-')")
+        register.add_argument('--weights', help="Pesos .npz o directorio .npy (por defecto los de AppIA/)")
+        register.add_argument('--tokenizer', help="Vocabulario .json o directorio .npy (por defecto el de AppIA/)")
+        register.add_argument('--keras-model', help="Modelo Keras .h5 opcional, para el backend 'keras'")
+        register.add_argument('--activate', action='store_true', help="Activar la versión al registrarla")
+
+        activate = subparsers.add_parser('activate', help="Activa una versión ya registrada")
+        activate.add_argument('version')
+
+    def handle(self, *args, **options):
+        from AppIA.model_registry import ModelRegistryError
+        from AppIA import ml
+
+        registry = ml.MODEL_REGISTRY
+        try:
+            if options['action'] == 'register':
+                # Verificar que los artefactos cargan antes de registrarlos
+                weights = options['weights'] or ml.default_weights_path()
+                tokenizer = options['tokenizer'] or ml.default_vocab_path()
+                try:
+                    ml.warm_up_bundle(ml.ModelBundle(
+                        options['version'],
+                        ml.load_inference_model('numpy', weights=weights),
+                        ml.load_tokenizer(tokenizer)[0]
+                    ))
+                except (IOError, ValueError, KeyError) as e:
+                    raise CommandError(f"Los artefactos no son válidos: {e}")
+
+                registry.register(
+                    options['version'], weights, tokenizer,
+                    keras_model=options['keras_model'], activate=options['activate']
+                )
+                self.stdout.write(self.style.SUCCESS(f"Versión {options['version']} registrada."))
+            elif options['action'] == 'activate':
+                registry.activate(options['version'])
+                self.stdout.write(self.style.SUCCESS(f"Versión {options['version']} activada."))
+        except ModelRegistryError as e:
+            raise CommandError(str(e))
+
+        manifest = registry.read_manifest()
+        if not manifest['versions']:
+            self.stdout.write(f"No hay versiones registradas en {registry.root}; se usan los artefactos de AppIA/.")
+            return
+        for version, entry in sorted(manifest['versions'].items(), key=lambda item: item[1]['registered_at']):
+            marker = '*' if version == manifest['active'] else ' '
+            self.stdout.write(f" {marker} {version}  {entry['registered_at']}  {', '.join(sorted(entry['artifacts']))}")
@@ -0,0 +1,103 @@
+import csv
+import os
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from AppIA.numpy_engine import WEIGHT_PRECISIONS, NumpyEmotionModel
+
+
+class Command(BaseCommand):
+    help = (
+        "Convierte los pesos float32 del backend NumPy a float16 o int8 (con una escala "
+        "por fila de embeddings) e informa la diferencia de exactitud respecto a float32 "
+        "en un conjunto de validación, para elegir la precisión de cada despliegue."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--weights', help="Pesos float32 de origen (por defecto AppIA/modelo_emociones.npz)")
+        parser.add_argument('--precision', choices=WEIGHT_PRECISIONS[1:], action='append',
+                            help="Precisión a generar; se puede repetir (por defecto float16 e int8)")
+        parser.add_argument('--output-dir', help="Directorio donde escribir modelo_emociones.<precisión>.npz")
+        parser.add_argument('--holdout',
+                            help="CSV de validación con columnas 'texto' y 'etiqueta' (nombre o índice de clase)")
+        parser.add_argument('--messages', type=int, default=5000,
+                            help="Textos sintéticos a comparar si no se indica --holdout")
+
+    def handle(self, *args, **options):
+        from AppIA import ml
+        from AppIA.benchmarks import synthetic_texts
+
+        bundle = ml.get_model_bundle()
+        if bundle is None:
+            raise CommandError("El tokenizador no está cargado.")
+
+        source_path = options['weights'] or ml.weights_path
+        try:
+            reference = NumpyEmotionModel.load(source_path)
+        except (IOError, KeyError, ValueError) as e:
+            raise CommandError(f"No se pudieron cargar los pesos: {e}")
+        if reference.precision != 'float32':
+            raise CommandError("Los pesos de origen deben estar en float32.")
+
+        texts, labels = self._load_holdout(options['holdout'], ml) if options['holdout'] else (
+            synthetic_texts(options['messages']), None)
+        self.stdout.write(
+            f"Conjunto de comparación: {len(texts)} textos "
+            f"({'con etiquetas' if labels is not None else 'sintéticos, sin etiquetas'})"
+        )
+
+        reference_bundle = ml.ModelBundle('float32', reference, bundle.tokenizer)
+        reference_probs = ml.predict_probabilities(texts, ml.DEFAULT_BATCH_SIZE, bundle=reference_bundle)
+        reference_results = ml.predict_emotion_batch(texts, bundle=reference_bundle)
+        self._report('float32', reference, reference_probs, reference_probs, reference_results, reference_results, labels)
+
+        output_dir = options['output_dir'] or os.path.dirname(source_path)
+        for precision in options['precision'] or WEIGHT_PRECISIONS[1:]:
+            candidate = reference.with_precision(precision)
+            candidate_bundle = ml.ModelBundle(precision, candidate, bundle.tokenizer)
+            candidate_probs = ml.predict_probabilities(texts, ml.DEFAULT_BATCH_SIZE, bundle=candidate_bundle)
+            candidate_results = ml.predict_emotion_batch(texts, bundle=candidate_bundle)
+            self._report(precision, candidate, reference_probs, candidate_probs,
+                         reference_results, candidate_results, labels)
+
+            output_path = os.path.join(output_dir, f'modelo_emociones.{precision}.npz')
+            candidate.save(output_path)
+            self.stdout.write(f"    Guardado en {output_path}")
+
+        self.stdout.write(
+            "Para usar una precisión, registra su archivo con "
+            "'python manage.py model_registry register <versión> --weights <archivo> --activate'."
+        )
+
+    def _load_holdout(self, path, ml):
+        label_indices = {name: index for index, name in ml.EMOTION_LABELS.items()}
+        texts, labels = [], []
+        try:
+            with open(path, encoding='utf-8', newline='') as handle:
+                for row in csv.DictReader(handle):
+                    label = row['etiqueta'].strip()
+                    texts.append(row['texto'])
+                    labels.append(ml.EMOTION_LABELS[int(label)] if label.isdigit() else label)
+        except (IOError, KeyError, ValueError) as e:
+            raise CommandError(f"No se pudo leer el conjunto de validación: {e}")
+
+        unknown = set(labels) - set(label_indices)
+        if unknown:
+            raise CommandError(f"Etiquetas desconocidas en el conjunto de validación: {', '.join(sorted(unknown))}")
+        return texts, labels
+
+    def _report(self, precision, model, reference_probs, probs, reference_results, results, labels):
+        model_agreement = float((probs.argmax(axis=1) == reference_probs.argmax(axis=1)).mean())
+        final_agreement = np.mean([
+            result['etiqueta'] == reference['etiqueta'] for result, reference in zip(results, reference_results)
+        ])
+        line = (
+            f"  {precision:8} pesos {model.nbytes / 1024:8.1f} KiB | "
+            f"dif. máx. probabilidades {float(np.abs(probs - reference_probs).max()):.2e} | "
+            f"coincidencia con float32: modelo {model_agreement:.2%}, con reglas {final_agreement:.2%}"
+        )
+        if labels is not None:
+            accuracy = np.mean([result['etiqueta'] == label for result, label in zip(results, labels)])
+            line += f" | exactitud {accuracy:.2%}"
+        self.stdout.write(line)
@@ -0,0 +1,47 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Proceso de trabajos de análisis en segundo plano: toma los AnalysisJob pendientes "
+        "(o los abandonados por un proceso caído) y los ejecuta, guardando el avance con cada "
+        "parte de mensajes. Se pueden ejecutar varios a la vez, en una o varias máquinas; con "
+        "EMOTION_ANALYSIS_DISTRIBUTED todos colaboran en el mismo trabajo por rangos de IDs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help="Terminar cuando no queden trabajos pendientes en lugar de seguir esperando")
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help="Segundos entre consultas cuando no hay trabajos (por defecto 2)")
+        parser.add_argument('--chunk-size', type=int,
+                            help="Mensajes por parte (por defecto EMOTION_ANALYSIS_CHUNK_SIZE)")
+        parser.add_argument('--processes', type=int, default=1,
+                            help="Procesos de trabajos a lanzar en esta máquina (por defecto 1)")
+
+    def handle(self, *args, **options):
+        from AppIA.analysis_jobs import run_worker, worker_name
+        from AppIA.parallel_analysis import run_jobs_in_process
+
+        worker_options = {
+            'poll_interval': options['poll_interval'], 'once': options['once'], 'chunk_size': options['chunk_size'],
+        }
+        processes = options['processes']
+        if processes <= 1:
+            self.stdout.write(f"Proceso de trabajos {worker_name()} iniciado.")
+            executed = run_worker(**worker_options)
+        else:
+            self.stdout.write(f"Lanzando {processes} procesos de trabajos.")
+            settings_module = os.environ.get('DJANGO_SETTINGS_MODULE', 'AplicacionSentimientos.settings')
+            # Las conexiones abiertas no deben heredarse en los procesos hijos
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                futures = [
+                    pool.submit(run_jobs_in_process, settings_module, **worker_options) for _ in range(processes)
+                ]
+                executed = sum(future.result() for future in futures)
+        self.stdout.write(self.style.SUCCESS(f"{executed} trabajos y rangos ejecutados."))
@@ -0,0 +1,130 @@
+# AppIA/micro_batching.py
+"""
+Cola con micro-lotes, base del despachador de inferencia (ml.py) y del
+análisis al escribir (live_analysis.py).
+
+Un hilo de fondo por proceso toma el primer elemento pendiente y sigue
+juntando hasta que el lote suma `max_batch_size` (cada elemento pesa lo que
+diga `_size_of`) o hasta que pasan `max_wait_ms` milisegundos desde el
+primero; después procesa el lote completo con `_process`. Con
+`background=False` no arranca el hilo y la cola se procesa al llamar a
+`drain` (consola, pruebas).
+
+Se lleva un histograma del tamaño de cada lote y de la profundidad de la cola
+al formarlo, en potencias de 2 para que sea compacto.
+"""
+import os
+import queue
+import threading
+import time
+from collections import Counter
+
+
+def power_of_two_bucket(value):
+    """Menor potencia de 2 mayor o igual que `value` (intervalo del histograma)."""
+    bucket = 1
+    while bucket < value:
+        bucket *= 2
+    return bucket
+
+
+class MicroBatcher:
+    """
+    Cola en memoria con un hilo de fondo que la procesa en micro-lotes.
+    Las subclases implementan `_process(lote)` y, si hace falta, `_size_of`,
+    `_batch_failed` y `_before_background_batch`.
+    """
+
+    thread_name = 'micro-lotes'
+
+    def __init__(self, max_batch_size, max_wait_ms, background=True):
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.background = background
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        # Histogramas: tamaño de cada lote y profundidad de la cola al formarlo
+        self.batch_size_histogram = Counter()
+        self.queue_depth_histogram = Counter()
+
+    def _ensure_started(self):
+        # Los hilos no sobreviven a un fork: cada proceso arranca el suyo
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+            self._thread.start()
+
+    def put(self, item):
+        if self.background:
+            self._ensure_started()
+        self._queue.put(item)
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def _size_of(self, item):
+        """Cuánto aporta `item` al tamaño del lote."""
+        return 1
+
+    def _collect_batch(self, block=True):
+        batch = [self._queue.get(block=block)]
+        size = self._size_of(batch[0])
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic() if block else 0
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += self._size_of(item)
+
+        with self._lock:
+            self.batch_size_histogram[power_of_two_bucket(size)] += 1
+            self.queue_depth_histogram[power_of_two_bucket(len(batch) + self._queue.qsize())] += 1
+        return batch
+
+    def _process(self, batch):
+        raise NotImplementedError
+
+    def _batch_failed(self, batch, error):
+        """Error inesperado al procesar un lote en el hilo de fondo."""
+        print(f"Error en el hilo '{self.thread_name}': {error}")
+
+    def _before_background_batch(self):
+        """Se llama en el hilo de fondo antes de procesar cada lote."""
+
+    def drain(self):
+        """Procesa en este hilo todo lo que haya en la cola; devuelve cuántos elementos."""
+        processed = 0
+        while True:
+            try:
+                batch = self._collect_batch(block=False)
+            except queue.Empty:
+                return processed
+            self._process(batch)
+            processed += len(batch)
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            try:
+                self._before_background_batch()
+                self._process(batch)
+            except Exception as e:
+                self._batch_failed(batch, e)
+
+    def batching_stats(self):
+        """Profundidad actual de la cola e histogramas acumulados."""
+        with self._lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'batch_size_histogram': dict(sorted(self.batch_size_histogram.items())),
+                'queue_depth_histogram': dict(sorted(self.queue_depth_histogram.items())),
+            }
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('AppIA', '0002_conversationanalysisreport_messageanalysis'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredPrediction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64, unique=True)),
+                ('model_version', models.CharField(max_length=64)),
+                ('emotion_label', models.CharField(max_length=50)),
+                ('confidence', models.FloatField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Predicción Almacenada',
+                'verbose_name_plural': 'Predicciones Almacenadas',
+            },
+        ),
+    ]
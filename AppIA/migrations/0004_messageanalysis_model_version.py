@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('AppIA', '0003_storedprediction'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='messageanalysis',
+            name='model_version',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
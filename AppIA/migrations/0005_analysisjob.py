@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('AppIA', '0004_messageanalysis_model_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('status', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_curso', 'En curso'), ('completado', 'Completado'), ('error', 'Error')], default='pendiente', max_length=20)),
+                ('incremental', models.BooleanField(default=True)),
+                ('total', models.IntegerField(default=0)),
+                ('processed', models.IntegerField(default=0)),
+                ('skipped', models.IntegerField(default=0)),
+                ('last_message_id', models.BigIntegerField(blank=True, null=True)),
+                ('analysis_data', models.JSONField(default=dict)),
+                ('routes', models.JSONField(default=dict)),
+                ('worker', models.CharField(blank=True, default='', max_length=100)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('processed_at_start', models.IntegerField(default=0)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='analysis_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Trabajo de Análisis',
+                'verbose_name_plural': 'Trabajos de Análisis',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('AppIA', '0005_analysisjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlaggedMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(choices=[('critical_violence', 'Acoso/Violencia'), ('critical_extortion', 'Extorsión')], max_length=20)),
+                ('matched_keywords', models.CharField(max_length=255)),
+                ('flagged_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('reviewed', models.BooleanField(default=False)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='flagged_messages', to='AppIA.conversation')),
+                ('message', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='flag', to='AppIA.message')),
+            ],
+            options={
+                'verbose_name': 'Mensaje Señalado',
+                'verbose_name_plural': 'Mensajes Señalados',
+                'ordering': ['-flagged_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('AppIA', '0006_flaggedmessage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysisjob',
+            name='sharded',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='analysisjob',
+            name='shard_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='AnalysisShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_message_id', models.BigIntegerField()),
+                ('last_message_id', models.BigIntegerField()),
+                ('status', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_curso', 'En curso'), ('completado', 'Completado')], default='pendiente', max_length=20)),
+                ('worker', models.CharField(blank=True, default='', max_length=100)),
+                ('lease_expires_at', models.DateTimeField(blank=True, null=True)),
+                ('checkpoint_id', models.BigIntegerField(blank=True, null=True)),
+                ('processed', models.IntegerField(default=0)),
+                ('analysis_data', models.JSONField(default=dict)),
+                ('routes', models.JSONField(default=dict)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='AppIA.analysisjob')),
+            ],
+            options={
+                'verbose_name': 'Parte de Análisis',
+                'verbose_name_plural': 'Partes de Análisis',
+                'ordering': ['job', 'first_message_id'],
+            },
+        ),
+    ]
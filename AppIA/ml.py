@@ -1,32 +1,224 @@
 # AppIA/ml.py
-import tensorflow as tf
-from tensorflow import keras
-from tensorflow.keras.preprocessing.text import Tokenizer
-from tensorflow.keras.utils import pad_sequences
 import numpy as np
+import hashlib
 import pickle
 import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .keyword_matcher import KeywordMatcher
+from .micro_batching import MicroBatcher
+from .fast_tokenizer import VocabTokenizer
+from .instrumentation import InferenceMetrics
+from .model_registry import ModelBundle, ModelRegistry, ModelRegistryError
+from .numpy_engine import NumpyEmotionModel
+from .prediction_cache import PredictionCache
 
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+
+def _get_setting(name, default):
+    """
+    Lee un parámetro de settings.py, usando el valor por defecto si no existe
+    o si el módulo se importa fuera de Django (scripts, consola).
+    """
+    try:
+        return getattr(settings, name, default)
+    except ImproperlyConfigured:
+        return default
+
+def file_version(*paths):
+    """
+    Huella corta (sha1) del contenido de uno o varios artefactos. Un directorio
+    cuenta como el nombre y el contenido de sus archivos, en orden.
+    """
+    digest = hashlib.sha1()
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(os.listdir(path))
+            digest.update('\0'.join(files).encode('utf-8'))
+            files = [os.path.join(path, name) for name in files]
+        else:
+            files = [path]
+        for file_path in files:
+            with open(file_path, 'rb') as handle:
+                for block in iter(lambda: handle.read(1 << 20), b''):
+                    digest.update(block)
+    return digest.hexdigest()[:12]
+
+def content_version(model, tokenizer, model_file=None):
+    """
+    Huella corta del contenido del modelo y del vocabulario cargados. No depende
+    del formato (.npz/.json o copia plana .npy), así que la versión, y con ella
+    la caché y los análisis guardados, sigue siendo la misma al cambiar de uno a
+    otro. Un modelo sin `fingerprint` (Keras) usa la huella de su archivo.
+    """
+    model_part = model.fingerprint() if hasattr(model, 'fingerprint') else file_version(model_file)
+    digest = hashlib.sha1(f'{model_part}:{tokenizer.fingerprint()}'.encode('utf-8'))
+    return digest.hexdigest()[:12]
+
+def _mmap_artifacts_enabled():
+    return _get_setting('EMOTION_MMAP_ARTIFACTS', True)
+
+# Copias planas desactualizadas de las que ya se avisó
+_stale_flat_warned = set()
+
+def _use_flat_artifact(flat_dir, source_path):
+    """
+    Indica si se usa la copia plana `flat_dir` en lugar de `source_path`: solo
+    si existe y no es más antigua que su origen, para no servir pesos o un
+    vocabulario desactualizados tras volver a exportar el .npz o el .json.
+    El aviso se muestra una sola vez por copia y proceso.
+    """
+    if not _mmap_artifacts_enabled() or not os.path.isdir(flat_dir):
+        return False
+    flat_config = os.path.join(flat_dir, 'config.json')
+    if (os.path.exists(source_path) and os.path.exists(flat_config)
+            and os.path.getmtime(source_path) > os.path.getmtime(flat_config)):
+        if flat_dir in _stale_flat_warned:
+            return False
+        _stale_flat_warned.add(flat_dir)
+        print(f"Aviso: '{os.path.basename(flat_dir)}' es más antiguo que '{os.path.basename(source_path)}'; "
+              f"se usa '{os.path.basename(source_path)}' (regenera la copia con "
+              f"'python manage.py export_mmap_artifacts').")
+        return False
+    return True
+
+def staging_flat_dir(flat_dir):
+    """Directorio temporal, junto a `flat_dir`, donde se escribe una copia plana antes de verificarla."""
+    parent = os.path.dirname(os.path.abspath(flat_dir))
+    return tempfile.mkdtemp(prefix=f'.{os.path.basename(flat_dir)}-', dir=parent)
+
+def install_flat_copy(staging_dir, flat_dir):
+    """
+    Reemplaza `flat_dir` por la copia ya verificada en `staging_dir` con dos
+    renombrados en el mismo directorio, sin dejar nunca una copia a medio escribir.
+    """
+    previous = None
+    if os.path.isdir(flat_dir):
+        previous = f'{staging_dir}-anterior'
+        os.rename(flat_dir, previous)
+    os.rename(staging_dir, flat_dir)
+    if previous is not None:
+        shutil.rmtree(previous, ignore_errors=True)
+
 #  Cargar el tokenizador (necesario para preprocesar el texto)
 # Es CRUCIAL usar el mismo tokenizador con el que se entrenó el modelo.
-try:
-    with open(os.path.join(BASE_DIR, 'tokenizer.pickle'), 'rb') as handle:
-        tokenizer = pickle.load(handle)
-except FileNotFoundError:
-    print("Error: No se encontró el archivo 'tokenizer.pickle'. Asegúrate de que existe.")
-    tokenizer = None
-
-#  Cargar el modelo de Keras previamente entrenado
+# Se usa el vocabulario exportado en formato plano (mapeado en memoria, con
+# EMOTION_MMAP_ARTIFACTS) o en JSON, que no necesitan Keras; si no existen,
+# se convierte el Tokenizer serializado de Keras (tokenizer.pickle).
+vocab_path = os.path.join(BASE_DIR, 'tokenizer_vocab.json')
+vocab_flat_path = os.path.join(BASE_DIR, 'tokenizer_vocab_npy')
+tokenizer_pickle_path = os.path.join(BASE_DIR, 'tokenizer.pickle')
+
+def default_vocab_path():
+    """Vocabulario de AppIA/ que se usa sin registro de versiones."""
+    if _use_flat_artifact(vocab_flat_path, vocab_path):
+        return vocab_flat_path
+    return vocab_path
+
+def load_tokenizer(path=None):
+    """Carga el tokenizador de ejecución y devuelve (tokenizador, ruta del artefacto)."""
+    if path is None:
+        path = default_vocab_path()
+    if os.path.exists(path):
+        return VocabTokenizer.load(path), path
+
+    print("Aviso: no se encontró 'tokenizer_vocab.json'; se usa 'tokenizer.pickle', que requiere Keras "
+          "(genera el JSON con 'python manage.py export_tokenizer_vocab').")
+    with open(tokenizer_pickle_path, 'rb') as handle:
+        return VocabTokenizer.from_keras(pickle.load(handle)), tokenizer_pickle_path
+
+#  Cargar el modelo previamente entrenado
+# Backends disponibles (EMOTION_INFERENCE_BACKEND en settings.py):
+#   'numpy': pesos exportados (.npy mapeados en memoria o .npz), no importa TensorFlow (recomendado)
+#   'keras': modelo .h5 original, se mantiene como referencia
 model_path = os.path.join(BASE_DIR, 'modelo_emociones.h5')
-try:
-    model = keras.models.load_model(model_path)
-    print("Modelo cargado exitosamente.")
-except (IOError, ValueError) as e:
-    print(f"Error al cargar el modelo: {e}. Asegúrate de que el archivo existe y es válido.")
-    model = None
+weights_path = os.path.join(BASE_DIR, 'modelo_emociones.npz')
+weights_flat_path = os.path.join(BASE_DIR, 'modelo_emociones_npy')
+
+def default_weights_path():
+    """Pesos de AppIA/ que usa el backend NumPy sin registro de versiones."""
+    if _use_flat_artifact(weights_flat_path, weights_path):
+        return weights_flat_path
+    return weights_path
+
+def _inference_backend(backend=None):
+    return backend or _get_setting('EMOTION_INFERENCE_BACKEND', 'numpy')
+
+def load_inference_model(backend=None, weights=None, keras_model=None):
+    """
+    Carga el modelo con el backend indicado (o el configurado en settings.py).
+    Ambos backends exponen `predict_on_batch` con la misma salida.
+    """
+    backend = _inference_backend(backend)
+
+    if backend == 'numpy':
+        return NumpyEmotionModel.load(weights or default_weights_path())
+    if backend == 'keras':
+        from tensorflow import keras
+        return keras.models.load_model(keras_model or model_path)
+    raise ValueError(f"Backend de inferencia desconocido: {backend}")
+
+# Registro de versiones del modelo (EMOTION_MODEL_REGISTRY_DIR). Si no tiene
+# manifiesto se usan los artefactos de AppIA/ como hasta ahora.
+MODEL_REGISTRY = ModelRegistry(_get_setting('EMOTION_MODEL_REGISTRY_DIR', os.path.join(BASE_DIR, 'model_registry')))
+
+def load_model_bundle(version=None, backend=None):
+    """
+    Carga y precalienta el modelo y el tokenizador de una versión del registro
+    (por defecto la activa). Sin registro, usa los artefactos de AppIA/ y la
+    versión es la huella de su contenido (ver content_version).
+    """
+    backend = _inference_backend(backend)
+    if version is None:
+        version = MODEL_REGISTRY.active_version()
+
+    if version is None:
+        loaded_tokenizer, _ = load_tokenizer()
+        loaded_model = load_inference_model(backend)
+        bundle = ModelBundle(content_version(loaded_model, loaded_tokenizer, model_path), loaded_model, loaded_tokenizer)
+    else:
+        paths = MODEL_REGISTRY.artifact_paths(version)
+        if backend == 'keras' and 'keras_model' not in paths:
+            raise ModelRegistryError(f"La versión '{version}' no incluye el modelo Keras (.h5).")
+        loaded_tokenizer, _ = load_tokenizer(paths['tokenizer'])
+        loaded_model = load_inference_model(backend, weights=paths.get('weights'), keras_model=paths.get('keras_model'))
+        bundle = ModelBundle(version, loaded_model, loaded_tokenizer)
+
+    warm_up_bundle(bundle)
+    return bundle
+
+# Bundle activo (modelo + tokenizador + versión). Cada predicción toma una
+# referencia al empezar, así que reemplazarlo no afecta a las que están en curso.
+# `model`, `tokenizer` y `MODEL_VERSION` se mantienen como accesos directos
+# (valen None y 'desconocida' hasta que se carga el modelo, ver load_model).
+_bundle = None
+model = None
+tokenizer = None
+MODEL_VERSION = 'desconocida'
+
+def get_model_bundle():
+    """
+    Bundle activo en este proceso, o None si no se pudo cargar. Si todavía
+    no se cargó (carga diferida, ver AppiaConfig.ready), lo carga ahora.
+    """
+    if _bundle is None:
+        load_model()
+    return _bundle
+
+def activate_model_bundle(bundle):
+    """Reemplaza el bundle activo (una sola asignación, sin bloquear predicciones)."""
+    global _bundle, model, tokenizer, MODEL_VERSION
+    _bundle = bundle
+    model, tokenizer, MODEL_VERSION = bundle.model, bundle.tokenizer, bundle.version
 
 # Definir las etiquetas de las emociones
 EMOTION_LABELS = {
@@ -39,20 +231,27 @@ EMOTION_LABELS = {
 # Configurar parámetros del preprocesamiento
 MAX_SEQUENCE_LENGTH = 100 # La longitud máxima de las secuencias de texto
 
+# Cantidad de textos por cada pasada del modelo en la inferencia en bloque
+DEFAULT_BATCH_SIZE = 256
+
 def preprocess_text(text):
     """
     Preprocesa un texto para que el modelo lo pueda entender.
     """
-    if tokenizer is None:
+    return preprocess_batch([text])
+
+def preprocess_batch(texts, out=None):
+    """
+    Preprocesa una lista de textos en una sola matriz int32 rellenada
+    de forma (len(texts), MAX_SEQUENCE_LENGTH). Si se pasa `out`, se escribe
+    en esa matriz preasignada.
+    """
+    bundle = get_model_bundle()
+    if bundle is None:
         return None
-    
-    # Tokenizar y convertir a secuencias de números
-    sequence = tokenizer.texts_to_sequences([text])
-    
-    # Rellenar (padding) para que todas las secuencias tengan la misma longitud
-    padded_sequence = pad_sequences(sequence, maxlen=MAX_SEQUENCE_LENGTH, padding='post', truncating='post')
-    
-    return padded_sequence
+
+    # Tokenizar, truncar y rellenar al final directamente sobre la matriz
+    return bundle.tokenizer.encode_batch(list(texts), MAX_SEQUENCE_LENGTH, out=out)
 
 # Palabras clave para corrección de clasificación
 
@@ -103,66 +302,141 @@ MODERATE_EXTORTION_KEYWORDS = [
     'fotos desnuda', 'fotos desnudo', 'fotos privadas', 'nudes'
 ]
 
-def apply_keyword_correction(text, predicted_label, confidence):
+# Revisión de la lógica de las reglas; incrementarla al modificar
+# apply_rules_before_model / apply_rules_after_model
+RULES_REVISION = 1
+
+def build_keyword_matcher():
     """
-    Aplica correcciones basadas en palabras clave para mejorar la precisión.
-    Sistema híbrido INTELIGENTE: combina IA con reglas contextuales.
+    Compila el autómata con todas las listas y calcula la versión de las reglas.
+    Con EMOTION_KEYWORDS_NORMALIZE_ACCENTS se ignoran las tildes ('aléjate' = 'alejate').
+    """
+    categories = {
+        'strong_positive': STRONG_POSITIVE_KEYWORDS,
+        'mild_positive': MILD_POSITIVE_KEYWORDS,
+        'critical_violence': CRITICAL_VIOLENCE_KEYWORDS,
+        'moderate_violence': MODERATE_VIOLENCE_KEYWORDS,
+        'critical_extortion': CRITICAL_EXTORTION_KEYWORDS,
+        'moderate_extortion': MODERATE_EXTORTION_KEYWORDS,
+    }
+    matcher = KeywordMatcher(
+        categories,
+        normalize_accents=_get_setting('EMOTION_KEYWORDS_NORMALIZE_ACCENTS', False)
+    )
+    rules_source = repr((RULES_REVISION, matcher.normalize_accents, sorted(
+        (category, sorted(keywords)) for category, keywords in categories.items()
+    )))
+    return matcher, hashlib.sha1(rules_source.encode('utf-8')).hexdigest()[:12]
 
-    IMPORTANTE: Si el modelo está clasificando incorrectamente, este sistema
-    tiene prioridad para corregir errores evidentes.
+def build_critical_matcher():
     """
-    text_lower = text.lower()
+    Autómata solo con las amenazas críticas, para revisar cada mensaje al
+    enviarlo (ver live_analysis.flag_critical_message). Es más pequeño que el
+    completo y no cuenta las demás categorías.
+    """
+    return KeywordMatcher(
+        {'critical_violence': CRITICAL_VIOLENCE_KEYWORDS, 'critical_extortion': CRITICAL_EXTORTION_KEYWORDS},
+        normalize_accents=_get_setting('EMOTION_KEYWORDS_NORMALIZE_ACCENTS', False)
+    )
 
-    # Detectar palabras por nivel de intensidad y criticidad
-    strong_positive_count = sum(1 for keyword in STRONG_POSITIVE_KEYWORDS if keyword in text_lower)
-    mild_positive_count = sum(1 for keyword in MILD_POSITIVE_KEYWORDS if keyword in text_lower)
+# Autómatas compilados una sola vez al importar el módulo
+KEYWORD_MATCHER, RULES_VERSION = build_keyword_matcher()
+CRITICAL_MATCHER = build_critical_matcher()
 
-    critical_violence_count = sum(1 for keyword in CRITICAL_VIOLENCE_KEYWORDS if keyword in text_lower)
-    moderate_violence_count = sum(1 for keyword in MODERATE_VIOLENCE_KEYWORDS if keyword in text_lower)
+def refresh_keyword_rules():
+    """
+    Recompila los autómatas tras modificar las listas de palabras clave.
+    La caché de predicciones se vacía sola porque cambia RULES_VERSION.
+    """
+    global KEYWORD_MATCHER, RULES_VERSION, CRITICAL_MATCHER
+    KEYWORD_MATCHER, RULES_VERSION = build_keyword_matcher()
+    CRITICAL_MATCHER = build_critical_matcher()
 
-    critical_extortion_count = sum(1 for keyword in CRITICAL_EXTORTION_KEYWORDS if keyword in text_lower)
-    moderate_extortion_count = sum(1 for keyword in MODERATE_EXTORTION_KEYWORDS if keyword in text_lower)
+def find_critical_keywords(text):
+    """Amenazas críticas presentes en `text`: {'critical_violence': [...], 'critical_extortion': [...]}."""
+    return CRITICAL_MATCHER.matches(text)
+
+def extract_keyword_features(text):
+    """
+    Calcula lo que necesitan las reglas de corrección: cantidad de palabras
+    clave por categoría y cantidad de palabras del mensaje.
+    """
+    text_lower = text.lower()
+
+    # Detectar palabras por nivel de intensidad y criticidad (una sola pasada)
+    features = KEYWORD_MATCHER.count(text_lower)
+    features['word_count'] = len(text_lower.split())
+    return features
+
+def apply_rules_before_model(features):
+    """
+    Reglas cuyo resultado NO depende de la salida de la red neuronal.
+    Si alguna decide, devuelve (etiqueta, confianza, regla); si no, None.
+    Permite saltarse el modelo cuando su predicción sería ignorada.
+    """
+    strong_positive_count = features['strong_positive']
+    mild_positive_count = features['mild_positive']
+    critical_violence_count = features['critical_violence']
+    moderate_violence_count = features['moderate_violence']
+    critical_extortion_count = features['critical_extortion']
+    moderate_extortion_count = features['moderate_extortion']
 
     # DETECCIÓN PREVENTIVA: Si es un mensaje muy corto y simple, es probablemente neutral
-    word_count = len(text_lower.split())
-    if word_count <= 3 and critical_violence_count == 0 and critical_extortion_count == 0:
+    if features['word_count'] <= 3 and critical_violence_count == 0 and critical_extortion_count == 0:
         # Mensajes cortos como "hola", "cómo estás", "ok", etc.
         if moderate_violence_count == 0 and moderate_extortion_count == 0:
             if strong_positive_count > 0:
-                return 'Positivo', 0.85
+                return 'Positivo', 0.85, 'mensaje_corto'
             elif mild_positive_count > 0:
-                return 'Positivo', 0.75
+                return 'Positivo', 0.75, 'mensaje_corto'
             else:
-                return 'Neutral', 0.80
+                return 'Neutral', 0.80, 'mensaje_corto'
 
     # PRIORIDAD 1: Amenazas CRÍTICAS directas (forzar clasificación)
     # Ejemplos: "te mato", "te voy a golpear", "alejate de él"
     if critical_violence_count >= 1:
-        return 'Acoso/Violencia', 0.95
+        return 'Acoso/Violencia', 0.95, 'prioridad_1'
 
     # PRIORIDAD 2: Extorsión CRÍTICA directa (forzar clasificación)
     # Ejemplos: "dame dinero o...", "tengo fotos tuyas", "si no pagas"
     if critical_extortion_count >= 1:
-        return 'Extorsión', 0.95
-
-    # PRIORIDAD 3: Corregir falsos positivos evidentes
-    # Si tiene palabras fuertemente positivas y la red se equivocó
-    if strong_positive_count >= 1:
-        # Si NO hay amenazas críticas, corregir
-        if critical_violence_count == 0 and critical_extortion_count == 0:
-            if predicted_label in ['Acoso/Violencia', 'Extorsión']:
-                return 'Positivo', 0.90
+        return 'Extorsión', 0.95, 'prioridad_2'
 
     # PRIORIDAD 4: Violencia/Extorsión MODERADA (requiere contexto)
-    # Solo forzar si hay 2+ palabras moderadas (indica patrón real)
+    # Solo forzar si hay 2+ palabras moderadas (indica patrón real).
+    # Se evalúa aquí, antes que la PRIORIDAD 3, porque ambas son excluyentes:
+    # la 3 exige palabras fuertemente positivas y la 4 exige que no haya ninguna.
     if moderate_violence_count >= 2 and critical_violence_count == 0:
         # Solo si no hay señales positivas fuertes
         if strong_positive_count == 0:
-            return 'Acoso/Violencia', 0.75
+            return 'Acoso/Violencia', 0.75, 'prioridad_4'
 
     if moderate_extortion_count >= 2 and critical_extortion_count == 0:
         if strong_positive_count == 0:
-            return 'Extorsión', 0.75
+            return 'Extorsión', 0.75, 'prioridad_4'
+
+    return None
+
+def apply_rules_after_model(features, predicted_label, confidence):
+    """
+    Reglas que dependen de la etiqueta y la confianza de la red neuronal.
+    Se aplican solo si `apply_rules_before_model` no decidió.
+    Devuelve (etiqueta, confianza, regla).
+    """
+    strong_positive_count = features['strong_positive']
+    mild_positive_count = features['mild_positive']
+    critical_violence_count = features['critical_violence']
+    moderate_violence_count = features['moderate_violence']
+    critical_extortion_count = features['critical_extortion']
+    moderate_extortion_count = features['moderate_extortion']
+
+    # PRIORIDAD 3: Corregir falsos positivos evidentes
+    # Si tiene palabras fuertemente positivas y la red se equivocó
+    if strong_positive_count >= 1:
+        # Si NO hay amenazas críticas, corregir
+        if critical_violence_count == 0 and critical_extortion_count == 0:
+            if predicted_label in ['Acoso/Violencia', 'Extorsión']:
+                return 'Positivo', 0.90, 'prioridad_3'
 
     # PRIORIDAD 5: Reforzar positivos con múltiples señales
     total_positive = strong_positive_count + mild_positive_count
@@ -170,17 +444,17 @@ def apply_keyword_correction(text, predicted_label, confidence):
         # Si no hay amenazas críticas, es positivo
         if critical_violence_count == 0 and critical_extortion_count == 0:
             if predicted_label in ['Acoso/Violencia', 'Extorsión']:
-                return 'Positivo', 0.80
+                return 'Positivo', 0.80, 'prioridad_5'
 
     # PRIORIDAD 6: Ayudar a la red en casos de baja confianza
     if confidence < 0.50:
         # Solo intervenir si hay señales CLARAS
         if strong_positive_count >= 1 and critical_violence_count == 0:
-            return 'Positivo', 0.65
+            return 'Positivo', 0.65, 'prioridad_6'
         if critical_violence_count >= 1:
-            return 'Acoso/Violencia', 0.65
+            return 'Acoso/Violencia', 0.65, 'prioridad_6'
         if critical_extortion_count >= 1:
-            return 'Extorsión', 0.65
+            return 'Extorsión', 0.65, 'prioridad_6'
 
     # PRIORIDAD 7: Si la red predice violencia/extorsión pero NO hay evidencia
     # BYPASS del modelo si está clasificando mal masivamente
@@ -191,46 +465,492 @@ def apply_keyword_correction(text, predicted_label, confidence):
         if total_negative == 0:
             # No hay NINGUNA señal negativa, la red se equivocó
             if strong_positive_count > 0 or total_positive >= 1:
-                return 'Positivo', 0.70
+                return 'Positivo', 0.70, 'prioridad_7'
             else:
                 # Mensaje completamente neutral
-                return 'Neutral', 0.70
+                return 'Neutral', 0.70, 'prioridad_7'
 
     # DEFAULT: CONFIAR en la red neuronal
     # Solo corregir errores MUY evidentes, la red es buena
-    return predicted_label, confidence
+    return predicted_label, confidence, 'default'
 
-def predict_emotion(text):
+def apply_keyword_correction(text, predicted_label, confidence):
     """
-    Predice la emoción de un texto dado con corrección por palabras clave.
+    Aplica correcciones basadas en palabras clave para mejorar la precisión.
+    Sistema híbrido INTELIGENTE: combina IA con reglas contextuales.
+
+    IMPORTANTE: Si el modelo está clasificando incorrectamente, este sistema
+    tiene prioridad para corregir errores evidentes.
     """
-    if model is None or tokenizer is None:
-        return "Error en la carga del modelo o tokenizador."
+    features = extract_keyword_features(text)
+
+    decision = apply_rules_before_model(features)
+    if decision is None:
+        decision = apply_rules_after_model(features, predicted_label, confidence)
+
+    corrected_label, corrected_confidence, _ = decision
+    return corrected_label, corrected_confidence
+
+# Contadores de la ruta rápida: mensajes resueltos solo con reglas y
+# mensajes que necesitaron la red neuronal
+FAST_PATH_STATS = {'reglas': 0, 'modelo': 0}
+_fast_path_lock = threading.Lock()
+
+def _record_fast_path(rules_count, model_count):
+    with _fast_path_lock:
+        FAST_PATH_STATS['reglas'] += rules_count
+        FAST_PATH_STATS['modelo'] += model_count
+
+def get_fast_path_stats():
+    """Devuelve una copia de los contadores de la ruta rápida."""
+    with _fast_path_lock:
+        return dict(FAST_PATH_STATS)
+
+def _fast_path_enabled(fast_path):
+    if fast_path is None:
+        return _get_setting('EMOTION_FAST_PATH', True)
+    return fast_path
+
+# Caché LRU de predicciones por texto normalizado (EMOTION_PREDICTION_CACHE_SIZE)
+PREDICTION_CACHE = PredictionCache(_get_setting('EMOTION_PREDICTION_CACHE_SIZE', 10000))
+
+def normalize_cache_text(text):
+    """
+    Normaliza un texto para usarlo como clave de la caché sin cambiar su
+    clasificación: minúsculas (el tokenizador y las reglas ya las usan) y sin
+    los espacios, tabuladores o saltos de línea de los extremos.
+    """
+    return text.strip(' \t\n').lower()
+
+def _active_cache(bundle):
+    """
+    Devuelve la caché ligada a la versión de `bundle`, o None si está
+    desactivada o si `bundle` ya fue reemplazado por una versión nueva.
+    """
+    if PREDICTION_CACHE.maxsize <= 0 or bundle is not _bundle:
+        return None
+    PREDICTION_CACHE.bind_version((bundle.version, RULES_VERSION))
+    return PREDICTION_CACHE
+
+def get_prediction_cache_stats():
+    """Contadores de la caché de predicciones de este proceso."""
+    return PREDICTION_CACHE.stats()
+
+# Métricas por etapa (EMOTION_METRICS_ENABLED); None cuando están desactivadas
+INFERENCE_METRICS = InferenceMetrics() if _get_setting('EMOTION_METRICS_ENABLED', False) else None
+
+def enable_metrics(enabled=True):
+    """Activa (con contadores en cero) o desactiva las métricas en este proceso."""
+    global INFERENCE_METRICS
+    INFERENCE_METRICS = InferenceMetrics() if enabled else None
 
-    # Preprocesar el texto de entrada
-    processed_input = preprocess_text(text)
-    if processed_input is None:
+def get_inference_metrics():
+    """Métricas por etapa de este proceso, o None si están desactivadas."""
+    metrics = INFERENCE_METRICS
+    return metrics.snapshot() if metrics is not None else None
+
+def _length_bucketing_enabled(length_bucketing, bundle):
+    if length_bucketing is None:
+        length_bucketing = _get_setting('EMOTION_LENGTH_BUCKETING', True)
+    # El modelo Keras necesita siempre matrices de MAX_SEQUENCE_LENGTH columnas
+    return length_bucketing and getattr(bundle.model, 'supports_padded_length', False)
+
+def predict_probabilities(texts, batch_size, length_bucketing=None, bundle=None):
+    """
+    Probabilidades del modelo para cada texto, en una matriz (n, clases) en el
+    mismo orden que `texts`, con una pasada del modelo por lote.
+
+    Con EMOTION_LENGTH_BUCKETING los textos se agrupan por longitud y cada lote
+    se rellena solo hasta su secuencia más larga; el modelo compensa el relleno
+    omitido, así que el resultado es el mismo que con MAX_SEQUENCE_LENGTH.
+    Usa el bundle indicado o, si no se indica, el activo.
+    """
+    if bundle is None:
+        bundle = get_model_bundle()
+    if bundle is None:
+        return None
+    metrics = INFERENCE_METRICS
+    if metrics is not None:
+        started = time.perf_counter()
+
+    if not _length_bucketing_enabled(length_bucketing, bundle):
+        # Tokenizar el bloque y construir una única matriz rellenada
+        processed_input = bundle.tokenizer.encode_batch(list(texts), MAX_SEQUENCE_LENGTH)
+        if metrics is not None:
+            tokenized = time.perf_counter()
+        prediction_probs = np.concatenate([
+            np.asarray(bundle.model.predict_on_batch(processed_input[start:start + batch_size]))
+            for start in range(0, len(texts), batch_size)
+        ])
+    else:
+        batches = list(bundle.tokenizer.encode_bucketed(texts, MAX_SEQUENCE_LENGTH, batch_size))
+        if metrics is not None:
+            tokenized = time.perf_counter()
+        prediction_probs = None
+        for indices, processed_input in batches:
+            batch_probs = bundle.model.predict_on_batch(processed_input, padded_length=MAX_SEQUENCE_LENGTH)
+            if prediction_probs is None:
+                prediction_probs = np.empty((len(texts), batch_probs.shape[1]), dtype=batch_probs.dtype)
+            # Devolver cada fila a la posición original de su texto
+            prediction_probs[indices] = batch_probs
+
+    if metrics is not None:
+        metrics.record('tokenize', tokenized - started, len(texts))
+        metrics.record('forward', time.perf_counter() - tokenized, len(texts))
+    return prediction_probs
+
+def warm_up_bundle(bundle):
+    """
+    Hace una predicción de prueba por cada ruta del modelo para que las
+    reservas de memoria (y el trazado del grafo en Keras) no las pague la
+    primera petición real.
+    """
+    texts = ['hola', 'la reunión de hoy fue muy productiva']
+    predict_probabilities(texts, len(texts), length_bucketing=False, bundle=bundle)
+    predict_probabilities(texts, len(texts), length_bucketing=True, bundle=bundle)
+
+# Recarga sin reiniciar: cada EMOTION_MODEL_RELOAD_INTERVAL segundos (0 la
+# desactiva) se revisa si cambió la versión activa del manifiesto. La versión
+# nueva se carga y precalienta en un hilo de fondo y luego reemplaza al bundle
+# activo; mientras tanto las predicciones siguen usando la anterior.
+_reload_lock = threading.Lock()
+_reload_thread = None
+_last_reload_check = 0.0
+_checked_manifest_mtime = None
+
+def reload_model(version=None, background=True):
+    """
+    Carga `version` (por defecto la activa del manifiesto) y la activa al
+    terminar. Devuelve el hilo de carga, o None si ya hay una recarga en curso.
+    Si la carga falla, se mantiene el bundle actual.
+    """
+    global _reload_thread
+
+    def load_and_swap():
+        try:
+            bundle = load_model_bundle(version)
+        except (IOError, ValueError, KeyError, ModelRegistryError) as e:
+            print(f"Error al recargar el modelo: {e}. Se mantiene la versión {MODEL_VERSION}.")
+            return
+        activate_model_bundle(bundle)
+        print(f"Modelo versión {bundle.version} activado.")
+
+    with _reload_lock:
+        if _reload_thread is not None and _reload_thread.is_alive():
+            return None
+        _reload_thread = threading.Thread(target=load_and_swap, name='model-reload', daemon=True)
+        if background:
+            _reload_thread.start()
+        else:
+            _reload_thread.run()
+        return _reload_thread
+
+def check_model_version():
+    """
+    Revisa (como mucho una vez por intervalo) si el manifiesto cambió de
+    versión activa y, en ese caso, inicia la recarga en segundo plano.
+    Es barato: normalmente solo compara la hora y, a lo sumo, hace un stat.
+    """
+    global _last_reload_check, _checked_manifest_mtime
+    interval = _get_setting('EMOTION_MODEL_RELOAD_INTERVAL', 30)
+    now = time.monotonic()
+    if not interval or now - _last_reload_check < interval:
+        return
+    _last_reload_check = now
+
+    manifest_mtime = MODEL_REGISTRY.manifest_mtime()
+    if manifest_mtime is None or manifest_mtime == _checked_manifest_mtime:
+        return
+    _checked_manifest_mtime = manifest_mtime
+
+    active_version = MODEL_REGISTRY.active_version()
+    if active_version is not None and active_version != MODEL_VERSION:
+        reload_model(active_version)
+
+# Carga inicial: importar este módulo no carga el modelo. AppiaConfig.ready
+# llama a load_model al arrancar el servidor web o los procesos de análisis;
+# en los demás comandos (migrate, shell...) se carga con la primera predicción.
+_load_lock = threading.Lock()
+_load_attempted = False
+
+def load_model():
+    """
+    Carga y precalienta el bundle activo la primera vez que se llama en el
+    proceso; las siguientes llamadas no hacen nada. Devuelve el bundle, o None
+    si no se pudo cargar (el error se informa una sola vez).
+    """
+    global _load_attempted, _checked_manifest_mtime
+    if _load_attempted or _bundle is not None:
+        return _bundle
+
+    with _load_lock:
+        if _load_attempted or _bundle is not None:
+            return _bundle
+        try:
+            _checked_manifest_mtime = MODEL_REGISTRY.manifest_mtime()
+            activate_model_bundle(load_model_bundle())
+            print("Modelo cargado exitosamente.")
+        except FileNotFoundError as e:
+            print(f"Error: No se encontró el archivo '{os.path.basename(e.filename or '')}'. Asegúrate de que existe "
+                  "(el archivo .npz se genera con 'python manage.py export_inference_weights').")
+        except (IOError, ValueError, KeyError, ModelRegistryError) as e:
+            print(f"Error al cargar el modelo: {e}. Asegúrate de que el archivo existe y es válido.")
+        _load_attempted = True
+    return _bundle
+
+def _reset_locks_after_fork():
+    # Si el proceso padre se bifurcó con un lock tomado o con una recarga en
+    # curso, el hijo no hereda el hilo: empieza con locks nuevos y sin recarga
+    global _load_lock, _reload_lock, _reload_thread
+    _load_lock = threading.Lock()
+    _reload_lock = threading.Lock()
+    _reload_thread = None
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_locks_after_fork)
+
+def _classify_texts(texts, batch_size, fast_path, bundle):
+    """
+    Núcleo de la clasificación: reglas previas, modelo por lotes para los
+    pendientes y reglas posteriores. Devuelve una lista de tuplas
+    (etiqueta, confianza, regla, ruta) o un mensaje de error.
+    """
+    metrics = INFERENCE_METRICS
+    if metrics is not None:
+        started = time.perf_counter()
+
+    # Evaluar primero las reglas que no dependen del modelo
+    features = [extract_keyword_features(text) for text in texts]
+    if _fast_path_enabled(fast_path):
+        decisions = [apply_rules_before_model(feature) for feature in features]
+    else:
+        decisions = [None] * len(texts)
+    pending = [index for index, decision in enumerate(decisions) if decision is None]
+    _record_fast_path(len(texts) - len(pending), len(pending))
+
+    outcomes = [decision + ('reglas',) if decision else None for decision in decisions]
+    if metrics is not None:
+        rules_seconds = time.perf_counter() - started
+    if not pending:
+        if metrics is not None:
+            metrics.record('rules', rules_seconds, len(texts))
+        return outcomes
+
+    prediction_probs = _model_probabilities([texts[index] for index in pending], batch_size, bundle)
+    if prediction_probs is None:
         return "Error en el preprocesamiento."
 
-    # Realizar la predicción
-    # 'predict' devuelve un array de probabilidades para cada clase
-    prediction_probs = model.predict(processed_input, verbose=0)
+    if metrics is not None:
+        started = time.perf_counter()
+    predicted_indices = np.argmax(prediction_probs, axis=1)
+    confidences = prediction_probs[np.arange(len(pending)), predicted_indices]
 
-    # Obtener el índice de la clase con la mayor probabilidad
-    predicted_class_index = np.argmax(prediction_probs, axis=1)[0]
+    for index, class_index, confidence in zip(pending, predicted_indices, confidences):
+        predicted_label = EMOTION_LABELS.get(int(class_index), 'Desconocido')
+        decision = apply_rules_before_model(features[index])
+        if decision is None:
+            decision = apply_rules_after_model(features[index], predicted_label, float(confidence))
+        outcomes[index] = decision + ('modelo',)
 
-    # Obtener la etiqueta de la emoción
-    predicted_label = EMOTION_LABELS.get(predicted_class_index, 'Desconocido')
+    if metrics is not None:
+        metrics.record('rules', rules_seconds + time.perf_counter() - started, len(texts))
+    return outcomes
 
-    # Obtener la probabilidad de la predicción
-    confidence = prediction_probs[0][predicted_class_index]
+def _model_probabilities(texts, batch_size, bundle):
+    """
+    Etapa del modelo de _classify_texts. Con EMOTION_USE_DISPATCHER los textos
+    pasan por el despachador del proceso, que junta en una sola pasada los de
+    las llamadas concurrentes (vistas, análisis al escribir, análisis general).
+    """
+    if _get_setting('EMOTION_USE_DISPATCHER', False):
+        return get_inference_dispatcher().submit(texts, batch_size, bundle).result()
+    return predict_probabilities(texts, batch_size, bundle=bundle)
 
-    # Aplicar corrección basada en palabras clave
-    corrected_label, corrected_confidence = apply_keyword_correction(
-        text, predicted_label, float(confidence)
-    )
+def predict_emotion(text, fast_path=None):
+    """
+    Predice la emoción de un texto dado con corrección por palabras clave.
+    Con la ruta rápida (EMOTION_FAST_PATH) no se llama al modelo si una regla
+    ya decide el resultado sin importar lo que prediga la red.
+    """
+    results = predict_emotion_batch([text], fast_path=fast_path)
+    if isinstance(results, str):
+        return results
+    result = results[0]
 
     return {
-        'etiqueta': corrected_label,
-        'confianza': corrected_confidence
-    }
\ No newline at end of file
+        'etiqueta': result['etiqueta'],
+        'confianza': result['confianza']
+    }
+
+def predict_emotion_batch(texts, batch_size=None, fast_path=None, bundle=None):
+    """
+    Predice la emoción de una lista de textos con una sola llamada al modelo
+    por cada lote, aplicando la corrección por palabras clave fila por fila.
+
+    Los textos repetidos (tras normalizarlos) se clasifican una sola vez y los
+    ya vistos se toman de la caché LRU. Con la ruta rápida (EMOTION_FAST_PATH)
+    solo pasan por el modelo los mensajes en los que su salida puede cambiar
+    el resultado.
+
+    Devuelve una lista de diccionarios {'etiqueta', 'confianza', 'regla', 'ruta'}
+    en el mismo orden que `texts`, donde 'regla' es la regla de
+    apply_keyword_correction que decidió y 'ruta' es 'cache', 'reglas' o
+    'modelo'. El tamaño de lote se toma de EMOTION_BATCH_SIZE en settings.py si
+    no se indica.
+
+    Todo el lote se clasifica con el bundle indicado o, si no se indica, con
+    el activo al empezar, aunque se active otra versión mientras tanto.
+    """
+    if bundle is None:
+        load_model()
+        check_model_version()
+        bundle = _bundle
+    if bundle is None:
+        return "Error en la carga del modelo o tokenizador."
+
+    texts = list(texts)
+    if not texts:
+        return []
+    metrics = INFERENCE_METRICS
+    if metrics is not None:
+        started = time.perf_counter()
+
+    if batch_size is None:
+        batch_size = _get_setting('EMOTION_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+    cache = _active_cache(bundle)
+    version = (bundle.version, RULES_VERSION)
+
+    # Agrupar los textos iguales tras normalizar y consultar la caché
+    positions = {}
+    for index, text in enumerate(texts):
+        positions.setdefault(normalize_cache_text(text), []).append(index)
+
+    results = [None] * len(texts)
+    missing = []
+    for key, indices in positions.items():
+        cached = cache.get((version, key)) if cache is not None else None
+        if cached is None:
+            missing.append(key)
+            continue
+        for index in indices:
+            results[index] = {'etiqueta': cached[0], 'confianza': cached[1], 'regla': cached[2], 'ruta': 'cache'}
+
+    if missing:
+        outcomes = _classify_texts([texts[positions[key][0]] for key in missing], batch_size, fast_path, bundle)
+        if isinstance(outcomes, str):
+            return outcomes
+
+        for key, (label, confidence, rule, route) in zip(missing, outcomes):
+            if cache is not None:
+                cache.put((version, key), (label, confidence, rule))
+            for index in positions[key]:
+                results[index] = {'etiqueta': label, 'confianza': confidence, 'regla': rule, 'ruta': route}
+
+    if metrics is not None:
+        metrics.record('predict_emotion_batch', time.perf_counter() - started, len(texts))
+        # Regla y ruta una vez por mensaje de entrada, también los repetidos y los de la caché
+        metrics.record_outcomes(
+            (result['regla'] for result in results),
+            (result['ruta'] for result in results)
+        )
+    return results
+
+
+class InferenceDispatcher(MicroBatcher):
+    """
+    Despachador local de inferencia con micro-lotes (ver micro_batching.py).
+
+    Cada llamada a `submit(textos, tamaño de lote, bundle)` devuelve un Future.
+    El hilo de fondo junta las peticiones pendientes hasta `max_batch_size`
+    textos o hasta que pasan `max_wait_ms` milisegundos desde la primera, hace
+    una sola llamada a predict_probabilities con todos sus textos y entrega a
+    cada petición sus filas de probabilidades, en el orden de sus textos.
+    """
+
+    thread_name = 'inference-dispatcher'
+
+    def __init__(self, max_batch_size=64, max_wait_ms=5):
+        super().__init__(max_batch_size, max_wait_ms)
+        self.batches = 0
+        self.requests = 0
+        self.texts = 0
+
+    def submit(self, texts, batch_size=None, bundle=None):
+        """Encola textos y devuelve un Future con su matriz de probabilidades (n, clases)."""
+        if bundle is None:
+            bundle = get_model_bundle()
+        if batch_size is None:
+            batch_size = _get_setting('EMOTION_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        future = Future()
+        self.put((list(texts), batch_size, bundle, future))
+        return future
+
+    def _size_of(self, request):
+        return len(request[0])
+
+    def _predict(self, requests):
+        """Una pasada para todas las peticiones de un mismo bundle."""
+        texts = [text for request_texts, _, _, _ in requests for text in request_texts]
+        batch_size = max(batch_size for _, batch_size, _, _ in requests)
+        try:
+            probabilities = predict_probabilities(texts, batch_size, bundle=requests[0][2])
+        except Exception as e:
+            for _, _, _, future in requests:
+                future.set_exception(e)
+            return
+
+        start = 0
+        for request_texts, _, _, future in requests:
+            future.set_result(None if probabilities is None else probabilities[start:start + len(request_texts)])
+            start += len(request_texts)
+
+    def _process(self, batch):
+        with self._lock:
+            self.batches += 1
+            self.requests += len(batch)
+            self.texts += sum(len(texts) for texts, _, _, _ in batch)
+
+        # Descartar las peticiones canceladas y agrupar por bundle (normalmente uno)
+        by_bundle = {}
+        for request in batch:
+            if request[3].set_running_or_notify_cancel():
+                by_bundle.setdefault(id(request[2]), []).append(request)
+        for requests in by_bundle.values():
+            self._predict(requests)
+
+    def _batch_failed(self, batch, error):
+        # Ninguna petición debe quedar esperando un resultado que no llegará
+        for _, _, _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    def stats(self):
+        """Contadores, profundidad actual de la cola e histogramas acumulados."""
+        stats = self.batching_stats()
+        with self._lock:
+            stats.update({
+                'batches': self.batches,
+                'requests': self.requests,
+                'texts': self.texts,
+                'mean_batch_size': self.texts / self.batches if self.batches else 0.0,
+            })
+        return stats
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def get_inference_dispatcher():
+    """
+    Devuelve el despachador del proceso, creándolo con EMOTION_DISPATCHER_MAX_BATCH
+    y EMOTION_DISPATCHER_MAX_WAIT_MS la primera vez.
+    """
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = InferenceDispatcher(
+                max_batch_size=_get_setting('EMOTION_DISPATCHER_MAX_BATCH', 64),
+                max_wait_ms=_get_setting('EMOTION_DISPATCHER_MAX_WAIT_MS', 5),
+            )
+        return _dispatcher
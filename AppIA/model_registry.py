@@ -0,0 +1,160 @@
+# AppIA/model_registry.py
+"""
+Registro de versiones del modelo de emociones.
+
+Cada versión es un directorio con sus artefactos (pesos .npz o directorio
+.npy, vocabulario .json o directorio .npy y, opcionalmente, el modelo Keras
+.h5) y un manifiesto en JSON indica cuál está activa:
+
+    model_registry/
+        manifest.json        {"active": "v2", "versions": {"v1": {...}, "v2": {...}}}
+        v1/modelo_emociones.npz
+        v1/tokenizer_vocab.json
+        v2/...
+
+Este módulo solo gestiona archivos; la carga, el precalentamiento y el
+reemplazo del modelo en memoria se hacen en ml.py.
+"""
+import json
+import os
+import re
+import shutil
+from datetime import datetime, timezone
+
+MANIFEST_NAME = 'manifest.json'
+
+# Nombres de archivo de cada artefacto dentro del directorio de una versión
+ARTIFACT_FILENAMES = {
+    'weights': 'modelo_emociones.npz',
+    'tokenizer': 'tokenizer_vocab.json',
+    'keras_model': 'modelo_emociones.h5',
+}
+
+# Nombres de los artefactos en formato plano (directorios de .npy mapeables en memoria)
+ARTIFACT_DIRNAMES = {
+    'weights': 'modelo_emociones_npy',
+    'tokenizer': 'tokenizer_vocab_npy',
+}
+
+# La versión forma parte de "<modelo>:<reglas>" (64 caracteres como máximo en la base de datos)
+VERSION_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,40}$')
+
+
+class ModelRegistryError(Exception):
+    """Versión inexistente, duplicada o con artefactos faltantes."""
+
+
+class ModelBundle:
+    """
+    Modelo, tokenizador y versión que se usan juntos. No se modifica después
+    de crearse: cambiar de versión es reemplazar el bundle completo, así que
+    una predicción en curso sigue usando el que tomó al empezar.
+    """
+
+    __slots__ = ('version', 'model', 'tokenizer')
+
+    def __init__(self, version, model, tokenizer):
+        self.version = version
+        self.model = model
+        self.tokenizer = tokenizer
+
+    def __repr__(self):
+        return f"ModelBundle({self.version!r})"
+
+
+class ModelRegistry:
+    """Directorio de versiones con su manifiesto."""
+
+    def __init__(self, root):
+        self.root = root
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.root, MANIFEST_NAME)
+
+    def manifest_mtime(self):
+        """Fecha de modificación del manifiesto, o None si el registro no existe."""
+        try:
+            return os.stat(self.manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def read_manifest(self):
+        try:
+            with open(self.manifest_path, encoding='utf-8') as handle:
+                manifest = json.load(handle)
+        except FileNotFoundError:
+            return {'active': None, 'versions': {}}
+        manifest.setdefault('active', None)
+        manifest.setdefault('versions', {})
+        return manifest
+
+    def write_manifest(self, manifest):
+        # Escribir en un archivo temporal y reemplazar, para que ningún
+        # proceso lea un manifiesto a medio escribir
+        os.makedirs(self.root, exist_ok=True)
+        temporary_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(temporary_path, 'w', encoding='utf-8') as handle:
+            json.dump(manifest, handle, ensure_ascii=False, indent=2)
+        os.replace(temporary_path, self.manifest_path)
+
+    def active_version(self):
+        return self.read_manifest()['active']
+
+    def artifact_paths(self, version):
+        """Rutas absolutas de los artefactos de una versión registrada."""
+        entry = self.read_manifest()['versions'].get(version)
+        if entry is None:
+            raise ModelRegistryError(f"La versión '{version}' no está registrada.")
+        return {
+            name: os.path.join(self.root, version, filename)
+            for name, filename in entry['artifacts'].items()
+        }
+
+    def register(self, version, weights, tokenizer, keras_model=None, activate=False):
+        """
+        Copia los artefactos a un directorio nuevo para `version` y la agrega
+        al manifiesto (activándola si se indica). Una versión registrada no se
+        sobrescribe nunca: las predicciones guardadas dependen de su nombre.
+        """
+        if not VERSION_PATTERN.match(version):
+            raise ModelRegistryError(
+                "El nombre de la versión solo puede tener letras, números, '.', '_' o '-' (máximo 40)."
+            )
+        manifest = self.read_manifest()
+        version_dir = os.path.join(self.root, version)
+        if version in manifest['versions'] or os.path.exists(version_dir):
+            raise ModelRegistryError(f"La versión '{version}' ya existe.")
+
+        sources = {'weights': weights, 'tokenizer': tokenizer}
+        if keras_model:
+            sources['keras_model'] = keras_model
+        for name, path in sources.items():
+            if not (os.path.isfile(path) or (name in ARTIFACT_DIRNAMES and os.path.isdir(path))):
+                raise ModelRegistryError(f"No se encontró el artefacto '{path}'.")
+
+        os.makedirs(version_dir)
+        artifacts = {}
+        for name, source in sources.items():
+            if os.path.isdir(source):
+                artifacts[name] = ARTIFACT_DIRNAMES[name]
+                shutil.copytree(source, os.path.join(version_dir, artifacts[name]))
+            else:
+                artifacts[name] = ARTIFACT_FILENAMES[name]
+                shutil.copyfile(source, os.path.join(version_dir, artifacts[name]))
+
+        manifest['versions'][version] = {
+            'artifacts': artifacts,
+            'registered_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        }
+        if activate:
+            manifest['active'] = version
+        self.write_manifest(manifest)
+
+    def activate(self, version):
+        """Marca `version` como activa; los procesos la cargan en segundo plano."""
+        manifest = self.read_manifest()
+        if version not in manifest['versions']:
+            raise ModelRegistryError(f"La versión '{version}' no está registrada.")
+        manifest['active'] = version
+        self.write_manifest(manifest)
@@ -44,6 +44,10 @@ class Message(models.Model):
         ordering = ['created_at']
         verbose_name = 'Mensaje'
         verbose_name_plural = 'Mensajes'
+        indexes = [
+            # Mensajes de una conversación posteriores a un ID (reportes incrementales)
+            models.Index(fields=['conversation', 'id'], name='message_conversation_id_idx'),
+        ]
     
     def __str__(self):
         return f"{self.sender.username}: {self.content[:50]}..."
@@ -59,6 +63,7 @@ class MessageAnalysis(models.Model):
     )
     emotion_label = models.CharField(max_length=50)  # Neutral, Positivo, Acoso/Violencia, Extorsión
     confidence = models.FloatField()  # 0.0 a 1.0
+    model_version = models.CharField(max_length=64, blank=True, default='')  # "<modelo>:<reglas>"
     analyzed_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -90,6 +95,11 @@ class ConversationAnalysisReport(models.Model):
     harassment_percentage = models.FloatField(default=0.0)
     extortion_percentage = models.FloatField(default=0.0)
     
+    # Último mensaje incluido y versión de los análisis contados; el siguiente
+    # reporte de la misma versión parte de estos conteos y solo suma los mensajes posteriores
+    last_message_id = models.BigIntegerField(null=True, blank=True)
+    model_version = models.CharField(max_length=64, blank=True, default='')  # "<modelo>:<reglas>"
+    
     class Meta:
         verbose_name = 'Reporte de Análisis'
         verbose_name_plural = 'Reportes de Análisis'
@@ -97,4 +107,137 @@ class ConversationAnalysisReport(models.Model):
     
     def __str__(self):
         participants = ", ".join([user.username for user in self.conversation.participants.all()])
-        return f"Reporte: {participants} - {self.created_at.strftime('%d/%m/%Y')}"
\ No newline at end of file
+        return f"Reporte: {participants} - {self.created_at.strftime('%d/%m/%Y')}"
+
+class StoredPrediction(models.Model):
+    """
+    Predicción persistente por contenido: el mismo texto (normalizado) con la
+    misma versión de modelo y reglas nunca se vuelve a clasificar, incluso
+    entre reinicios o entre distintos procesos.
+    """
+    content_hash = models.CharField(max_length=64, unique=True)  # sha256(versión + texto normalizado)
+    model_version = models.CharField(max_length=64)  # "<modelo>:<reglas>"
+    emotion_label = models.CharField(max_length=50)
+    confidence = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Predicción Almacenada'
+        verbose_name_plural = 'Predicciones Almacenadas'
+
+    def __str__(self):
+        return f"Predicción {self.content_hash[:12]} ({self.model_version}): {self.emotion_label}"
+
+class AnalysisJob(models.Model):
+    """
+    Análisis general ejecutado en segundo plano por 'python manage.py run_analysis_jobs'.
+    El avance se guarda junto con cada parte de mensajes, en la misma transacción,
+    así que si el proceso se cae otro lo retoma desde la última parte guardada.
+    """
+    STATUS_PENDING = 'pendiente'
+    STATUS_RUNNING = 'en_curso'
+    STATUS_DONE = 'completado'
+    STATUS_FAILED = 'error'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pendiente'),
+        (STATUS_RUNNING, 'En curso'),
+        (STATUS_DONE, 'Completado'),
+        (STATUS_FAILED, 'Error'),
+    ]
+
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='analysis_jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    incremental = models.BooleanField(default=True)
+    # Repartido en AnalysisShard entre varios procesos o máquinas (EMOTION_ANALYSIS_DISTRIBUTED)
+    sharded = models.BooleanField(default=False)
+    shard_count = models.IntegerField(default=0)
+
+    # Avance: mensajes a clasificar, ya clasificados y último ID guardado
+    total = models.IntegerField(default=0)
+    processed = models.IntegerField(default=0)
+    skipped = models.IntegerField(default=0)
+    last_message_id = models.BigIntegerField(null=True, blank=True)
+    analysis_data = models.JSONField(default=dict)  # conteos por categoría
+    routes = models.JSONField(default=dict)  # resultados por ruta ('almacen', 'reglas', 'modelo'...)
+
+    # Proceso que lo ejecuta; si deja de dar señales, otro puede retomarlo
+    worker = models.CharField(max_length=100, blank=True, default='')
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)  # inicio de la ejecución actual
+    processed_at_start = models.IntegerField(default=0)  # avance al iniciar la ejecución actual
+    finished_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+
+    class Meta:
+        verbose_name = 'Trabajo de Análisis'
+        verbose_name_plural = 'Trabajos de Análisis'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Trabajo {self.id} ({self.get_status_display()}): {self.processed}/{self.total}"
+
+
+class FlaggedMessage(models.Model):
+    """
+    Mensaje con una amenaza crítica (CRITICAL_VIOLENCE_KEYWORDS o
+    CRITICAL_EXTORTION_KEYWORDS), registrado en el momento del envío para que
+    el panel lo muestre sin esperar al análisis ni recorrer MessageAnalysis.
+    """
+    CATEGORY_VIOLENCE = 'critical_violence'
+    CATEGORY_EXTORTION = 'critical_extortion'
+    CATEGORY_CHOICES = [
+        (CATEGORY_VIOLENCE, 'Acoso/Violencia'),
+        (CATEGORY_EXTORTION, 'Extorsión'),
+    ]
+
+    message = models.OneToOneField(Message, on_delete=models.CASCADE, related_name='flag')
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='flagged_messages')
+    category = models.CharField(max_length=20, choices=CATEGORY_CHOICES)
+    matched_keywords = models.CharField(max_length=255)  # separadas por coma
+    flagged_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    reviewed = models.BooleanField(default=False)
+
+    class Meta:
+        verbose_name = 'Mensaje Señalado'
+        verbose_name_plural = 'Mensajes Señalados'
+        ordering = ['-flagged_at']
+
+    def __str__(self):
+        return f"Mensaje {self.message_id} señalado: {self.get_category_display()} ({self.matched_keywords})"
+
+
+class AnalysisShard(models.Model):
+    """
+    Rango de IDs de mensajes de un AnalysisJob repartido. Un proceso lo toma
+    con un arriendo que renueva con cada parte guardada; si el arriendo vence
+    (el proceso se cayó), otro lo retoma desde su último mensaje guardado.
+    """
+    STATUS_PENDING = 'pendiente'
+    STATUS_RUNNING = 'en_curso'
+    STATUS_DONE = 'completado'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pendiente'),
+        (STATUS_RUNNING, 'En curso'),
+        (STATUS_DONE, 'Completado'),
+    ]
+
+    job = models.ForeignKey(AnalysisJob, on_delete=models.CASCADE, related_name='shards')
+    first_message_id = models.BigIntegerField()
+    last_message_id = models.BigIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    worker = models.CharField(max_length=100, blank=True, default='')
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    # Avance dentro del rango
+    checkpoint_id = models.BigIntegerField(null=True, blank=True)  # último mensaje guardado
+    processed = models.IntegerField(default=0)
+    analysis_data = models.JSONField(default=dict)
+    routes = models.JSONField(default=dict)
+
+    class Meta:
+        verbose_name = 'Parte de Análisis'
+        verbose_name_plural = 'Partes de Análisis'
+        ordering = ['job', 'first_message_id']
+
+    def __str__(self):
+        return f"Parte {self.first_message_id}-{self.last_message_id} del trabajo {self.job_id} ({self.get_status_display()})"
@@ -0,0 +1,255 @@
+# AppIA/numpy_engine.py
+"""
+Motor de inferencia en NumPy para el modelo de emociones.
+
+El modelo entrenado en entreno.py es Embedding -> GlobalAveragePooling1D ->
+Dense(softmax), así que la pasada hacia adelante se reduce a una búsqueda en
+la tabla de embeddings, un promedio (enmascarado si el modelo usa mask_zero),
+un producto matricial y un softmax. Los pesos se exportan una sola vez desde
+el archivo .h5 a un .npz y en producción no hace falta importar TensorFlow.
+
+La tabla de embeddings (lo único que crece con el vocabulario) puede guardarse
+en float16 o en int8 con una escala por fila; se mantiene así en memoria y
+solo se convierte a float32 la parte que usa cada lote.
+
+Los pesos también pueden guardarse en formato plano (un directorio con un
+.npy por array, ver `save_flat`). Ese formato se abre con mmap en lugar de
+deserializarse, así que los procesos de un servidor comparten una sola copia
+de la tabla en la caché de páginas del sistema operativo.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# Precisiones admitidas para la tabla de embeddings
+WEIGHT_PRECISIONS = ('float32', 'float16', 'int8')
+
+
+def quantize_rows(matrix):
+    """
+    Cuantiza una matriz a int8 simétrico con una escala por fila
+    (fila ≈ fila_int8 * escala). Devuelve (matriz_int8, escalas_float32).
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.clip(np.rint(matrix / scales[:, np.newaxis]), -127, 127).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+class NumpyEmotionModel:
+    """
+    Reimplementación en NumPy de la pasada hacia adelante del modelo Keras.
+    Expone `predict_on_batch` y `predict` con la misma forma de salida que Keras.
+
+    `embeddings` puede ser float32, float16 o int8; en int8 se requieren las
+    escalas por fila (`embedding_scales`). Los cálculos se hacen en float32.
+    """
+
+    def __init__(self, embeddings, dense_kernel, dense_bias, mask_zero=False, embedding_scales=None):
+        embeddings = np.asarray(embeddings)
+        if embeddings.dtype == np.int8:
+            if embedding_scales is None:
+                raise ValueError("Los embeddings int8 necesitan sus escalas por fila.")
+            self.embedding_scales = np.asarray(embedding_scales, dtype=np.float32)
+        elif embeddings.dtype == np.float16:
+            self.embedding_scales = None
+        else:
+            embeddings = embeddings.astype(np.float32, copy=False)
+            self.embedding_scales = None
+        self.embeddings = embeddings
+        self.dense_kernel = np.asarray(dense_kernel, dtype=np.float32)
+        self.dense_bias = np.asarray(dense_bias, dtype=np.float32)
+        self.mask_zero = bool(mask_zero)
+        # Embedding del índice 0, para compensar el relleno omitido
+        self._padding_embedding = self._lookup(np.zeros(1, dtype=np.int32))[0]
+
+    @property
+    def precision(self):
+        return self.embeddings.dtype.name
+
+    @property
+    def nbytes(self):
+        """Memoria ocupada por los pesos."""
+        scales = self.embedding_scales.nbytes if self.embedding_scales is not None else 0
+        return self.embeddings.nbytes + scales + self.dense_kernel.nbytes + self.dense_bias.nbytes
+
+    @classmethod
+    def load(cls, path):
+        """
+        Carga los pesos exportados con `save` o `export_keras_weights` (.npz)
+        o, si `path` es un directorio, los de `save_flat` mapeados en memoria.
+        """
+        if os.path.isdir(path):
+            return cls.load_flat(path)
+        with np.load(path) as data:
+            return cls(
+                embeddings=data['embeddings'],
+                dense_kernel=data['dense_kernel'],
+                dense_bias=data['dense_bias'],
+                mask_zero=bool(data['mask_zero']),
+                embedding_scales=data['embedding_scales'] if 'embedding_scales' in data.files else None,
+            )
+
+    def save(self, path):
+        arrays = {
+            'embeddings': self.embeddings,
+            'dense_kernel': self.dense_kernel,
+            'dense_bias': self.dense_bias,
+            'mask_zero': np.array(self.mask_zero),
+        }
+        if self.embedding_scales is not None:
+            arrays['embedding_scales'] = self.embedding_scales
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load_flat(cls, directory):
+        """Abre con mmap (solo lectura) los arrays guardados con `save_flat`."""
+        with open(os.path.join(directory, 'config.json'), encoding='utf-8') as handle:
+            config = json.load(handle)
+
+        def array(name):
+            return np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')
+
+        return cls(
+            embeddings=array('embeddings'),
+            dense_kernel=array('dense_kernel'),
+            dense_bias=array('dense_bias'),
+            mask_zero=config['mask_zero'],
+            embedding_scales=array('embedding_scales') if config.get('embedding_scales') else None,
+        )
+
+    def save_flat(self, directory):
+        """Guarda un .npy por array y la configuración en `directory`."""
+        os.makedirs(directory, exist_ok=True)
+        arrays = {
+            'embeddings': self.embeddings,
+            'dense_kernel': self.dense_kernel,
+            'dense_bias': self.dense_bias,
+        }
+        if self.embedding_scales is not None:
+            arrays['embedding_scales'] = self.embedding_scales
+        for name, values in arrays.items():
+            np.save(os.path.join(directory, f'{name}.npy'), np.ascontiguousarray(values))
+        with open(os.path.join(directory, 'config.json'), 'w', encoding='utf-8') as handle:
+            json.dump({
+                'mask_zero': self.mask_zero,
+                'precision': self.precision,
+                'embedding_scales': self.embedding_scales is not None,
+            }, handle, indent=1)
+
+    def fingerprint(self):
+        """
+        Huella (sha1) del contenido de los pesos: la misma para el .npz y para
+        la copia plana, porque solo depende de los arrays y de la configuración.
+        """
+        digest = hashlib.sha1()
+        digest.update(json.dumps({'mask_zero': self.mask_zero}).encode('utf-8'))
+        arrays = [self.embeddings, self.dense_kernel, self.dense_bias]
+        if self.embedding_scales is not None:
+            arrays.append(self.embedding_scales)
+        for values in arrays:
+            values = np.ascontiguousarray(values)
+            digest.update(f'{values.dtype.str}{values.shape}'.encode('utf-8'))
+            digest.update(values.data)
+        return digest.hexdigest()
+
+    def with_precision(self, precision):
+        """Copia del modelo con la tabla de embeddings en otra precisión."""
+        if precision not in WEIGHT_PRECISIONS:
+            raise ValueError(f"Precisión no soportada: {precision}. Opciones: {', '.join(WEIGHT_PRECISIONS)}")
+
+        embeddings = self._lookup(np.arange(len(self.embeddings)))
+        scales = None
+        if precision == 'float16':
+            embeddings = embeddings.astype(np.float16)
+        elif precision == 'int8':
+            embeddings, scales = quantize_rows(embeddings)
+        return NumpyEmotionModel(embeddings, self.dense_kernel, self.dense_bias, self.mask_zero, scales)
+
+    def _lookup(self, sequences):
+        """Filas de la tabla de embeddings para cada índice, en float32."""
+        rows = self.embeddings[sequences]
+        if self.embedding_scales is not None:
+            return rows.astype(np.float32) * self.embedding_scales[sequences][..., np.newaxis]
+        return rows.astype(np.float32, copy=False)
+
+    # predict_on_batch acepta matrices más cortas que la longitud de entrenamiento
+    supports_padded_length = True
+
+    def predict_on_batch(self, sequences, padded_length=None):
+        """
+        Calcula las probabilidades de cada clase para una matriz de índices
+        de forma (n, longitud). Devuelve un array float32 de forma (n, clases).
+
+        Si `padded_length` es mayor que la longitud de la matriz, el resultado
+        es el mismo que si cada fila se hubiera rellenado con ceros al final
+        hasta `padded_length`, sin construir ni recorrer ese relleno.
+        """
+        sequences = np.asarray(sequences)
+        length = sequences.shape[1]
+
+        # Embedding: búsqueda de filas en la tabla
+        embedded = self._lookup(sequences)
+
+        # GlobalAveragePooling1D: promedio sobre la dimensión temporal.
+        # Sin mask_zero, Keras promedia también las posiciones de relleno, así
+        # que el relleno omitido aporta (padded_length - longitud) veces el
+        # embedding del índice 0. Con mask_zero el relleno no cuenta.
+        if self.mask_zero:
+            mask = (sequences != 0).astype(np.float32)[..., np.newaxis]
+            pooled = (embedded * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1.0)
+        elif padded_length is None or padded_length <= length:
+            pooled = embedded.mean(axis=1)
+        else:
+            missing = padded_length - length
+            pooled = (embedded.sum(axis=1) + missing * self._padding_embedding) / np.float32(padded_length)
+
+        # Dense + softmax (restando el máximo por estabilidad numérica)
+        logits = pooled @ self.dense_kernel + self.dense_bias
+        logits -= logits.max(axis=1, keepdims=True)
+        exp_logits = np.exp(logits)
+        return exp_logits / exp_logits.sum(axis=1, keepdims=True)
+
+    def predict(self, sequences, batch_size=None, verbose=0):
+        """Compatible con `keras.Model.predict`; procesa por lotes si se indica."""
+        sequences = np.asarray(sequences)
+        if not batch_size or len(sequences) <= batch_size:
+            return self.predict_on_batch(sequences)
+        return np.concatenate([
+            self.predict_on_batch(sequences[start:start + batch_size])
+            for start in range(0, len(sequences), batch_size)
+        ])
+
+
+def export_keras_weights(h5_path, npz_path, precision='float32'):
+    """
+    Exporta los pesos de un modelo Keras (.h5) al formato .npz que usa
+    NumpyEmotionModel, con la tabla de embeddings en la precisión indicada.
+    Es el único punto que necesita TensorFlow instalado.
+    """
+    from tensorflow import keras
+
+    keras_model = keras.models.load_model(h5_path)
+    layers = [layer for layer in keras_model.layers if layer.__class__.__name__ != 'InputLayer']
+    layer_types = [layer.__class__.__name__ for layer in layers]
+    if layer_types != ['Embedding', 'GlobalAveragePooling1D', 'Dense']:
+        raise ValueError(
+            f"Arquitectura no soportada por el motor NumPy: {layer_types}. "
+            "Se esperaba Embedding -> GlobalAveragePooling1D -> Dense."
+        )
+
+    embedding_layer, _, dense_layer = layers
+    if dense_layer.get_config().get('activation') != 'softmax':
+        raise ValueError("La capa Dense final debe usar activación softmax.")
+
+    (embeddings,) = embedding_layer.get_weights()
+    dense_kernel, dense_bias = dense_layer.get_weights()
+
+    NumpyEmotionModel(
+        embeddings, dense_kernel, dense_bias,
+        mask_zero=embedding_layer.get_config().get('mask_zero', False)
+    ).with_precision(precision).save(npz_path)
+    return keras_model
@@ -0,0 +1,43 @@
+# AppIA/parallel_analysis.py
+"""
+Funciones que se ejecutan en los procesos del análisis paralelo.
+
+Este módulo no importa modelos ni el pipeline al cargarse, porque con el
+método de arranque 'spawn' (Windows) los procesos hijos lo importan antes de
+que Django esté configurado; init_worker se encarga de configurarlo.
+"""
+import os
+
+
+def init_worker(settings_module):
+    """Configura Django en el proceso hijo y carga el modelo una sola vez."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+
+    import django
+    django.setup()
+
+    # Cada proceso abre su propia conexión a la base de datos
+    from django.db import connections
+    connections.close_all()
+
+    # Con 'fork' el modelo ya viene cargado del proceso padre; con 'spawn'
+    # se carga (y precalienta) aquí, antes de recibir la primera parte
+    from AppIA import ml
+    ml.load_model()
+
+
+def analyze_id_range(id_range, incremental=False):
+    """Clasifica y guarda los mensajes con ID en [primero, último]."""
+    from AppIA.analysis import analyze_queryset
+    from AppIA.models import Message
+
+    first_id, last_id = id_range
+    return analyze_queryset(Message.objects.filter(id__gte=first_id, id__lte=last_id), incremental=incremental)
+
+
+def run_jobs_in_process(settings_module, poll_interval=2.0, once=False, chunk_size=None):
+    """Proceso de trabajos lanzado por 'run_analysis_jobs --processes'."""
+    init_worker(settings_module)
+
+    from AppIA.analysis_jobs import run_worker
+    return run_worker(poll_interval=poll_interval, once=once, chunk_size=chunk_size)
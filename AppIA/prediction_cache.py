@@ -0,0 +1,78 @@
+# AppIA/prediction_cache.py
+"""
+Caché LRU en memoria para las predicciones de emociones.
+
+Los chats repiten constantemente los mismos textos cortos ("hola", "ok",
+"jajaja"), así que guardar el resultado por texto normalizado evita volver a
+tokenizar, pasar por el modelo y aplicar las reglas.
+"""
+import threading
+from collections import OrderedDict
+
+
+class PredictionCache:
+    """
+    Caché con tamaño máximo y desalojo del elemento menos usado (LRU).
+
+    Está asociada a una versión (modelo + reglas): cuando `bind_version`
+    recibe una versión distinta a la actual, se vacía por completo.
+    Es segura para usarse desde varios hilos.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.version = None
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def bind_version(self, version):
+        """Vacía la caché si la versión del modelo o de las reglas cambió."""
+        with self._lock:
+            if version != self.version:
+                self._data.clear()
+                self.version = version
+
+    def get(self, key):
+        """Devuelve el valor guardado o None, actualizando los contadores."""
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """Contadores de aciertos, fallos y desalojos."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
@@ -1,3 +1,1044 @@
-from django.test import TestCase
+import functools
+import importlib.util
+import multiprocessing
+import os
+import tempfile
+import threading
+import unittest
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import analysis, ml
+from .analysis import (
+    AnalysisError, analyze_corpus, classify_texts, create_conversation_report, current_prediction_version,
+    iter_id_ranges, iter_message_chunks, report_analysis_data, save_message_analyses
+)
+from .analysis_jobs import (
+    claim_job, claim_shard, job_progress, plan_shards, run_job, run_shard, run_worker, submit_analysis_job
+)
+from .apps import should_preload_model
+from .benchmarks import LENGTH_PROFILES, generate_spanish_messages, run_benchmark_suite
+from .keyword_matcher import KeywordMatcher
+from .live_analysis import MessageAnalysisQueue, analyze_on_commit, flag_critical_message
+from .model_registry import ModelRegistry, ModelRegistryError
+from .models import (
+    AnalysisJob, AnalysisShard, Conversation, ConversationAnalysisReport, FlaggedMessage, Message,
+    MessageAnalysis, StoredPrediction
+)
+from .fast_tokenizer import VocabTokenizer
+from .numpy_engine import NumpyEmotionModel, quantize_rows
+from .prediction_cache import PredictionCache
+
+HAS_TENSORFLOW = importlib.util.find_spec('tensorflow') is not None
+
+
+@unittest.skipUnless(HAS_TENSORFLOW, "TensorFlow no está instalado")
+class NumpyBackendParityTests(SimpleTestCase):
+    """El backend NumPy debe reproducir la salida del modelo Keras de referencia."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.keras_model = ml.load_inference_model('keras')
+        cls.numpy_model = NumpyEmotionModel.load(ml.weights_path)
+
+    def test_probabilities_match_keras(self):
+        rng = np.random.default_rng(42)
+        sequences = rng.integers(0, 1000, size=(64, ml.MAX_SEQUENCE_LENGTH), dtype=np.int32)
+        sequences[:, 10:] = 0
+
+        expected = np.asarray(self.keras_model.predict_on_batch(sequences))
+        actual = self.numpy_model.predict_on_batch(sequences)
+
+        np.testing.assert_allclose(actual, expected, atol=1e-6)
+
+    def test_real_texts_match_keras(self):
+        texts = ['hola', 'te voy a matar', 'Me siento muy feliz con los resultados', '']
+        sequences = ml.preprocess_batch(texts)
+
+        expected = np.asarray(self.keras_model.predict_on_batch(sequences))
+        actual = self.numpy_model.predict_on_batch(sequences)
+
+        np.testing.assert_array_equal(actual.argmax(axis=1), expected.argmax(axis=1))
+        np.testing.assert_allclose(actual, expected, atol=1e-6)
+
+
+class KeywordMatcherTests(SimpleTestCase):
+    """El autómata debe contar lo mismo que la búsqueda por subcadenas."""
+
+    CATEGORIES = {
+        'strong_positive': ml.STRONG_POSITIVE_KEYWORDS,
+        'mild_positive': ml.MILD_POSITIVE_KEYWORDS,
+        'critical_violence': ml.CRITICAL_VIOLENCE_KEYWORDS,
+        'moderate_violence': ml.MODERATE_VIOLENCE_KEYWORDS,
+        'critical_extortion': ml.CRITICAL_EXTORTION_KEYWORDS,
+        'moderate_extortion': ml.MODERATE_EXTORTION_KEYWORDS,
+    }
+
+    def naive_count(self, text):
+        text_lower = text.lower()
+        return {
+            category: sum(1 for keyword in keywords if keyword in text_lower)
+            for category, keywords in self.CATEGORIES.items()
+        }
+
+    def test_matches_substring_counts(self):
+        matcher = KeywordMatcher(self.CATEGORIES)
+        texts = [
+            '', 'hola', 'Te amo, mi amor', 'TE VOY A MATAR', 'dame dinero o publico todo',
+            'si no pagas voy a publicar las fotos íntimas', 'amorcito me encanta',
+            'odio la violencia y las peleas con cuchillo', 'aléjate de ella',
+        ]
+        for text in texts:
+            with self.subTest(text=text):
+                self.assertEqual(matcher.count(text), self.naive_count(text))
+
+    def test_accent_normalization(self):
+        matcher = KeywordMatcher(self.CATEGORIES, normalize_accents=True)
+
+        self.assertEqual(matcher.count('alejate de mi')['critical_violence'], 1)
+        self.assertEqual(matcher.count('aléjate de mi')['critical_violence'], 1)
+        self.assertEqual(matcher.count('mandame fotos intimas')['moderate_extortion'], 2)
+
+    def test_accent_normalization_is_opt_in(self):
+        matcher, rules_version = ml.build_keyword_matcher()
+        self.assertFalse(matcher.normalize_accents)
+        self.assertEqual(matcher.count('mándame fotos íntimas')['moderate_extortion'], 2)
+
+        with override_settings(EMOTION_KEYWORDS_NORMALIZE_ACCENTS=True):
+            normalized, normalized_version = ml.build_keyword_matcher()
+        self.assertTrue(normalized.normalize_accents)
+        self.assertNotEqual(normalized_version, rules_version)
+
+
+class FastPathTests(SimpleTestCase):
+    """La ruta rápida no debe cambiar ningún resultado, solo evitar llamadas al modelo."""
+
+    TEXTS = [
+        'hola', 'ok', 'te quiero', 'te voy a matar si vuelves', 'si no pagas publico todo',
+        'hubo una pelea con cuchillo y mucha sangre', 'la reunión de hoy fue muy productiva',
+        'me encanta trabajar con este equipo, gracias por todo',
+    ]
+
+    def setUp(self):
+        ml.PREDICTION_CACHE.clear()
+
+    def test_same_results_with_and_without_fast_path(self):
+        fast = ml.predict_emotion_batch(self.TEXTS, fast_path=True)
+        ml.PREDICTION_CACHE.clear()
+        full = ml.predict_emotion_batch(self.TEXTS, fast_path=False)
+
+        for text, fast_result, full_result in zip(self.TEXTS, fast, full):
+            with self.subTest(text=text):
+                self.assertEqual(fast_result['etiqueta'], full_result['etiqueta'])
+                self.assertAlmostEqual(fast_result['confianza'], full_result['confianza'], places=6)
+
+    def test_short_and_critical_messages_skip_the_model(self):
+        results = ml.predict_emotion_batch(['hola', 'te voy a matar si vuelves'], fast_path=True)
+
+        self.assertEqual([result['ruta'] for result in results], ['reglas', 'reglas'])
+
+
+class PredictEmotionBatchTests(SimpleTestCase):
+    """La inferencia en bloque debe dar lo mismo, y en el mismo orden, que texto por texto."""
+
+    TEXTS = [
+        'la reunión de hoy fue muy productiva', 'hola', 'te voy a matar si vuelves',
+        'La reunión de hoy fue muy productiva ', 'me encanta trabajar con este equipo, gracias por todo',
+        'si no pagas publico todo', 'hola', 'hubo una pelea con cuchillo y mucha sangre',
+        'mañana revisamos el presupuesto del proyecto',
+    ]
+
+    def setUp(self):
+        ml.PREDICTION_CACHE.clear()
+
+    def test_batch_matches_single_text_predictions(self):
+        batch = ml.predict_emotion_batch(self.TEXTS, batch_size=2)
+        self.assertEqual(len(batch), len(self.TEXTS))
+        self.assertEqual({result['ruta'] for result in batch}, {'reglas', 'modelo'})
+
+        ml.PREDICTION_CACHE.clear()
+        for text, batch_result in zip(self.TEXTS, batch):
+            single = ml.predict_emotion(text)
+            with self.subTest(text=text):
+                self.assertEqual(batch_result['etiqueta'], single['etiqueta'])
+                self.assertAlmostEqual(batch_result['confianza'], single['confianza'], places=5)
+
+        # Los textos repetidos reciben el mismo resultado en su propia posición
+        self.assertEqual(batch[0]['etiqueta'], batch[3]['etiqueta'])
+        self.assertEqual(batch[1], batch[6])
+
+
+class PredictionCacheTests(SimpleTestCase):
+
+    def test_lru_eviction_and_counters(self):
+        cache = PredictionCache(maxsize=2)
+        cache.put('hola', ('Neutral', 0.8))
+        cache.put('ok', ('Neutral', 0.8))
+        cache.get('hola')
+        cache.put('te quiero', ('Positivo', 0.85))
+
+        self.assertIsNone(cache.get('ok'))
+        self.assertEqual(cache.get('hola'), ('Neutral', 0.8))
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(cache.stats()['hits'], 2)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_version_change_clears_cache(self):
+        cache = PredictionCache(maxsize=10)
+        cache.bind_version(('modelo-1', 'reglas-1'))
+        cache.put('hola', ('Neutral', 0.8))
+        cache.bind_version(('modelo-2', 'reglas-1'))
+
+        self.assertEqual(len(cache), 0)
+
+    def test_repeated_texts_are_served_from_cache(self):
+        ml.PREDICTION_CACHE.clear()
+        first = ml.predict_emotion_batch(['Hola ', 'hola'])
+        second = ml.predict_emotion_batch(['HOLA'])
+
+        self.assertEqual(first[0]['etiqueta'], first[1]['etiqueta'])
+        self.assertEqual(second[0]['ruta'], 'cache')
+
+
+class StoredPredictionTests(TestCase):
+
+    def test_identical_texts_are_classified_once_and_reused(self):
+        texts = ['la reunión de hoy fue muy productiva', 'La reunión de hoy fue muy productiva ', 'hola']
+
+        first = classify_texts(texts)
+        second = classify_texts(texts)
+
+        self.assertEqual(StoredPrediction.objects.count(), 2)
+        self.assertEqual([result['ruta'] for result in second], ['almacen'] * 3)
+        self.assertEqual(
+            [result['etiqueta'] for result in first],
+            [result['etiqueta'] for result in second]
+        )
+
+
+class InferenceDispatcherTests(SimpleTestCase):
+
+    def setUp(self):
+        ml.PREDICTION_CACHE.clear()
+
+    def test_concurrent_classifications_share_one_forward_pass(self):
+        texts = [[f'mensaje de prueba número {i}-{j} para el equipo' for j in range(4)] for i in range(4)]
+        dispatcher = ml.InferenceDispatcher(max_batch_size=16, max_wait_ms=5000)
+        expected = ml.predict_emotion_batch([text for group in texts for text in group], fast_path=False)
+        ml.PREDICTION_CACHE.clear()
+        start = threading.Barrier(len(texts))
+        results = {}
+
+        def classify(index):
+            start.wait()
+            results[index] = ml.predict_emotion_batch(texts[index], fast_path=False)
+
+        with override_settings(EMOTION_USE_DISPATCHER=True), \
+                mock.patch.object(ml, '_dispatcher', dispatcher), \
+                mock.patch('AppIA.ml.predict_probabilities', wraps=ml.predict_probabilities) as forward:
+            threads = [threading.Thread(target=classify, args=(index,)) for index in range(len(texts))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(timeout=30)
+
+        forward.assert_called_once()
+        self.assertEqual(len(forward.call_args.args[0]), 16)
+        merged = [result for index in range(len(texts)) for result in results[index]]
+        self.assertEqual([r['etiqueta'] for r in merged], [r['etiqueta'] for r in expected])
+        stats = dispatcher.stats()
+        self.assertEqual((stats['requests'], stats['texts'], stats['batches']), (4, 16, 1))
+        self.assertEqual(stats['batch_size_histogram'], {16: 1})
+
+
+class CorpusAnalysisTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='ana', password='secreta123')
+        self.conversation = Conversation.objects.create()
+        self.conversation.participants.add(self.user)
+        for content in ['hola', 'te voy a matar', 'te quiero mucho', 'la reunión fue productiva', 'hola']:
+            Message.objects.create(conversation=self.conversation, sender=self.user, content=content)
+
+    def test_shards_are_merged_into_one_count(self):
+        analysis_data, routes = analyze_corpus(workers=1, shard_size=2)
+
+        self.assertEqual(analysis_data['total_messages'], 5)
+        self.assertEqual(sum(routes.values()), 5)
+        self.assertEqual(analysis_data['harassment_count'], 1)
+        self.assertEqual(MessageAnalysis.objects.count(), 5)
+        self.assertEqual(
+            set(MessageAnalysis.objects.values_list('model_version', flat=True)),
+            {current_prediction_version()}
+        )
+
+    def test_corpus_is_read_in_keyset_chunks(self):
+        ids = list(Message.objects.order_by('id').values_list('id', flat=True))
+
+        chunks = list(iter_message_chunks(chunk_size=2))
+
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        self.assertEqual([message_id for chunk in chunks for message_id, _ in chunk], ids)
+        self.assertEqual(chunks[0][0][1], 'hola')
+        self.assertEqual(list(iter_id_ranges(2)), [(ids[0], ids[1]), (ids[2], ids[3]), (ids[4], ids[4])])
+
+    def test_incremental_analysis_skips_current_messages(self):
+        full, _ = analyze_corpus(workers=1)
+        stale = Message.objects.order_by('id').first()
+        MessageAnalysis.objects.filter(message=stale).update(model_version='anterior:0', emotion_label='Extorsión')
+        new_message = Message.objects.create(conversation=self.conversation, sender=self.user, content='hola')
+
+        with mock.patch('AppIA.analysis.analyze_message_rows', wraps=analysis.analyze_message_rows) as analyze_rows:
+            incremental, routes = analyze_corpus(workers=1, incremental=True)
+
+        analyzed_ids = [message_id for call in analyze_rows.call_args_list for message_id, _ in call.args[0]]
+        self.assertEqual(analyzed_ids, [stale.id, new_message.id])
+        self.assertEqual(routes['omitido'], 4)
+        self.assertEqual(incremental['total_messages'], 6)
+        self.assertEqual(incremental['extortion_count'], full['extortion_count'])
+        self.assertEqual(incremental['neutral_count'], full['neutral_count'] + 1)
+
+    def test_messages_analyzed_meanwhile_are_counted_once(self):
+        second = Message.objects.order_by('id')[1]
+        real_analyze = analysis.analyze_message_rows
+
+        def analyze_and_let_another_process_save(rows, **kwargs):
+            # Mientras tanto otro proceso (p. ej. el análisis al escribir) guarda el siguiente mensaje
+            if not MessageAnalysis.objects.filter(message=second).exists():
+                real_analyze([(second.id, second.content)], **kwargs)
+            return real_analyze(rows, **kwargs)
+
+        with mock.patch('AppIA.analysis.analyze_message_rows', side_effect=analyze_and_let_another_process_save):
+            data, routes = analysis.analyze_queryset(chunk_size=1, incremental=True)
+
+        self.assertEqual(data['total_messages'], Message.objects.count())
+        self.assertEqual(routes['omitido'], 1)
+        self.assertEqual(sum(routes.values()), Message.objects.count())
+
+    @override_settings(EMOTION_ANALYSIS_CHUNK_SIZE=2)
+    def test_streamed_analysis_matches_parallel_shards(self):
+        streamed, _ = analyze_corpus(workers=1)
+        MessageAnalysis.objects.all().delete()
+        with mock.patch('AppIA.analysis.ProcessPoolExecutor') as pool:
+            sharded, _ = analyze_corpus(workers=2, shard_size=10)
+
+        pool.assert_not_called()
+        self.assertEqual(sharded, streamed)
+        self.assertEqual(MessageAnalysis.objects.count(), 5)
+
+    def test_report_statistics_come_from_one_group_by(self):
+        counted, _ = analyze_corpus(workers=1)
+        # Los análisis de otras conversaciones no cuentan
+        other = Message.objects.create(conversation=Conversation.objects.create(), sender=self.user, content='hola')
+        analysis.analyze_messages([other])
+
+        with self.assertNumQueries(1):
+            report_data = report_analysis_data(self.conversation.messages.all())
+
+        self.assertEqual({key: report_data[key] for key in counted}, counted)
+        self.assertAlmostEqual(report_data['harassment_percentage'], 20.0)
+
+    def test_report_only_request_does_not_run_the_model(self):
+        analyze_corpus(workers=1)
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+
+        with mock.patch('AppIA.analysis.analyze_queryset') as analyze:
+            response = self.client.post(
+                reverse('generate_conversation_analysis', args=[self.conversation.id]), {'solo_reporte': '1'}
+            )
+
+        analyze.assert_not_called()
+        report = ConversationAnalysisReport.objects.get(conversation=self.conversation)
+        self.assertRedirects(response, reverse('conversation_analysis_report', args=[report.id]),
+                             fetch_redirect_response=False)
+        self.assertEqual((report.total_messages, report.harassment_count), (5, 1))
+
+    def test_conversation_report_folds_only_new_messages_into_the_previous_one(self):
+        first, _, previous = create_conversation_report(self.conversation, self.user)
+        self.assertIsNone(previous)
+        new_message = Message.objects.create(conversation=self.conversation, sender=self.user, content='te voy a matar')
+
+        with mock.patch('AppIA.analysis.analyze_message_rows', wraps=analysis.analyze_message_rows) as analyze_rows:
+            folded, routes, previous = create_conversation_report(self.conversation, self.user)
+
+        analyzed_ids = [message_id for call in analyze_rows.call_args_list for message_id, _ in call.args[0]]
+        self.assertEqual((analyzed_ids, previous), ([new_message.id], first))
+        self.assertEqual((folded.last_message_id, folded.total_messages, folded.harassment_count), (new_message.id, 6, 2))
+        self.assertEqual(sum(routes.values()), 1)
+
+        rebuilt, _, previous = create_conversation_report(self.conversation, self.user, rebuild=True)
+        self.assertIsNone(previous)
+        self.assertEqual(
+            [getattr(rebuilt, field) for field in ('total_messages', 'harassment_count', 'harassment_percentage')],
+            [getattr(folded, field) for field in ('total_messages', 'harassment_count', 'harassment_percentage')]
+        )
+
+
+class AnalysisJobTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='ana', password='secreta123')
+        conversation = Conversation.objects.create()
+        for content in ['hola', 'te voy a matar', 'te quiero mucho', 'la reunión fue productiva', 'hola']:
+            Message.objects.create(conversation=conversation, sender=self.user, content=content)
+
+    def test_job_runs_in_the_background_and_reports_progress(self):
+        job = submit_analysis_job(self.user, incremental=False)
+        self.assertEqual(job_progress(job)['percent'], 0.0)
+
+        job = run_job(claim_job('prueba'), chunk_size=2)
+
+        self.assertEqual(job.status, AnalysisJob.STATUS_DONE)
+        self.assertIsNone(claim_job('prueba'))
+        progress = job_progress(AnalysisJob.objects.get(pk=job.pk))
+        self.assertEqual((progress['processed'], progress['total'], progress['percent']), (5, 5, 100.0))
+        self.assertEqual(job.analysis_data['harassment_count'], 1)
+        self.assertEqual(MessageAnalysis.objects.count(), 5)
+
+    @override_settings(EMOTION_ANALYSIS_UNCLAIMED_WARNING_SECONDS=30)
+    def test_progress_warns_when_no_worker_takes_the_job(self):
+        job = submit_analysis_job(self.user, incremental=False)
+        self.assertFalse(job_progress(job, now=job.created_at + timedelta(seconds=10))['waiting_for_worker'])
+        self.assertTrue(job_progress(job, now=job.created_at + timedelta(seconds=31))['waiting_for_worker'])
+
+        job = claim_job('prueba')
+        self.assertFalse(job_progress(job, now=job.created_at + timedelta(seconds=31))['waiting_for_worker'])
+
+    def test_crashed_job_resumes_from_its_last_committed_chunk(self):
+        self.assertIsNone(claim_job('caido'))
+        submit_analysis_job(self.user, incremental=False)
+        job = claim_job('caido')
+        real_analyze = analysis.analyze_message_rows
+        calls = []
+
+        def crash_on_second_chunk(rows, **kwargs):
+            calls.append(rows)
+            if len(calls) == 2:
+                raise SystemExit("proceso terminado")
+            return real_analyze(rows, **kwargs)
+
+        with mock.patch('AppIA.analysis_jobs.analyze_message_rows', crash_on_second_chunk):
+            with self.assertRaises(SystemExit):
+                run_job(job, chunk_size=2)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed, MessageAnalysis.objects.count()), (AnalysisJob.STATUS_RUNNING, 2, 2))
+        # Mientras da señales nadie lo retoma; cuando deja de darlas, sí
+        self.assertIsNone(claim_job('otro'))
+        AnalysisJob.objects.filter(pk=job.pk).update(heartbeat_at=job.heartbeat_at - timedelta(hours=1))
+        resumed = claim_job('otro')
+
+        with mock.patch('AppIA.analysis_jobs.analyze_message_rows', wraps=real_analyze) as analyze_rows:
+            resumed = run_job(resumed, chunk_size=2)
+
+        analyzed_ids = [message_id for call in analyze_rows.call_args_list for message_id, _ in call.args[0]]
+        self.assertEqual(analyzed_ids, list(Message.objects.order_by('id').values_list('id', flat=True))[2:])
+        self.assertEqual((resumed.status, resumed.processed, resumed.worker), (AnalysisJob.STATUS_DONE, 5, 'otro'))
+        self.assertEqual(resumed.analysis_data['total_messages'], 5)
+
+    def test_failed_chunk_write_does_not_advance_the_checkpoint(self):
+        submit_analysis_job(self.user, incremental=False)
+        real_save = analysis.save_message_analyses
+        calls = []
+
+        def fail_on_second_chunk(analyses, **kwargs):
+            calls.append(analyses)
+            if len(calls) == 2:
+                raise DatabaseError("sin conexión")
+            return real_save(analyses, **kwargs)
+
+        with mock.patch('AppIA.analysis.save_message_analyses', fail_on_second_chunk):
+            job = run_job(claim_job('prueba'), chunk_size=2)
+
+        job.refresh_from_db()
+        first_chunk_ids = list(Message.objects.order_by('id').values_list('id', flat=True))[:2]
+        self.assertEqual((job.status, job.processed, job.last_message_id), (AnalysisJob.STATUS_FAILED, 2, first_chunk_ids[-1]))
+        self.assertIn("sin conexión", job.error)
+        self.assertEqual(sorted(MessageAnalysis.objects.values_list('message_id', flat=True)), first_chunk_ids)
+
+    @override_settings(EMOTION_ANALYSIS_SHARD_SIZE=2)
+    def test_sharded_job_ranges_are_leased_and_reclaimed_after_expiry(self):
+        job = submit_analysis_job(self.user, incremental=False, sharded=True)
+        self.assertEqual(plan_shards(claim_job('planificador')), 3)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.total, job.shard_count), (AnalysisJob.STATUS_RUNNING, 5, 3))
+        # Una vez dividido, el trabajo no se retoma entero aunque deje de dar señales
+        AnalysisJob.objects.filter(pk=job.pk).update(heartbeat_at=job.heartbeat_at - timedelta(hours=1))
+        self.assertIsNone(claim_job('otro'))
+
+        run_shard(claim_shard('a'))
+        crashed = claim_shard('caido')
+        run_shard(claim_shard('c'))
+        # El rango del proceso caído no se toma hasta que vence su arriendo
+        self.assertIsNone(claim_shard('c'))
+        AnalysisShard.objects.filter(pk=crashed.pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        retaken = claim_shard('c')
+        self.assertEqual(retaken.pk, crashed.pk)
+        run_shard(retaken, chunk_size=1)
+        # Si el proceso caído vuelve, no puede guardar nada
+        run_shard(crashed)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed), (AnalysisJob.STATUS_DONE, 5))
+        self.assertEqual((job.analysis_data['total_messages'], job.analysis_data['harassment_count']), (5, 1))
+        self.assertEqual(job_progress(job)['shards_done'], 3)
+        self.assertEqual(MessageAnalysis.objects.count(), 5)
+
+    @override_settings(EMOTION_ANALYSIS_SHARD_SIZE=2, EMOTION_ANALYSIS_DISTRIBUTED=True)
+    def test_worker_completes_a_distributed_incremental_job(self):
+        analysis.analyze_queryset(Message.objects.filter(content='hola'))
+        job = submit_analysis_job(self.user)
+
+        # El trabajo (dividido en 3 rangos) y sus rangos
+        self.assertEqual(run_worker(once=True), 4)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.sharded, job.skipped, job.processed), (AnalysisJob.STATUS_DONE, True, 2, 3))
+        self.assertEqual(job.analysis_data['total_messages'], 5)
+        self.assertEqual(job.routes['omitido'], 2)
+
+    @override_settings(EMOTION_ANALYSIS_SHARD_SIZE=2)
+    def test_failed_range_write_does_not_advance_the_range(self):
+        job = submit_analysis_job(self.user, incremental=False, sharded=True)
+        plan_shards(claim_job('planificador'))
+
+        with mock.patch('AppIA.analysis.save_message_analyses', side_effect=DatabaseError("sin conexión")):
+            shard = run_shard(claim_shard('a'))
+
+        shard.refresh_from_db()
+        job.refresh_from_db()
+        self.assertEqual((shard.checkpoint_id, shard.processed), (None, 0))
+        self.assertEqual((job.status, job.processed), (AnalysisJob.STATUS_FAILED, 0))
+        self.assertIsNone(claim_shard('b'))
+
+    @override_settings(EMOTION_ANALYSIS_SHARD_SIZE=2)
+    def test_job_is_closed_if_its_last_range_finished_without_closing_it(self):
+        job = submit_analysis_job(self.user, incremental=False, sharded=True)
+        # El proceso se cae entre terminar el último rango y cerrar el trabajo
+        with mock.patch('AppIA.analysis_jobs._finish_sharded_job', return_value=False):
+            run_job(claim_job('caido'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, AnalysisJob.STATUS_RUNNING)
+        self.assertFalse(job.shards.exclude(status=AnalysisShard.STATUS_DONE).exists())
+
+        self.assertEqual(run_worker(once=True), 0)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed, job.analysis_data['total_messages']), (AnalysisJob.STATUS_DONE, 5, 5))
+
+    @override_settings(EMOTION_ANALYSIS_SHARD_SIZE=2)
+    def test_local_worker_processes_take_over_an_expired_range_and_close_the_job(self):
+        class InlineExecutor:
+            """Ejecuta los procesos de trabajos en este proceso, uno tras otro."""
+
+            def __init__(self, max_workers):
+                pass
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc_info):
+                return False
+
+            def submit(self, fn, *args, **kwargs):
+                future = Future()
+                future.set_result(fn(*args, **kwargs))
+                return future
+
+        job = submit_analysis_job(self.user, incremental=False, sharded=True)
+        plan_shards(claim_job('planificador'))
+        crashed = claim_shard('caido')
+        real_analyze = analysis.analyze_message_rows
+        calls = []
+
+        def crash_on_second_chunk(rows, **kwargs):
+            calls.append(rows)
+            if len(calls) == 2:
+                raise SystemExit("proceso terminado")
+            return real_analyze(rows, **kwargs)
+
+        with mock.patch('AppIA.analysis_jobs.analyze_message_rows', crash_on_second_chunk):
+            with self.assertRaises(SystemExit):
+                run_shard(crashed, chunk_size=1)
+        AnalysisShard.objects.filter(pk=crashed.pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+        output = StringIO()
+        with mock.patch('AppIA.management.commands.run_analysis_jobs.ProcessPoolExecutor', InlineExecutor), \
+                mock.patch('AppIA.management.commands.run_analysis_jobs.connections'), \
+                mock.patch('AppIA.parallel_analysis.init_worker'), \
+                mock.patch('AppIA.analysis_jobs.worker_name', side_effect=['proceso-1', 'proceso-2']):
+            call_command('run_analysis_jobs', once=True, processes=2, chunk_size=1, stdout=output)
+
+        self.assertIn("3 trabajos y rangos ejecutados", output.getvalue())
+        crashed.refresh_from_db()
+        self.assertEqual((crashed.status, crashed.worker, crashed.processed), (AnalysisShard.STATUS_DONE, 'proceso-1', 2))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed, job.analysis_data['total_messages']), (AnalysisJob.STATUS_DONE, 5, 5))
+        self.assertEqual(MessageAnalysis.objects.count(), 5)
+
+
+@unittest.skipUnless('fork' in multiprocessing.get_all_start_methods(), "Los procesos hijos heredan la base de pruebas con 'fork'")
+class AnalysisWorkerProcessTests(TransactionTestCase):
+    """Varios procesos reales de 'run_analysis_jobs --once' sobre el mismo trabajo repartido."""
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("La base de pruebas en memoria no se comparte entre procesos.")
+        user = User.objects.create_user(username='ana', password='secreta123')
+        conversation = Conversation.objects.create()
+        for index in range(12):
+            Message.objects.create(conversation=conversation, sender=user, content=f'mensaje número {index} del equipo')
+        self.job = submit_analysis_job(user, incremental=False, sharded=True)
+
+    @override_settings(EMOTION_ANALYSIS_SHARD_SIZE=2)
+    def test_processes_wait_for_the_planner_and_share_the_ranges(self):
+        output = StringIO()
+        fork_pool = functools.partial(ProcessPoolExecutor, mp_context=multiprocessing.get_context('fork'))
+        with mock.patch('AppIA.management.commands.run_analysis_jobs.ProcessPoolExecutor', fork_pool):
+            call_command('run_analysis_jobs', once=True, processes=3, poll_interval=0.05, chunk_size=1, stdout=output)
+
+        # El trabajo y sus 6 rangos, cada uno contado por el proceso que lo ejecutó
+        self.assertIn("7 trabajos y rangos ejecutados", output.getvalue())
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.status, self.job.processed, self.job.shard_count), (AnalysisJob.STATUS_DONE, 12, 6))
+        self.assertFalse(self.job.shards.exclude(status=AnalysisShard.STATUS_DONE).exists())
+        self.assertEqual(MessageAnalysis.objects.count(), 12)
+
+
+class AnalyzeOnWriteTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='ana', password='secreta123')
+        self.conversation = Conversation.objects.create()
+        self.analysis_queue = MessageAnalysisQueue(max_batch_size=2, background=False)
+
+    def test_messages_are_queued_after_commit_and_analyzed_in_batches(self):
+        with mock.patch('AppIA.live_analysis.get_analysis_queue', return_value=self.analysis_queue):
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                for content in ['hola', 'te voy a matar', 'la reunión fue productiva']:
+                    analyze_on_commit(Message.objects.create(
+                        conversation=self.conversation, sender=self.user, content=content
+                    ))
+            self.assertEqual(self.analysis_queue.queue_depth(), 0)
+            for callback in callbacks:
+                callback()
+
+        self.assertEqual(self.analysis_queue.drain(), 3)
+
+        stats = self.analysis_queue.stats()
+        self.assertEqual((stats['messages'], stats['batches'], stats['queue_depth']), (3, 2, 0))
+        self.assertEqual(stats['batch_size_histogram'], {1: 1, 2: 1})
+        self.assertEqual(stats['lag']['messages'], 3)
+        self.assertEqual(
+            MessageAnalysis.objects.get(message__content='te voy a matar').emotion_label, 'Acoso/Violencia'
+        )
+        self.assertEqual(
+            set(MessageAnalysis.objects.values_list('model_version', flat=True)), {current_prediction_version()}
+        )
+
+    def test_critical_threats_are_flagged_at_write_time(self):
+        def send(content):
+            return flag_critical_message(Message.objects.create(
+                conversation=self.conversation, sender=self.user, content=content
+            ))
+
+        self.assertIsNone(send('hola, ¿cómo estás?'))
+        self.assertIsNone(send('hubo una pelea ayer'))
+        violence = send('Te voy a MATAR si vuelves')
+        extortion = send('si no pagas publico tus fotos')
+
+        self.assertEqual(violence.category, FlaggedMessage.CATEGORY_VIOLENCE)
+        self.assertIn('te voy a matar', violence.matched_keywords)
+        self.assertEqual(extortion.category, FlaggedMessage.CATEGORY_EXTORTION)
+        self.assertEqual(FlaggedMessage.objects.filter(conversation=self.conversation).count(), 2)
+        self.assertFalse(MessageAnalysis.objects.exists())
+
+    def test_message_is_sent_even_if_flagging_fails(self):
+        self.conversation.participants.add(self.user)
+        self.client.force_login(self.user)
+
+        with mock.patch('AppIA.live_analysis.FlaggedMessage.objects.create', side_effect=DatabaseError("sin conexión")), \
+                mock.patch('builtins.print'):
+            response = self.client.post(
+                reverse('send_message'),
+                data={'conversation_id': self.conversation.id, 'content': 'te voy a matar'},
+                content_type='application/json'
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(Message.objects.filter(pk=response.json()['message_id']).exists())
+        self.assertFalse(FlaggedMessage.objects.exists())
+
+    @override_settings(EMOTION_ANALYZE_ON_WRITE=False)
+    def test_disabled_setting_queues_nothing(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            analyze_on_commit(Message.objects.create(conversation=self.conversation, sender=self.user, content='hola'))
+        self.assertEqual(callbacks, [])
+
+
+class BulkAnalysisWriteTests(TestCase):
+    """Las dos rutas de escritura en bloque deben insertar lo nuevo y actualizar lo existente."""
+
+    def setUp(self):
+        user = User.objects.create_user(username='ana', password='secreta123')
+        conversation = Conversation.objects.create()
+        self.messages = [
+            Message.objects.create(conversation=conversation, sender=user, content=f'mensaje {i}')
+            for i in range(3)
+        ]
+        MessageAnalysis.objects.create(
+            message=self.messages[0], emotion_label='Neutral', confidence=0.5, model_version='v0:1'
+        )
+
+    def write_and_check(self):
+        save_message_analyses([
+            MessageAnalysis(message_id=message.id, emotion_label='Positivo', confidence=0.9, model_version='v1:1')
+            for message in self.messages
+        ], batch_size=2)
+
+        self.assertEqual(MessageAnalysis.objects.count(), 3)
+        self.assertEqual(
+            set(MessageAnalysis.objects.values_list('emotion_label', 'model_version')), {('Positivo', 'v1:1')}
+        )
+
+    def test_upsert(self):
+        if not connection.features.supports_update_conflicts_with_target:
+            self.skipTest("El motor no admite ON CONFLICT")
+        self.write_and_check()
+
+    def test_select_then_bulk_update_and_insert(self):
+        with mock.patch.object(connection.features, 'supports_update_conflicts_with_target', False):
+            self.write_and_check()
+
+    def test_failed_write_is_reported_instead_of_skipped(self):
+        with mock.patch('AppIA.analysis.save_message_analyses', side_effect=DatabaseError("sin conexión")):
+            with self.assertRaises(AnalysisError):
+                analysis.analyze_queryset(Message.objects.all())
+        self.assertEqual(MessageAnalysis.objects.count(), 1)
+
+
+@unittest.skipUnless(HAS_TENSORFLOW, "TensorFlow no está instalado")
+class VocabTokenizerParityTests(SimpleTestCase):
+    """El tokenizador de ejecución debe producir las mismas secuencias que Keras."""
+
+    def test_sequences_match_pickled_keras_tokenizer(self):
+        import pickle
+        with open(ml.tokenizer_pickle_path, 'rb') as handle:
+            keras_tokenizer = pickle.load(handle)
+        vocab_tokenizer = VocabTokenizer.load(ml.vocab_path)
+
+        words = list(keras_tokenizer.word_index) + ['HOLA', 'desconocida', '¿qué?', 'a,b', '\t', '  ']
+        rng = np.random.default_rng(7)
+        texts = [' '.join(rng.choice(words, size=rng.integers(0, 130))) for _ in range(200)]
+
+        self.assertEqual(vocab_tokenizer.texts_to_sequences(texts), keras_tokenizer.texts_to_sequences(texts))
+
+    def test_encode_batch_pads_and_truncates_at_the_end(self):
+        vocab_tokenizer = VocabTokenizer.load(ml.vocab_path)
+        long_text = ' '.join(['reunión'] * (ml.MAX_SEQUENCE_LENGTH + 5))
+
+        matrix = vocab_tokenizer.encode_batch(['hola la reunión', long_text], ml.MAX_SEQUENCE_LENGTH)
+
+        self.assertEqual(matrix.dtype, np.int32)
+        self.assertEqual(matrix.shape, (2, ml.MAX_SEQUENCE_LENGTH))
+        self.assertEqual(list(matrix[0, :4]), [1, 3, 13, 0])
+        self.assertTrue((matrix[1] == 13).all())
+
+
+class LengthBucketingTests(SimpleTestCase):
+    """Agrupar por longitud no debe cambiar la salida respecto a la longitud fija."""
+
+    def test_bucketed_probabilities_match_fixed_length(self):
+        texts = [
+            '', 'hola', 'te voy a matar', 'la reunión de hoy fue muy productiva',
+            ' '.join(['reunión'] * (ml.MAX_SEQUENCE_LENGTH + 20)),
+        ] * 7 + ['hola la reunión'] * 3
+
+        fixed = ml.predict_probabilities(texts, batch_size=4, length_bucketing=False)
+        bucketed = ml.predict_probabilities(texts, batch_size=4, length_bucketing=True)
+
+        np.testing.assert_array_equal(bucketed.argmax(axis=1), fixed.argmax(axis=1))
+        np.testing.assert_allclose(bucketed, fixed, atol=1e-6)
+
+    def test_masked_model_ignores_omitted_padding(self):
+        rng = np.random.default_rng(0)
+        masked_model = NumpyEmotionModel(
+            rng.normal(size=(50, 8)), rng.normal(size=(8, 4)), rng.normal(size=4), mask_zero=True
+        )
+        sequences = rng.integers(1, 50, size=(6, 12), dtype=np.int32)
+        padded = np.zeros((6, ml.MAX_SEQUENCE_LENGTH), dtype=np.int32)
+        padded[:, :12] = sequences
+
+        np.testing.assert_allclose(
+            masked_model.predict_on_batch(sequences, padded_length=ml.MAX_SEQUENCE_LENGTH),
+            masked_model.predict_on_batch(padded),
+            atol=1e-6
+        )
+
+
+class ModelRegistryTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.registry = ModelRegistry(directory.name)
+        patcher = mock.patch.object(ml, 'MODEL_REGISTRY', self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(ml.activate_model_bundle, ml.get_model_bundle())
+
+    def test_register_and_activate_versions(self):
+        self.registry.register('v1', ml.weights_path, ml.vocab_path, activate=True)
+        self.registry.register('v2', ml.weights_path, ml.vocab_path)
+
+        self.assertEqual(self.registry.active_version(), 'v1')
+        with self.assertRaises(ModelRegistryError):
+            self.registry.register('v1', ml.weights_path, ml.vocab_path)
+        with self.assertRaises(ModelRegistryError):
+            self.registry.activate('v3')
+
+        self.registry.activate('v2')
+        self.assertEqual(self.registry.active_version(), 'v2')
+        self.assertEqual(ml.load_model_bundle().version, 'v2')
+
+    def test_reload_swaps_without_affecting_in_flight_batches(self):
+        self.registry.register('v1', ml.weights_path, ml.vocab_path, activate=True)
+        old_bundle = ml.get_model_bundle()
+
+        ml.reload_model(background=False)
+
+        self.assertEqual(ml.MODEL_VERSION, 'v1')
+        self.assertIsNot(ml.get_model_bundle(), old_bundle)
+        # Una predicción que empezó con el bundle anterior lo sigue usando
+        in_flight = ml.predict_emotion_batch(['la reunión de hoy fue muy productiva'], bundle=old_bundle)
+        current = ml.predict_emotion_batch(['la reunión de hoy fue muy productiva'])
+        self.assertEqual(in_flight[0]['etiqueta'], current[0]['etiqueta'])
+        self.assertEqual(current_prediction_version(), f"v1:{ml.RULES_VERSION}")
+
+    def test_manifest_change_triggers_background_reload(self):
+        self.registry.register('v1', ml.weights_path, ml.vocab_path, activate=True)
+
+        with mock.patch.object(ml, '_last_reload_check', 0.0), \
+                mock.patch.object(ml, '_checked_manifest_mtime', None), \
+                mock.patch.object(ml, 'reload_model') as reload_model:
+            ml.check_model_version()
+
+        reload_model.assert_called_once_with('v1')
+
+
+class ReducedPrecisionTests(SimpleTestCase):
+
+    def test_int8_rows_are_reconstructed_within_half_a_step(self):
+        rng = np.random.default_rng(1)
+        matrix = rng.normal(size=(20, 16)).astype(np.float32)
+        matrix[3] = 0
+
+        quantized, scales = quantize_rows(matrix)
+
+        self.assertEqual(quantized.dtype, np.int8)
+        self.assertEqual(scales.shape, (20,))
+        error = np.abs(quantized * scales[:, np.newaxis] - matrix)
+        self.assertTrue((error <= scales[:, np.newaxis] / 2 + 1e-7).all())
+
+    def test_reduced_precision_models_keep_labels_and_round_trip(self):
+        reference = NumpyEmotionModel.load(ml.weights_path)
+        rng = np.random.default_rng(2)
+        sequences = rng.integers(0, len(reference.embeddings), size=(64, 12), dtype=np.int32)
+        expected = reference.predict_on_batch(sequences, padded_length=ml.MAX_SEQUENCE_LENGTH)
+
+        with tempfile.TemporaryDirectory() as directory:
+            for precision in ('float16', 'int8'):
+                path = f"{directory}/{precision}.npz"
+                reference.with_precision(precision).save(path)
+                model = NumpyEmotionModel.load(path)
+
+                self.assertEqual(model.precision, precision)
+                self.assertLess(model.nbytes, reference.nbytes)
+                actual = model.predict_on_batch(sequences, padded_length=ml.MAX_SEQUENCE_LENGTH)
+                np.testing.assert_allclose(actual, expected, atol=1e-3)
+
+
+class MmapArtifactTests(SimpleTestCase):
+    """Los artefactos en formato plano se abren con mmap y dan la misma salida."""
+
+    def test_flat_artifacts_are_memory_mapped_and_match(self):
+        model = NumpyEmotionModel.load(ml.weights_path)
+        tokenizer = VocabTokenizer.load(ml.vocab_path)
+        texts = ['', 'hola la reunión', '¿qué? Ñandú desconocida', '<unk> te voy a matar'] * 5
+
+        with tempfile.TemporaryDirectory() as directory:
+            for precision in ('float32', 'int8'):
+                model.with_precision(precision).save_flat(f"{directory}/{precision}")
+            tokenizer.save_flat(f"{directory}/vocab")
+
+            flat_tokenizer = VocabTokenizer.load(f"{directory}/vocab")
+            # mmap de solo lectura, no una copia privada del proceso
+            self.assertFalse(flat_tokenizer._words.flags.writeable)
+            self.assertEqual(flat_tokenizer.oov_index, tokenizer.oov_index)
+            self.assertEqual(flat_tokenizer.texts_to_sequences(texts), tokenizer.texts_to_sequences(texts))
+
+            sequences = tokenizer.encode_batch(texts, ml.MAX_SEQUENCE_LENGTH)
+            for precision in ('float32', 'int8'):
+                flat_model = NumpyEmotionModel.load(f"{directory}/{precision}")
+                self.assertFalse(flat_model.embeddings.flags.writeable)
+                self.assertEqual(flat_model.precision, precision)
+                np.testing.assert_allclose(
+                    flat_model.predict_on_batch(sequences),
+                    model.with_precision(precision).predict_on_batch(sequences),
+                    atol=1e-6
+                )
+            del flat_tokenizer, flat_model
+
+    def test_version_does_not_depend_on_the_artifact_format(self):
+        model = NumpyEmotionModel.load(ml.weights_path)
+        tokenizer = VocabTokenizer.load(ml.vocab_path)
+        with tempfile.TemporaryDirectory() as directory:
+            model.save_flat(f"{directory}/pesos")
+            tokenizer.save_flat(f"{directory}/vocab")
+            flat_model = NumpyEmotionModel.load(f"{directory}/pesos")
+            flat_tokenizer = VocabTokenizer.load(f"{directory}/vocab")
+
+            self.assertEqual(ml.content_version(flat_model, flat_tokenizer), ml.content_version(model, tokenizer))
+            self.assertNotEqual(ml.content_version(model.with_precision('int8'), tokenizer),
+                                ml.content_version(model, tokenizer))
+            del flat_model, flat_tokenizer
+
+    def test_flat_copy_older_than_its_source_is_not_used(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, 'tokenizer_vocab.json')
+            flat = os.path.join(directory, 'tokenizer_vocab_npy')
+            VocabTokenizer.load(ml.vocab_path).save_flat(flat)
+            with open(source, 'w', encoding='utf-8') as handle:
+                handle.write('{}')
+
+            flat_config = os.path.join(flat, 'config.json')
+            os.utime(source, (1000, 1000))
+            os.utime(flat_config, (2000, 2000))
+            self.assertTrue(ml._use_flat_artifact(flat, source))
+
+            # Se volvió a exportar el .json sin regenerar la copia plana
+            os.utime(source, (3000, 3000))
+            with mock.patch('builtins.print') as warning:
+                self.assertFalse(ml._use_flat_artifact(flat, source))
+                self.assertFalse(ml._use_flat_artifact(flat, source))
+            warning.assert_called_once()
+            with override_settings(EMOTION_MMAP_ARTIFACTS=False):
+                os.utime(source, (1000, 1000))
+                self.assertFalse(ml._use_flat_artifact(flat, source))
+
+
+class ModelPreloadTests(SimpleTestCase):
+    """Solo el servidor web y los procesos de análisis cargan el modelo al arrancar."""
+
+    @override_settings(EMOTION_PRELOAD_MODEL=None)
+    def test_preload_depends_on_the_process(self):
+        with mock.patch.dict('os.environ', {}, clear=True):
+            self.assertTrue(should_preload_model(['/venv/bin/gunicorn', 'AplicacionSentimientos.wsgi']))
+            self.assertTrue(should_preload_model(['/venv/lib/gunicorn/__main__.py', 'AplicacionSentimientos.wsgi']))
+            self.assertTrue(should_preload_model(['uwsgi', '--ini', 'uwsgi.ini']))
+            self.assertTrue(should_preload_model(['manage.py', 'runserver', '--noreload']))
+            self.assertTrue(should_preload_model(['manage.py', 'run_analysis_jobs']))
+            self.assertFalse(should_preload_model(['manage.py', 'runserver']))
+            self.assertFalse(should_preload_model(['manage.py', 'migrate']))
+            self.assertFalse(should_preload_model(['manage.py', 'test', 'AppIA']))
+            # Otros programas que importan Django no cargan el modelo al arrancar
+            self.assertFalse(should_preload_model(['/venv/bin/celery', '-A', 'AplicacionSentimientos', 'worker']))
+            self.assertFalse(should_preload_model(['/venv/bin/pytest']))
+            self.assertFalse(should_preload_model(['exportar_datos.py']))
+            self.assertFalse(should_preload_model([]))
+        with mock.patch.dict('os.environ', {'RUN_MAIN': 'true'}):
+            self.assertTrue(should_preload_model(['manage.py', 'runserver']))
+        with mock.patch.dict('os.environ', {'EMOTION_PRELOAD_MODEL': '1'}):
+            self.assertTrue(should_preload_model(['/venv/bin/celery', '-A', 'AplicacionSentimientos', 'worker']))
+        with mock.patch.dict('os.environ', {'EMOTION_PRELOAD_MODEL': 'false'}):
+            self.assertFalse(should_preload_model(['/venv/bin/gunicorn', 'AplicacionSentimientos.wsgi']))
+
+    @override_settings(EMOTION_PRELOAD_MODEL=False)
+    def test_setting_overrides_detection(self):
+        self.assertFalse(should_preload_model(['gunicorn', 'AplicacionSentimientos.wsgi']))
+
+    def test_model_is_loaded_lazily_on_first_use(self):
+        self.addCleanup(ml.activate_model_bundle, ml.get_model_bundle())
+        with mock.patch.object(ml, '_bundle', None), mock.patch.object(ml, '_load_attempted', False), \
+                mock.patch.object(ml, 'load_model_bundle', wraps=ml.load_model_bundle) as load_model_bundle:
+            ml.predict_emotion_batch(['la reunión de hoy fue muy productiva'])
+            ml.predict_emotion_batch(['hola equipo'])
+
+        load_model_bundle.assert_called_once_with()
+
+
+class BenchmarkSuiteTests(SimpleTestCase):
+
+    def test_generated_messages_respect_length_profiles(self):
+        for min_words, max_words in LENGTH_PROFILES.values():
+            messages = generate_spanish_messages(200, min_words, max_words, seed=3)
+            lengths = [len(message.split()) for message in messages]
+            self.assertGreaterEqual(min(lengths), min_words)
+            # Una palabra clave larga puede alargar un mensaje corto
+            self.assertLessEqual(max(lengths), max(max_words, 4))
+
+    def test_suite_reports_percentiles_and_stages(self):
+        report = run_benchmark_suite(messages=40, batch_sizes=(8,), lengths=('corto',), repeats=1)
+
+        self.assertEqual(report['metadata']['model_version'], ml.MODEL_VERSION)
+        self.assertEqual([(run['mode'], run['batch_size']) for run in report['results']], [('single', 1), ('batch', 8)])
+        for run in report['results']:
+            self.assertEqual(set(run['latency']), {'p50_ms', 'p95_ms', 'p99_ms', 'mean_ms'})
+            self.assertEqual(set(run['stages_us_per_message']), {'tokenize', 'forward', 'rules'})
+            self.assertGreater(run['messages_per_second'], 0)
+            # Mensajes distintos, sin caché ni ruta rápida: todos pasan por el modelo
+            self.assertEqual(run['routes'], {'modelo': run['messages']})
+        self.assertFalse(report['metadata']['fast_path'])
+
+
+class InferenceMetricsTests(SimpleTestCase):
+
+    def setUp(self):
+        self.addCleanup(setattr, ml, 'INFERENCE_METRICS', ml.INFERENCE_METRICS)
+        ml.PREDICTION_CACHE.clear()
+
+    def test_disabled_metrics_record_nothing(self):
+        ml.enable_metrics(False)
+        ml.predict_emotion_batch(['hola', 'la reunión de hoy fue muy productiva'])
+        self.assertIsNone(ml.get_inference_metrics())
+
+    def test_stages_and_deciding_rules_are_recorded(self):
+        ml.enable_metrics()
+        texts = ['hola', 'te voy a matar', 'la reunión de hoy fue muy productiva y el equipo trabajó bien', 'hola']
+
+        ml.predict_emotion_batch(texts)
+        metrics = ml.get_inference_metrics()
+
+        self.assertEqual(metrics['stages']['predict_emotion_batch']['messages'], 4)
+        self.assertEqual(metrics['stages']['rules']['messages'], 3)
+        self.assertEqual(metrics['stages']['forward']['messages'], 1)
+        self.assertEqual(sum(metrics['stages']['tokenize']['histogram'].values()), 1)
+        # Regla y ruta por mensaje de entrada, aunque 'hola' se clasifique una sola vez
+        self.assertEqual(metrics['rules']['mensaje_corto'], 2)
+        self.assertEqual(metrics['rules']['prioridad_1'], 1)
+        self.assertEqual(sum(metrics['rules'].values()), 4)
+        self.assertEqual(sum(metrics['routes'].values()), 4)
+
+    def test_cache_hits_keep_the_rule_that_decided(self):
+        ml.enable_metrics()
+        first = ml.predict_emotion_batch(['te voy a matar', 'hola'])
+        second = ml.predict_emotion_batch(['te voy a matar', 'hola'])
+        metrics = ml.get_inference_metrics()
+
+        self.assertEqual([result['regla'] for result in second], [result['regla'] for result in first])
+        self.assertEqual([result['ruta'] for result in second], ['cache', 'cache'])
+        self.assertEqual((metrics['rules']['prioridad_1'], metrics['rules']['mensaje_corto']), (2, 2))
+        self.assertEqual(metrics['routes']['cache'], 2)
@@ -22,8 +22,13 @@ from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 from io import BytesIO
 
 # --- Imports de la Aplicación ---
-from .models import Conversation, Message, MessageAnalysis, ConversationAnalysisReport
-from .ml import predict_emotion
+from .models import AnalysisJob, Conversation, FlaggedMessage, Message, MessageAnalysis, ConversationAnalysisReport
+from . import ml
+from .analysis import (
+    AnalysisError, add_percentages, analyze_corpus, create_conversation_report, report_analysis_data
+)
+from .analysis_jobs import job_progress, submit_analysis_job
+from .live_analysis import analyze_on_commit, flag_critical_message, get_analysis_queue
 from .analytics_utils import (
     generate_distribution_chart,
     generate_bar_chart,
@@ -46,12 +51,16 @@ def anSentimientos(request):
     """Dashboard de análisis de sentimientos en management"""
     conversations = Conversation.objects.all()
     recent_reports = ConversationAnalysisReport.objects.order_by('-created_at')[:5]
+    # Amenazas críticas señaladas al enviar (no requieren análisis previo)
+    flagged_messages = FlaggedMessage.objects.select_related('message__sender').order_by('-flagged_at')[:10]
     
     context = {
         'conversations': conversations,
         'total_conversations': conversations.count(),
         'total_messages': Message.objects.count(),
         'recent_reports': recent_reports,
+        'flagged_messages': flagged_messages,
+        'pending_flags': FlaggedMessage.objects.filter(reviewed=False).count(),
     }
     return render(request, 'management/ansentimientos.html', context)
 
@@ -699,6 +708,23 @@ def get_user_data(request, user_id):
         return JsonResponse({'error': str(e)}, status=400)
 
 
+@login_required
+@user_passes_test(is_admin)
+def inference_metrics(request):
+    """API con las métricas por etapa de la inferencia de este proceso (JSON)"""
+    metrics = ml.get_inference_metrics()
+    if metrics is None:
+        return JsonResponse(
+            {'error': 'Las métricas están desactivadas (EMOTION_METRICS_ENABLED).'}, status=404
+        )
+    metrics['model_version'] = ml.MODEL_VERSION
+    metrics['cache'] = ml.get_prediction_cache_stats()
+    metrics['fast_path'] = ml.get_fast_path_stats()
+    metrics['analisis_al_escribir'] = get_analysis_queue().stats()
+    metrics['despachador'] = ml.get_inference_dispatcher().stats()
+    return JsonResponse(metrics)
+
+
 # --- Vistas del Chat ---
 
 @login_required
@@ -784,6 +810,10 @@ def send_message(request):
                 sender=request.user,
                 content=content
             )
+            # Amenazas críticas: se señalan ya; la clasificación completa sigue en segundo plano
+            flag_critical_message(message)
+            # Clasificar en segundo plano una vez confirmado (no retrasa la respuesta)
+            analyze_on_commit(message)
             
             conversation.save()
             
@@ -865,52 +895,36 @@ def generate_conversation_analysis(request, conversation_id):
     conversation = get_object_or_404(Conversation, id=conversation_id)
     
     if request.method == 'POST':
-        messages_to_analyze = conversation.messages.all()
-        analysis_data = {
-            'total_messages': 0, 'neutral_count': 0, 'positive_count': 0,
-            'harassment_count': 0, 'extortion_count': 0
-        }
-        
-        for message in messages_to_analyze:
-            try:
-                result = predict_emotion(message.content)
-                
-                message_analysis, created = MessageAnalysis.objects.update_or_create(
-                    message=message,
-                    defaults={
-                        'emotion_label': result['etiqueta'],
-                        'confidence': result['confianza']
-                    }
-                )
-                
-                # Contar por categorías
-                analysis_data['total_messages'] += 1
-                if result['etiqueta'] == 'Neutral':
-                    analysis_data['neutral_count'] += 1
-                elif result['etiqueta'] == 'Positivo':
-                    analysis_data['positive_count'] += 1
-                elif result['etiqueta'] == 'Acoso/Violencia':
-                    analysis_data['harassment_count'] += 1
-                elif result['etiqueta'] == 'Extorsión':
-                    analysis_data['extortion_count'] += 1
-                    
-            except Exception as e:
-                print(f"Error analizando mensaje {message.id}: {e}")
-        
-        total = analysis_data['total_messages']
-        if total > 0:
-            analysis_data['neutral_percentage'] = (analysis_data['neutral_count'] / total) * 100
-            analysis_data['positive_percentage'] = (analysis_data['positive_count'] / total) * 100
-            analysis_data['harassment_percentage'] = (analysis_data['harassment_count'] / total) * 100
-            analysis_data['extortion_percentage'] = (analysis_data['extortion_count'] / total) * 100
-        
-        report = ConversationAnalysisReport.objects.create(
-            conversation=conversation,
-            created_by=request.user,
-            **analysis_data
-        )
+        # Clasificar y guardar en bloque por partes; los textos ya clasificados se toman del almacén.
+        # Por defecto se parte del último reporte y solo se analizan los mensajes posteriores;
+        # con 'reconstruir' se vuelve a analizar toda la conversación y con 'solo_reporte' se
+        # cuentan los análisis ya guardados sin ejecutar el modelo
+        report_only = request.POST.get('solo_reporte') == '1'
+        try:
+            report, routes, previous = create_conversation_report(
+                conversation, request.user,
+                rebuild=request.POST.get('reconstruir') == '1', report_only=report_only
+            )
+        except AnalysisError as e:
+            messages.error(request, str(e))
+            return redirect('anSentimientos')
         
-        messages.success(request, f'Análisis completado. Se analizaron {total} mensajes.')
+        if report_only:
+            messages.success(
+                request, f'Reporte generado con los {report.total_messages} mensajes ya analizados.'
+            )
+        else:
+            # Mensajes resueltos sin pasar por la red neuronal (ruta rápida o caché)
+            cached_count = routes['cache'] + routes['almacen']
+            analyzed_count = sum(routes.values()) - routes['omitido']
+            messages.success(
+                request,
+                f'Análisis completado. Se analizaron {analyzed_count} mensajes '
+                f'({routes["reglas"]} resueltos solo con reglas, {cached_count} ya clasificados previamente); '
+                f'{routes["omitido"]} ya estaban analizados con la versión actual y se omitieron.'
+                + (f' Los {previous.total_messages} mensajes del reporte anterior se tomaron de sus conteos.'
+                   if previous is not None else '')
+            )
         return redirect('conversation_analysis_report', report_id=report.id)
     
     context = {
@@ -1131,47 +1145,42 @@ def export_conversation_pdf(request, report_id):
 @user_passes_test(is_admin)
 def generate_general_analysis(request):
     if request.method == 'POST':
-        all_messages = Message.objects.all()
-        analysis_data = {
-            'total_messages': 0, 'neutral_count': 0, 'positive_count': 0,
-            'harassment_count': 0, 'extortion_count': 0
-        }
-        
-        processed_count = 0
-        for message in all_messages:
-            try:
-                result = predict_emotion(message.content)
-                MessageAnalysis.objects.update_or_create(
-                    message=message,
-                    defaults={
-                        'emotion_label': result['etiqueta'],
-                        'confidence': result['confianza']
-                    }
-                )
-                
-                # Contar categorías
-                analysis_data['total_messages'] += 1
-                if result['etiqueta'] == 'Neutral':
-                    analysis_data['neutral_count'] += 1
-                elif result['etiqueta'] == 'Positivo':
-                    analysis_data['positive_count'] += 1
-                elif result['etiqueta'] == 'Acoso/Violencia':
-                    analysis_data['harassment_count'] += 1
-                elif result['etiqueta'] == 'Extorsión':
-                    analysis_data['extortion_count'] += 1
-                
-                processed_count += 1
-            except Exception as e:
-                print(f"Error analizando mensaje {message.id}: {e}")
+        # Reporte con los análisis ya guardados, con un GROUP BY y sin ejecutar el modelo
+        if request.POST.get('solo_reporte') == '1':
+            analysis_data = report_analysis_data()
+            return render(request, 'management/general_report.html', {
+                'analysis_data': analysis_data,
+                'processed_count': analysis_data['total_messages']
+            })
+
+        # Por defecto solo se analizan los mensajes nuevos o de otra versión del modelo
+        incremental = request.POST.get('reconstruir') != '1'
+
+        # Con EMOTION_ANALYSIS_BACKGROUND se encola y lo ejecuta 'manage.py run_analysis_jobs'
+        if ml._get_setting('EMOTION_ANALYSIS_BACKGROUND', False):
+            job = submit_analysis_job(request.user, incremental=incremental)
+            messages.info(request, f'Análisis general encolado (trabajo {job.id}).')
+            return redirect('analysis_job_detail', job_id=job.id)
+
+        # Con EMOTION_ANALYSIS_WORKERS > 1 el corpus se reparte entre varios procesos
+        try:
+            _, routes = analyze_corpus(incremental=incremental)
+        except AnalysisError as e:
+            messages.error(request, str(e))
+            return redirect('anSentimientos')
         
-        total = analysis_data['total_messages']
-        if total > 0:
-            analysis_data['neutral_percentage'] = (analysis_data['neutral_count'] / total) * 100
-            analysis_data['positive_percentage'] = (analysis_data['positive_count'] / total) * 100
-            analysis_data['harassment_percentage'] = (analysis_data['harassment_count'] / total) * 100
-            analysis_data['extortion_percentage'] = (analysis_data['extortion_count'] / total) * 100
+        # Estadísticas con un GROUP BY sobre los análisis guardados
+        analysis_data = report_analysis_data()
+        processed_count = analysis_data['total_messages']
         
-        messages.success(request, f'Análisis general completado. Se procesaron {processed_count} mensajes.')
+        # Mensajes resueltos sin pasar por la red neuronal (ruta rápida o caché)
+        cached_count = routes['cache'] + routes['almacen']
+        messages.success(
+            request,
+            f'Análisis general completado. Se procesaron {sum(routes.values()) - routes["omitido"]} mensajes '
+            f'({routes["reglas"]} resueltos solo con reglas, {cached_count} ya clasificados previamente); '
+            f'{routes["omitido"]} ya estaban analizados con la versión actual y se omitieron.'
+        )
         
         return render(request, 'management/general_report.html', {
             'analysis_data': analysis_data,
@@ -1182,4 +1191,28 @@ def generate_general_analysis(request):
         'total_messages': Message.objects.count(),
         'total_conversations': Conversation.objects.count(),
     }
-    return render(request, 'management/generate_general_analysis.html', context)
\ No newline at end of file
+    return render(request, 'management/generate_general_analysis.html', context)
+
+
+@user_passes_test(is_admin)
+def analysis_job_detail(request, job_id):
+    """Avance de un análisis general en segundo plano y, al terminar, su reporte"""
+    job = get_object_or_404(AnalysisJob, id=job_id)
+
+    if job.status == AnalysisJob.STATUS_DONE:
+        analysis_data = add_percentages(dict(job.analysis_data))
+        return render(request, 'management/general_report.html', {
+            'analysis_data': analysis_data,
+            'processed_count': analysis_data['total_messages']
+        })
+
+    return render(request, 'management/analysis_job.html', {
+        'job': job,
+        'progress': job_progress(job),
+    })
+
+@user_passes_test(is_admin)
+def analysis_job_progress(request, job_id):
+    """API con el avance de un trabajo de análisis: procesados/total, ritmo y tiempo restante (JSON)"""
+    job = get_object_or_404(AnalysisJob, id=job_id)
+    return JsonResponse(job_progress(job))